@@ -1,7 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.utils.start_scheduler import start_scheduler
+from app.utils.start_scheduler import start_scheduler, stop_scheduler
+from app.utils.indexes import ensure_indexes
+from app.services.usage_events import ensure_usage_events_collection
+from app.services.password_hashing import password_hasher
 from app.routes import admin, admin_stats, auth, billing, chat, document, assistant, organization, organization_quota, quran, seed, usage, questionnaire
 from app.utils.logger import logger  # ✅ import logger
 
@@ -36,6 +39,13 @@ logger.info("✅ GEMAI RAG API started")
 @app.on_event("startup")
 async def startup_event():
     start_scheduler()
+    await ensure_usage_events_collection()
+    await ensure_indexes()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stop_scheduler()
+    password_hasher.shutdown()
     
 @app.get("/")
 async def root():
@@ -3,8 +3,13 @@ from datetime import datetime, timedelta
 import os
 import uuid
 from app.services.admin import OpenAIAdminService
-from app.tasks.quota_reset import reset_quotas
+from app.services.local_index import LOCAL_INDEX_PENDING, RETRIEVAL_BACKEND_LOCAL
+from app.services.retrieval_cache import retrieval_cache
+from app.utils.context import invalidate_org_context
+from app.tasks.local_index_backfill import backfill_local_index
+from app.tasks.quota_compaction import reset_current_period
 from app.utils.logger import logger  # ✅ import logger
+from app.utils.quota_periods import quota_used
 from app.utils.sendEmail import send_invite_email
 from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Body, Request
 from openai import OpenAI
@@ -28,6 +33,12 @@ openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+def _quota_info(org_doc: dict) -> QuotaInfo:
+    """An org's ``usage_quota`` as returned to admins, with ``used`` counted for the current period."""
+    usage_quota = org_doc.get("usage_quota") or {}
+    return QuotaInfo(**{**usage_quota, "used": quota_used(usage_quota)})
+
+
 @router.post("/create")
 async def create_assistant_with_files(
     name: str = Form(...),
@@ -160,6 +171,7 @@ async def upload_and_chunk_file(
 async def remove_vector_store(id: str, current_user_id: str = Depends(verify_token)):
     await require_role(current_user_id, ['admin'])
     deleted = await OpenAIAdminService.delete_vector_store(id)
+    await retrieval_cache.bump(id)
     return {"status": "deleted", "id": id, "response": deleted}
 
 @router.get("/{assistant_id}/files")
@@ -189,6 +201,7 @@ async def upload_assistant_files(
         # If this fails, the outer except Exception as e will catch it.
         file_ids = await OpenAIAdminService.chunk_and_append_to_vector_store(files, vector_store_id)
         logger.info(f"Admin user {user['_id']}: Successfully added files to vector store {vector_store_id} for assistant {assistant_id}. OpenAI file IDs: {file_ids}")
+        await retrieval_cache.bump_when_indexed(vector_store_id, file_ids)
 
         # Prepare metadata for DB update.
         # Note: Reading file size here assumes files can be read again.
@@ -267,7 +280,7 @@ async def delete_file(assistant_id: str, file_id: str, current_user_id: str = De
 @router.post("/admin/reset-quotas")
 async def manual_quota_reset(current_user_id: str = Depends(verify_token)):
     await require_role(current_user_id, ['admin'])
-    await reset_quotas()
+    await reset_current_period()
     return {"message": "Reset complete"}
 
 @router.get("/users/no-org")
@@ -360,7 +373,7 @@ async def admin_create_organization(
                 detail=f"User with email {org_data.head_user_email} already exists. Organization creation aborted."
             )
 
-        hashed_pwd = hash_password(org_data.head_user_password)
+        hashed_pwd = await hash_password(org_data.head_user_password)
         default_user_quota = {
             "monthly_limit": settings.FREE_TOKENS, # Assuming FREE_TOKENS is appropriate default
             "used": 0,
@@ -399,7 +412,7 @@ async def admin_create_organization(
         "id": str(created_org_doc["_id"]),
         "name": created_org_doc["name"],
         "head_user_id": str(created_org_doc.get("head_user_id")) if created_org_doc.get("head_user_id") else None,
-        "usage_quota": QuotaInfo(**created_org_doc.get("usage_quota", {})),
+        "usage_quota": _quota_info(created_org_doc),
         "agents": created_org_doc.get("agents", []),
         "created_at": created_org_doc["created_at"],
         "is_active": created_org_doc.get("is_active", True), # Default to True if not set
@@ -419,7 +432,7 @@ async def admin_list_organizations(current_user_id: str = Depends(verify_token))
             id=str(org_doc["_id"]),
             name=org_doc["name"],
             head_user_id=str(org_doc.get("head_user_id")) if org_doc.get("head_user_id") else None, # Corrected line
-            usage_quota=QuotaInfo(**org_doc.get("usage_quota", {})),
+            usage_quota=_quota_info(org_doc),
             agents=org_doc.get("agents", []),
             created_at=org_doc.get("created_at", datetime.utcnow()), # Fallback if created_at is missing
             member_count=member_count,
@@ -444,7 +457,7 @@ async def admin_get_organization(org_id: str, current_user_id: str = Depends(ver
         id=str(organization["_id"]),
         name=organization["name"],
         head_user_id=str(organization.get("head_user_id")) if organization.get("head_user_id") else None,
-        usage_quota=QuotaInfo(**organization.get("usage_quota", {})),
+        usage_quota=_quota_info(organization),
         agents=organization.get("agents", []),
         created_at=organization.get("created_at", datetime.utcnow()), # Fallback
         is_active=organization.get("is_active", True), # Default to True if not set
@@ -466,22 +479,37 @@ async def admin_update_organization(
     existing_org = await app_db.organizations.find_one({"_id": obj_id})
     if not existing_org:
         raise HTTPException(status_code=404, detail="Organization not found")
-    used_quota = existing_org["usage_quota"]["used"]
     update_data = org_update_data.model_dump(exclude_unset=True)
-    if "name" in update_data:
-        await app_db.organizations.update_one(
-            {"_id": obj_id},
-            {"$set": update_data}
-        )
-    else:    
-        update_data["usage_quota"]["used"] = used_quota
-        await app_db.organizations.update_one(
-            {"_id": obj_id},
-            {"$set": update_data}
-        )
-    
+    # Only the limit comes from the request; the period counters and allocations stay as they are
+    quota_update = update_data.pop("usage_quota", None) or {}
+    if "total_limit" in quota_update:
+        update_data["usage_quota.total_limit"] = quota_update["total_limit"]
     if not update_data:
         raise HTTPException(status_code=400, detail="No update data provided")
+    switch_to_local = (
+        update_data.get("retrieval_backend") == RETRIEVAL_BACKEND_LOCAL
+        and existing_org.get("retrieval_backend") != RETRIEVAL_BACKEND_LOCAL
+    )
+    if switch_to_local:
+        # Retrieval only moves once the org's existing documents are in its local index
+        failed = await backfill_local_index(org_id)
+        if failed:
+            # Meanwhile new uploads are indexed locally too, so re-uploads close the gap
+            await app_db.organizations.update_one({"_id": obj_id}, {"$set": {LOCAL_INDEX_PENDING: True}})
+            raise HTTPException(
+                status_code=409,
+                detail=(
+                    f"{len(failed)} existing document(s) could not be added to the local index "
+                    f"({', '.join(failed[:10])}). Delete and upload them again, then retry the switch."
+                ),
+            )
+        update_data[LOCAL_INDEX_PENDING] = False
+    await app_db.organizations.update_one(
+        {"_id": obj_id},
+        {"$set": update_data}
+    )
+    invalidate_org_context(obj_id)
+
 
     updated_org = await app_db.organizations.find_one({"_id": obj_id})
 
@@ -489,7 +517,7 @@ async def admin_update_organization(
         id=str(updated_org["_id"]),
         name=updated_org["name"],
         head_user_id=str(updated_org.get("head_user_id")) if updated_org.get("head_user_id") else None,
-        usage_quota=QuotaInfo(**updated_org.get("usage_quota", {})),
+        usage_quota=_quota_info(updated_org),
         agents=updated_org.get("agents", []),
         created_at=updated_org.get("created_at", datetime.utcnow()),
         is_active=updated_org.get("is_active", True), 
@@ -505,6 +533,7 @@ async def admin_delete_organization(org_id: str, current_user_id: str = Depends(
         raise HTTPException(status_code=400, detail="Invalid organization ID format")
 
     result = await app_db.organizations.delete_one({"_id": obj_id})
+    invalidate_org_context(obj_id)
 
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Organization not found or already deleted")
@@ -528,19 +557,19 @@ async def admin_update_organization_quota(
     if not organization:
         raise HTTPException(status_code=404, detail="Organization not found")
 
-    # Get current quota, or initialize with defaults if not present
-    current_quota = QuotaInfo(**organization.get("usage_quota", {}))
+    # Only the fields being changed are set, so the period counters and allocations survive
+    quota_updates = {}
 
     updated_fields_count = 0
     if quota_data.total_limit is not None:
         # Schema already validates ge=0, but an explicit check here can be an additional safeguard if desired.
         # if quota_data.total_limit < 0:
         #      raise HTTPException(status_code=400, detail="Total limit cannot be negative.")
-        current_quota.total_limit = quota_data.total_limit
+        quota_updates["usage_quota.total_limit"] = quota_data.total_limit
         updated_fields_count += 1
 
     # Add other fields here if AdminOrganizationQuotaUpdate is extended in the future
-    # e.g., if quota_data.used is not None: current_quota.used = quota_data.used; updated_fields_count +=1
+    # e.g., if quota_data.used is not None: quota_updates["usage_quota.used"] = quota_data.used; updated_fields_count +=1
 
     if updated_fields_count == 0:
         # This condition implies the request body was empty or only contained fields not defined in AdminOrganizationQuotaUpdate.
@@ -559,8 +588,9 @@ async def admin_update_organization_quota(
 
     await app_db.organizations.update_one(
         {"_id": obj_id},
-        {"$set": {"usage_quota": current_quota.model_dump()}}
+        {"$set": quota_updates}
     )
+    invalidate_org_context(obj_id)
 
     updated_org_doc = await app_db.organizations.find_one({"_id": obj_id})
 
@@ -569,9 +599,10 @@ async def admin_update_organization_quota(
         id=str(updated_org_doc["_id"]),
         name=updated_org_doc["name"],
         head_user_id=str(updated_org_doc.get("head_user_id")) if updated_org_doc.get("head_user_id") else None,
-        usage_quota=QuotaInfo(**updated_org_doc.get("usage_quota", {})),
+        usage_quota=_quota_info(updated_org_doc),
         agents=updated_org_doc.get("agents", []),
-        created_at=updated_org_doc.get("created_at", datetime.utcnow()) # Fallback for created_at
+        created_at=updated_org_doc.get("created_at", datetime.utcnow()), # Fallback for created_at
+        is_active=updated_org_doc.get("is_active", True),
     )
 
 @router.patch("/organizations/{org_id}/status", response_model=AdminOrganizationResponse)
@@ -595,6 +626,7 @@ async def admin_update_organization_status(
         {"_id": obj_id},
         {"$set": {"is_active": status_update.is_active}}
     )
+    invalidate_org_context(obj_id)
 
     updated_org = await app_db.organizations.find_one({"_id": obj_id})
     if not updated_org:
@@ -616,7 +648,7 @@ async def admin_update_organization_status(
         id=str(updated_org["_id"]),
         name=updated_org["name"],
         head_user_id=head_user_id_str,
-        usage_quota=QuotaInfo(**updated_org.get("usage_quota", {})),
+        usage_quota=_quota_info(updated_org),
         agents=updated_org.get("agents", []),
         created_at=created_at_dt,
         is_active=updated_org["is_active"], # This field was added in the previous subtask
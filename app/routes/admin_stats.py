@@ -1,100 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from bson import ObjectId
-from datetime import datetime
 from app.db import db
 from app.utils.auth import verify_token, require_role
 from app.utils.logger import logger
+from app.services.retrieval_cache import retrieval_cache
+from app.services.usage_events import ALL_KEY, SCOPE_ALL, SCOPE_ORG, SCOPE_USER, get_daily_series
+from app.services.dashboard_snapshot import get_dashboard_section
 
 router = APIRouter(prefix="/admin/stats", tags=["Admin Stats"])
 
+
+async def _snapshot_response(request: Request, section: str):
+    """Serve a dashboard snapshot section with an ETag; 304 when the client copy is current."""
+    data, etag = await get_dashboard_section(section)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(data, headers=headers)
+
+
 @router.get("/summary")
-async def get_admin_summary(user_id: str = Depends(verify_token)):
+async def get_admin_summary(request: Request, user_id: str = Depends(verify_token)):
     logger.debug("Fetching admin summary for user_id: %s", user_id)
     await require_role(user_id, ['admin'])
     # user = await db["users"].find_one({"_id": ObjectId(user_id)}) # No longer needed
     # if user["role"] != "admin": # No longer needed
     #     raise HTTPException(status_code=403)
 
-    users = await db["users"].find().to_list(length=1000)
-    usage_docs = await db["usage"].find().to_list(length=1000)
-    orgs = await db["organizations"].find().to_list(length=100)
-
-    breakdown = {}
-    for u in users:
-        breakdown[u["role"]] = breakdown.get(u["role"], 0) + 1
-
-    total_tokens = sum(u.get("token_usage_monthly", 0) for u in usage_docs)
-    pending_requests = await db["quota_requests"].count_documents({"status": "pending"})
-
-    return {
-        "users_total": len(users),
-        "users_breakdown": breakdown,
-        "orgs_total": len(orgs),
-        "tokens_used": total_tokens,
-        "quota_requests_pending": pending_requests
-    }
+    return await _snapshot_response(request, "summary")
 
 @router.get("/usage")
-async def get_usage_breakdown(user_id: str = Depends(verify_token)):
+async def get_usage_breakdown(request: Request, user_id: str = Depends(verify_token)):
     await require_role(user_id, ['admin'])
     # user = await db["users"].find_one({"_id": ObjectId(user_id)}) # No longer needed
     # if user["role"] != "admin": # No longer needed
     #     raise HTTPException(status_code=403)
 
-    orgs = await db["organizations"].find().to_list(length=100)
-    org_map = {str(o["_id"]): o["name"] for o in orgs}
-    user_list = await db["users"].find().to_list(length=1000)
-    usage_docs = await db["usage"].find().to_list(length=1000)
-
-    org_tokens = {}
-    for u in user_list:
-        uid = str(u["_id"])
-        oid = str(u.get("organization_id"))
-        usage = next((x for x in usage_docs if str(x["user_id"]) == uid), None)
-        if usage:
-            org_tokens[oid] = org_tokens.get(oid, 0) + usage.get("token_usage_monthly", 0)
-
-    per_organization = [
-        {"org": org_map.get(oid, "—"), "tokens": total}
-        for oid, total in org_tokens.items()
-    ]
-
-    daily_usage = [
-        {"date": f"2024-05-{day:02d}", "tokens": (200 + (day * 15)) % 600}
-        for day in range(1, 31)
-    ]
-
-    return {
-        "per_organization": per_organization,
-        "daily_usage": daily_usage
-    }
+    return await _snapshot_response(request, "usage")
 
 @router.get("/top-users")
-async def get_top_users(user_id: str = Depends(verify_token)):
+async def get_top_users(request: Request, user_id: str = Depends(verify_token)):
     await require_role(user_id, ['admin'])
     # user = await db["users"].find_one({"_id": ObjectId(user_id)}) # No longer needed
     # if user["role"] != "admin": # No longer needed
     #     raise HTTPException(status_code=403)
 
-    usage = await db["usage"].find().sort("token_usage_monthly", -1).limit(10).to_list(length=10)
-    user_ids = [u["user_id"] for u in usage]
-    users_map = {
-        str(u["_id"]): u for u in await db["users"].find({"_id": {"$in": [ObjectId(uid) for uid in user_ids]}}).to_list(length=100)
-    }
-
-    org_map = {
-        str(o["_id"]): o["name"] for o in await db["organizations"].find().to_list(length=100)
-    }
-
-    return [
-        {
-            "email": users_map[str(u["user_id"])]["email"],
-            "role": users_map[str(u["user_id"])]["role"],
-            "organization": org_map.get(str(users_map[str(u["user_id"])].get("organization_id")), None),
-            "tokens_used": u["token_usage_monthly"]
-        }
-        for u in usage if str(u["user_id"]) in users_map
-    ]
+    return await _snapshot_response(request, "top_users")
 
 @router.get("/quota-requests")
 async def get_all_quota_requests(user_id: str = Depends(verify_token)):
@@ -150,65 +104,32 @@ async def get_quota_requests(user_id: str = Depends(verify_token)):
 
 
 @router.get("/timeline")
-async def get_usage_timeline(user_id: str = Depends(verify_token)):
+async def get_usage_timeline(
+    days: int = Query(30, ge=1, le=366),
+    org_id: Optional[str] = Query(None),
+    target_user_id: Optional[str] = Query(None, alias="user_id"),
+    user_id: str = Depends(verify_token),
+):
+    """Daily token totals from the usage rollups, platform-wide or for one org or user."""
     logger.info("Fetching usage timeline for admin")
     await require_role(user_id, ['admin'])
-    # user = await db["users"].find_one({"_id": ObjectId(user_id)}) # No longer needed
-    # if user["role"] != "admin": # No longer needed
-    #     raise HTTPException(status_code=403)
 
-    pipeline = [
-        {
-            # Ensure timestamp exists and is a valid date type
-            "$match": {
-                "timestamp": { "$exists": True, "$type": "date" }
-            }
-        },
-        {
-            "$group": {
-                "_id": {
-                    "$dateToString": { "format": "%Y-%m-%d", "date": "$timestamp" }
-                },
-                "tokens": { "$sum": "$tokens_used" }
-            }
-        },
-        { "$sort": { "_id": 1 } }
-    ]
-
-    usage_data = await db["usage"].aggregate(pipeline).to_list(length=100)
-    return [{"date": entry["_id"], "tokens": entry["tokens"]} for entry in usage_data]
+    if target_user_id:
+        return await get_daily_series(SCOPE_USER, target_user_id, days=days)
+    if org_id:
+        return await get_daily_series(SCOPE_ORG, org_id, days=days)
+    return await get_daily_series(SCOPE_ALL, ALL_KEY, days=days)
 
 
 @router.get("/assistants")
-async def get_assistant_stats(user_id: str = Depends(verify_token)):
+async def get_assistant_stats(request: Request, user_id: str = Depends(verify_token)):
     logger.info("Fetching assistant stats for admin")
     await require_role(user_id, ['admin'])
     # user = await db["users"].find_one({"_id": ObjectId(user_id)}) # No longer needed
     # if user["role"] != "admin": # No longer needed
     #     raise HTTPException(status_code=403)
 
-    orgs = await db["organizations"].find().to_list(None)
-    users = await db["users"].find().to_list(None)
-    assistants_data = await db["assistants"].find().to_list(None)
-
-    user_map = {str(u["_id"]): u for u in users}
-
-    stats = []
-    for org in orgs:
-        org_users = [u for u in users if u.get("organization_id") == str(org["_id"])]
-        org_user_ids = {str(u["_id"]) for u in org_users}
-
-        org_assistants = [a for a in assistants_data if str(a.get("user_id")) in org_user_ids]
-        total_assistants = len(org_assistants)
-        total_files = sum(len(a.get("file_ids", [])) for a in org_assistants)
-
-        stats.append({
-            "organization": org["name"],
-            "assistant_count": total_assistants,
-            "total_files": total_files,
-        })
-
-    return stats
+    return await _snapshot_response(request, "assistants")
 
 
 @router.get("/billing-history")
@@ -235,3 +156,10 @@ async def get_billing_history(user_id: str = Depends(verify_token)):
         })
 
     return results
+
+
+@router.get("/retrieval-cache")
+async def get_retrieval_cache_stats(user_id: str = Depends(verify_token)):
+    """Hit/miss counters of this worker's retrieval cache, for tuning TTLs."""
+    await require_role(user_id, ['admin'])
+    return retrieval_cache.stats()
@@ -5,17 +5,37 @@ import json
 # import uuid # No longer needed after removing local file management
 import httpx
 from fastapi import APIRouter, Depends, File, HTTPException, Form, UploadFile
-from typing import List
+from typing import List, Optional
 from fastapi.responses import StreamingResponse
 from fastapi.encoders import jsonable_encoder
 from bson import ObjectId
 
 from app.schemas.assistant import QueryInput, AssistantUpdate # Import AssistantUpdate
 from app.services.organization import OpenAIOrganizationService
-from app.utils.auth import get_current_user
+from app.services.local_index import (
+    RETRIEVAL_BACKEND_LOCAL,
+    build_context_instructions,
+    get_org_index,
+    get_retrieval_backend,
+    index_document_text,
+    indexes_uploads_locally,
+    search_org,
+)
+from app.services.questionnaire import _extract_text
+from app.services.retrieval_cache import invalidate_org_vector_stores, retrieval_cache
+from app.services.citations import citation_resolver
+from app.services.messages import CHAT_PROJECTION, ensure_migrated, persist_turn
+from app.services.usage_events import record_usage_event
+from app.utils.auth import get_current_user, get_request_context
+from app.utils.context import (
+    RequestContext,
+    get_cached_user,
+    invalidate_assistant_context,
+    invalidate_org_context,
+)
 from app.db import db
 from app.config import settings
-from app.utils.title import generate_chat_title
+from app.utils.title import start_title_task
 from app.utils.logger import logger
 from app.utils.footnote import extract_footnotes
 from app.utils.quota import enforce_quota_and_update
@@ -36,18 +56,14 @@ OPENAI_HEADERS = {
 }
 
 @router.post("/stream")
-async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
-    # user is a tuple: (user_id, role, email)
-    current_user_id_str = user[0]
-    user_email = user[2]
-    logger.info(f"📥 Received stream request from user: {user_email} (ID: {current_user_id_str}), chat_id: {query.chat_id}")
-    logger.info(f"🔍 User question: {query.question}")
-
-    # 1. User and Agent Identification
-    user_doc = await db.users.find_one({"_id": ObjectId(current_user_id_str)})
-    if not user_doc:
-        logger.error(f"User not found in DB: {current_user_id_str}")
-        raise HTTPException(status_code=403, detail="User not found.")
+async def stream_answer(query: QueryInput, ctx: RequestContext = Depends(get_request_context)):
+    current_user_id_str = ctx.user_id
+    user_email = ctx.email
+    logger.info("📥 Received stream request from user: %s (ID: %s), chat_id: %s", user_email, current_user_id_str, query.chat_id)
+    logger.debug("🔍 User question (%d chars)", len(query.question))
+
+    # 1. User and Agent Identification (user, org and assistant come from one lookup)
+    user_doc = ctx.user
 
     organization_id = user_doc.get("organization_id")
     agent_id_in_user = user_doc.get("agent_id")
@@ -60,11 +76,11 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
             logger.warning(f"User {current_user_id_str} in org {organization_id} is not assigned an agent.")
             raise HTTPException(status_code=403, detail="User not assigned an agent.")
 
-        logger.info(f"User {current_user_id_str} belongs to org {organization_id} and is assigned agent {agent_id_in_user}")
+        logger.debug("User %s belongs to org %s and is assigned agent %s", current_user_id_str, organization_id, agent_id_in_user)
 
         # 2. Fetch Agent's OpenAI Assistant Details
         # agent_id_in_user is the MongoDB ObjectId of the assistant document
-        assistant_doc = await db.assistants.find_one({"_id": ObjectId(agent_id_in_user)})
+        assistant_doc = ctx.assistant
         if not assistant_doc:
             logger.error(f"Assistant document not found for agent_id: {agent_id_in_user} (user: {current_user_id_str})")
             raise HTTPException(status_code=404, detail="Assigned agent details not found.")
@@ -74,23 +90,34 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
             logger.error(f"OpenAI assistant ID not found in assistant document: {agent_id_in_user} (user: {current_user_id_str})")
             raise HTTPException(status_code=500, detail="Configuration error: OpenAI assistant ID missing for the assigned agent.")
 
-        logger.info(f"Using OpenAI Assistant ID: {openai_assistant_id} for user {current_user_id_str} (agent_id: {agent_id_in_user})")
+        logger.debug("Using OpenAI Assistant ID: %s for user %s (agent_id: %s)", openai_assistant_id, current_user_id_str, agent_id_in_user)
+
+        # Organizations on the local retrieval backend get their context from the
+        # on-disk index and pass it to the run instead of relying on file_search.
+        additional_instructions = None
+        local_references = []
+        if await get_retrieval_backend(organization_id, ctx.organization) == RETRIEVAL_BACKEND_LOCAL:
+            hits = await search_org(str(organization_id), [query.question], k=settings.LOCAL_RETRIEVAL_TOP_K)
+            additional_instructions, local_references = build_context_instructions(hits[0])
+            logger.info("Local retrieval returned %d chunks for org %s", len(hits[0]), organization_id)
 
         estimated_token_count = count_tokens(query.question)
-        # Assuming enforce_quota_and_update uses string user_id
-        await enforce_quota_and_update(user_id=current_user_id_str, tokens_used=estimated_token_count)
+        await enforce_quota_and_update(
+            user_id=current_user_id_str, tokens_used=estimated_token_count,
+            user_profile=ctx.user, org_doc=ctx.organization,
+        )
 
         # Fetch chat and ensure thread exists
-        chat = await db.chats.find_one({"_id": ObjectId(query.chat_id), "user_id": ObjectId(current_user_id_str)})
+        chat = await db.chats.find_one(
+            {"_id": ObjectId(query.chat_id), "user_id": ObjectId(current_user_id_str)}, CHAT_PROJECTION
+        )
         if not chat:
             logger.warning(f"Chat not found for chat_id: {query.chat_id} and user_id: {current_user_id_str}")
             raise HTTPException(status_code=404, detail="Chat not found")
+        await ensure_migrated(chat)
 
-        # Generate title if needed
-        if chat.get("title") in ["New Chat", "Untitled", ""]:
-            title = generate_chat_title(query.question)
-            await db.chats.update_one({"_id": ObjectId(query.chat_id)}, {"$set": {"title": title}})
-            logger.info(f"✏️ Chat title updated for chat_id {query.chat_id}: {title}")
+        # Generate the title in the background; it is streamed as a `title` event
+        title_task = start_title_task(chat, query.question)
 
         # Load or create thread
         thread_id = chat.get("thread_id")
@@ -107,27 +134,29 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
                 {"_id": ObjectId(query.chat_id)},
                 {"$set": {"thread_id": thread_id}}
             )
-            logger.info(f"🧵 New thread created and saved for chat {query.chat_id}: {thread_id}")
+            logger.info("🧵 New thread created and saved for chat %s: %s", query.chat_id, thread_id)
         else:
-            logger.info(f"♻️ Reusing existing thread for chat {query.chat_id}: {thread_id}")
+            logger.debug("♻️ Reusing existing thread for chat %s: %s", query.chat_id, thread_id)
 
         # Pass openai_assistant_id to the stream generator
-        stream_generator = openai_stream(thread_id, query.question, openai_assistant_id, current_user_id_str, query.chat_id)
+        stream_generator = openai_stream(
+            thread_id, query.question, openai_assistant_id, current_user_id_str, query.chat_id,
+            additional_instructions=additional_instructions, local_references=local_references,
+            title_task=title_task, ctx=ctx,
+        )
         return StreamingResponse(stream_generator, media_type="text/event-stream")
     
     else:
         user_id = current_user_id_str
         estimated_token_count = count_tokens(query.question)
-        await enforce_quota_and_update(user_id=str(user_id), tokens_used=estimated_token_count)
+        await enforce_quota_and_update(user_id=str(user_id), tokens_used=estimated_token_count, user_profile=ctx.user)
 
-        chat = await db.chats.find_one({"_id": ObjectId(query.chat_id), "user_id": ObjectId(user_id)})
+        chat = await db.chats.find_one({"_id": ObjectId(query.chat_id), "user_id": ObjectId(user_id)}, CHAT_PROJECTION)
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found")
+        await ensure_migrated(chat)
 
-        if chat.get("title") in ["New Chat", "Untitled", ""]:
-            title = generate_chat_title(query.question)
-            await db.chats.update_one({"_id": ObjectId(query.chat_id)}, {"$set": {"title": title}})
-            logger.info(f"✏️ Chat title updated: {title}")
+        title_task = start_title_task(chat, query.question)
 
         thread_id = chat.get("thread_id")
         client = httpx.AsyncClient(timeout=60.0)
@@ -148,11 +177,13 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
                 {"_id": ObjectId(query.chat_id)},
                 {"$set": {"thread_id": thread_id}}
             )
-            logger.info(f"🧵 New thread created and saved: {thread_id}")
+            logger.info("🧵 New thread created and saved: %s", thread_id)
         else:
-            logger.info(f"♻️ Reusing existing thread: {thread_id}")
+            logger.debug("♻️ Reusing existing thread: %s", thread_id)
 
         async def openai_stream():
+            nonlocal title_task
+            saved = None
             try:
                 # Add user message
                 msg_resp = await client.post(
@@ -162,7 +193,7 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
                 )
                 if msg_resp.status_code != 200:
                     raise Exception(f"Failed to add user message: {msg_resp.text}")
-                logger.info(f"📨 User message added to thread")
+                logger.debug("📨 User message added to thread")
 
                 # Run assistant
                 config = await db.assistants.find_one({"_id": "default_assistant"})
@@ -179,7 +210,7 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
                 run_id = run_data.get("id")
                 if not run_id:
                     raise Exception(f"Run creation failed. Missing ID: {run_data}")
-                logger.info(f"🏃 Assistant run started: {run_id}")
+                logger.info("🏃 Assistant run started: %s", run_id)
 
                 # Wait for run to complete
                 while True:
@@ -189,9 +220,14 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
                     )
                     status_data = status_resp.json()
                     status = status_data.get("status")
-                    logger.info(f"⏳ Run status: {status}")
+                    logger.debug("⏳ Run status: %s", status, extra={"sample_every": settings.LOG_POLL_SAMPLE_EVERY})
                     if status in ["completed", "failed", "cancelled"]:
                         break
+                    if title_task is not None and title_task.done():
+                        event = await _title_event(title_task)
+                        title_task = None
+                        if event:
+                            yield event
                     await asyncio.sleep(1)
 
                 if status != "completed":
@@ -207,7 +243,7 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
                 for msg in messages:
                     if msg["role"] == "assistant" and msg.get("run_id") == run_id:
                         latest_assistant_reply = msg["content"][0]["text"]["value"].strip()
-                        logger.info("✅ Assistant response retrieved.")
+                        logger.debug("✅ Assistant response retrieved.")
                         break
                 if not latest_assistant_reply:
                     logger.warning("⚠️ Assistant reply not found for current run.")
@@ -220,32 +256,72 @@ async def stream_answer(query: QueryInput, user=Depends(get_current_user)):
 
                 # Post-processing
                 footnotes = await extract_footnotes(latest_assistant_reply)
-                total_tokens_used = count_tokens(latest_assistant_reply) + count_tokens(query.question)
-                await enforce_quota_and_update(user_id=str(user_id), tokens_used=total_tokens_used)
-
-                await db.chats.update_one(
-                    {"_id": ObjectId(query.chat_id)},
-                    {"$push": {
-                        "messages": {
-                            "role": "assistant",
-                            "content": latest_assistant_reply,
-                            "footnotes": footnotes,
-                            "createdAt": datetime.utcnow()
-                        }
-                    }}
+                input_tokens = count_tokens(query.question)
+                output_tokens = count_tokens(latest_assistant_reply)
+                total_tokens_used = input_tokens + output_tokens
+                await enforce_quota_and_update(user_id=str(user_id), tokens_used=total_tokens_used, user_profile=ctx.user)
+
+                saved = await persist_turn(
+                    query.chat_id, query.question, latest_assistant_reply,
+                    footnotes=footnotes, input_tokens=input_tokens, output_tokens=output_tokens,
                 )
-                logger.info(f"✅ Response saved. Tokens: {total_tokens_used}, Footnotes: {len(footnotes)}")
+                await record_usage_event(
+                    user_id, ctx.organization_id, assistant_id, input_tokens, output_tokens,
+                    model=status_data.get("model"),
+                )
+                logger.info("✅ Turn saved. Tokens: %s, Footnotes: %d", total_tokens_used, len(footnotes))
 
-                yield f"data: {json.dumps({'type': 'done'})}\n\n"
+                event = await _title_event(title_task)
+                if event:
+                    yield event
+                yield _done_event(saved)
 
             except Exception as e:
                 logger.exception("❌ Error during OpenAI assistant response")
+                if saved is None:
+                    await _persist_question_only(query.chat_id, query.question)
                 yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
 
         return StreamingResponse(openai_stream(), media_type="text/event-stream")
 
 
-async def openai_stream(thread_id: str, question: str, assistant_id_to_use: str, user_id_str: str, chat_id_str: str):
+async def _title_event(title_task: Optional[asyncio.Task]) -> Optional[str]:
+    """Wait for the background title task and render it as an SSE ``title`` event."""
+    if title_task is None:
+        return None
+    try:
+        title = await title_task
+    except Exception as e:
+        logger.error(f"Chat title task failed: {e}")
+        return None
+    return f"data: {json.dumps({'type': 'title', 'content': title})}\n\n"
+
+
+def _done_event(saved_messages: List[dict]) -> str:
+    """SSE ``done`` event carrying the turn's stored messages, so clients need not refetch."""
+    return f"data: {json.dumps({'type': 'done', 'messages': jsonable_encoder(saved_messages)})}\n\n"
+
+
+async def _persist_question_only(chat_id: str, question: str):
+    """Keep the user's question in the history when no reply could be produced."""
+    try:
+        await persist_turn(chat_id, question, input_tokens=count_tokens(question))
+    except Exception as e:
+        logger.error(f"Failed to save question for chat {chat_id}: {e}")
+
+
+async def openai_stream(
+    thread_id: str,
+    question: str,
+    assistant_id_to_use: str,
+    user_id_str: str,
+    chat_id_str: str,
+    additional_instructions: str = None,
+    local_references: List[str] = None,
+    title_task: Optional[asyncio.Task] = None,
+    ctx: Optional[RequestContext] = None,
+):
+    saved = None
     try:
         client = httpx.AsyncClient(timeout=60.0)
 
@@ -255,17 +331,20 @@ async def openai_stream(thread_id: str, question: str, assistant_id_to_use: str,
             headers=OPENAI_HEADERS,
             json={"role": "user", "content": question}
         )
-        logger.info(f"📨 User message added to thread {thread_id} by user {user_id_str}")
+        logger.debug("📨 User message added to thread %s by user %s", thread_id, user_id_str)
 
         # Run assistant using the dynamically fetched assistant_id_to_use
+        run_payload = {"assistant_id": assistant_id_to_use}
+        if additional_instructions:
+            run_payload["additional_instructions"] = additional_instructions
         run_resp = await client.post(
             f"https://api.openai.com/v1/threads/{thread_id}/runs",
             headers=OPENAI_HEADERS,
-            json={"assistant_id": assistant_id_to_use}
+            json=run_payload
         )
         run_resp.raise_for_status()
         run_id = run_resp.json()["id"]
-        logger.info(f"🏃 Assistant run started: {run_id} on thread {thread_id} with assistant {assistant_id_to_use} for user {user_id_str}")
+        logger.info("🏃 Assistant run started: %s on thread %s with assistant %s for user %s", run_id, thread_id, assistant_id_to_use, user_id_str)
 
         # Wait for run to finish
         status = None  # Initialize status
@@ -278,10 +357,15 @@ async def openai_stream(thread_id: str, question: str, assistant_id_to_use: str,
             run_status_resp.raise_for_status() # Check for HTTP errors during polling
             run_status_data = run_status_resp.json()
             status = run_status_data["status"]
-            logger.info(f"⏳ Run status for run {run_id}: {status}")
+            logger.debug("⏳ Run status for run %s: %s", run_id, status, extra={"sample_every": settings.LOG_POLL_SAMPLE_EVERY})
             # More comprehensive list of terminal or action-required states
             if status in ["completed", "failed", "cancelled", "expired", "requires_action"]:
                 break
+            if title_task is not None and title_task.done():
+                event = await _title_event(title_task)
+                title_task = None
+                if event:
+                    yield event
             await asyncio.sleep(1) # Wait before polling again
 
         # Check status after the loop
@@ -309,7 +393,7 @@ async def openai_stream(thread_id: str, question: str, assistant_id_to_use: str,
         messages = messages_data["data"]
 
         latest_assistant_reply = None
-        references = []
+        references = list(local_references or [])
         # Iterate through messages to find the one from the assistant for this run
         # Messages are typically ordered newest first by API default, but run_id helps ensure correctness.
         for msg in messages:
@@ -322,23 +406,17 @@ async def openai_stream(thread_id: str, question: str, assistant_id_to_use: str,
                 ):
                     text_block = msg["content"][0]["text"]
                     latest_assistant_reply = text_block["value"].strip()
-                    for ann in text_block.get("annotations", []):
-                        if ann.get("type") == "file_citation":
-                            fid = ann["file_citation"].get("file_id", "")
-                            quote = ann["file_citation"].get("quote", "")
-                            doc = await db.documents.find_one({"openai_file_id": fid})
-                            fname = doc.get("filename", fid) if doc else fid
-                            page_no = 1
-                            base_name = fname
-                            if "_chunk_" in fname:
-                                base_name, rest = fname.split("_chunk_", 1)
-                                try:
-                                    page_no = int(rest.split(".")[0]) + 1
-                                except Exception:
-                                    page_no = 1
-                            snippet = quote[:20]
-                            references.append(f"({base_name}, {page_no}, {snippet}...)")
-                    logger.info(f"✅ Assistant response retrieved for run {run_id}.")
+                    citations = [
+                        ann["file_citation"] for ann in text_block.get("annotations", [])
+                        if ann.get("type") == "file_citation"
+                    ]
+                    resolved = await citation_resolver.resolve(c.get("file_id", "") for c in citations)
+                    for citation in citations:
+                        fid = citation.get("file_id", "")
+                        base_name, page_no = resolved.get(fid, (fid, 1))
+                        snippet = citation.get("quote", "")[:20]
+                        references.append(f"({base_name}, {page_no}, {snippet}...)")
+                    logger.debug("✅ Assistant response retrieved for run %s.", run_id)
                     break
 
         if not latest_assistant_reply:
@@ -358,27 +436,33 @@ async def openai_stream(thread_id: str, question: str, assistant_id_to_use: str,
         footnotes = await extract_footnotes(latest_assistant_reply) # This should be fine
         # Calculate tokens for the assistant's reply only
         output_tokens_charged = count_tokens(latest_assistant_reply)
-        await enforce_quota_and_update(user_id=user_id_str, tokens_used=output_tokens_charged)
-
-        await db.chats.update_one(
-            {"_id": ObjectId(chat_id_str)},
-            {"$push": {
-                "messages": {
-                    "role": "assistant",
-                    "content": latest_assistant_reply,
-                    "footnotes": footnotes,
-                    "references": references,
-                    "createdAt": datetime.utcnow()
-                }
-            }}
+        await enforce_quota_and_update(
+            user_id=user_id_str, tokens_used=output_tokens_charged,
+            user_profile=ctx.user if ctx else None, org_doc=ctx.organization if ctx else None,
         )
+
         input_tokens_previously_charged = count_tokens(question)
-        logger.info(f"✅ Response saved. Output Tokens charged this step: {output_tokens_charged}. Input Tokens (estimated & charged earlier): {input_tokens_previously_charged}. Footnotes: {len(footnotes)}")
+        saved = await persist_turn(
+            chat_id_str, question, latest_assistant_reply,
+            footnotes=footnotes, references=references,
+            input_tokens=input_tokens_previously_charged, output_tokens=output_tokens_charged,
+        )
+        await record_usage_event(
+            user_id_str, ctx.organization_id if ctx else None, assistant_id_to_use,
+            input_tokens_previously_charged, output_tokens_charged,
+            model=run_status_data.get("model"),
+        )
+        logger.info("✅ Turn saved. Output Tokens charged this step: %s. Input Tokens (estimated & charged earlier): %s. Footnotes: %d", output_tokens_charged, input_tokens_previously_charged, len(footnotes))
 
-        yield f"data: {json.dumps({'type': 'done'})}\n\n"
+        event = await _title_event(title_task)
+        if event:
+            yield event
+        yield _done_event(saved)
 
     except Exception as e:
         logger.exception("❌ Error during OpenAI assistant response")
+        if saved is None:
+            await _persist_question_only(chat_id_str, question)
         yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
 
 @router.get("/details")
@@ -409,7 +493,7 @@ async def list_assistants(org_id: str, current_user=Depends(get_current_user)):
     logger.info(f"User {user_id_from_token} attempting to list assistants for org {org_id}.")
 
     # Authorization Check
-    user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    user_doc = await get_cached_user(user_id_from_token)
     if not user_doc:
         logger.warning(f"User {user_id_from_token} not found in database during list assistants for org {org_id}.")
         raise HTTPException(status_code=404, detail="User not found.")
@@ -460,7 +544,7 @@ async def create_assistant(org_id: str,
     logger.info(f"File IDs provided: {file_ids}")
 
     # Authorization Check
-    user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    user_doc = await get_cached_user(user_id_from_token)
     if not user_doc:
         logger.warning(f"User {user_id_from_token} not found in database during assistant creation for org {org_id}.")
         raise HTTPException(status_code=404, detail="User not found.")
@@ -592,6 +676,7 @@ async def create_assistant(org_id: str,
             {"_id": ObjectId(org_id)}, # Query by ObjectId of the organization
             {"$push": {"agents": new_agent_entry}}
         )
+        invalidate_org_context(org_id)
 
         if update_org_result.modified_count == 1:
             logger.info(f"Successfully added agent entry to organization {org_id} for assistant {assistant_mongo_id}")
@@ -663,7 +748,7 @@ async def org_upload_file_to_openai(org_id: str, files: List[UploadFile] = File(
     results = []
 
     # 1. Authorization (applies to the whole batch)
-    user_info = await db.users.find_one({"_id": ObjectId(user_id)})
+    user_info = await get_cached_user(user_id)
     if not user_info:
         raise HTTPException(status_code=403, detail="User not found.")
 
@@ -672,6 +757,8 @@ async def org_upload_file_to_openai(org_id: str, files: List[UploadFile] = File(
                        f"attempted to upload to org {org_id} without sufficient privileges.")
         raise HTTPException(status_code=403, detail="User not authorized to upload files for this organization.")
 
+    index_locally = await indexes_uploads_locally(org_id)
+
     for file in files:
         logger.info(f"User {user_id} authorized. Proceeding with file upload: {file.filename} for org: {org_id}")
         openai_file_id = None
@@ -708,6 +795,7 @@ async def org_upload_file_to_openai(org_id: str, files: List[UploadFile] = File(
                 "purpose": "assistants"
             }
             result = await db["documents"].insert_one(document_to_store)
+            citation_resolver.remember(openai_file_id, file.filename)
             # Prepare a serializable version for the results list
             stored_doc_response = document_to_store.copy()
             stored_doc_response["_id"] = str(result.inserted_id)
@@ -715,6 +803,13 @@ async def org_upload_file_to_openai(org_id: str, files: List[UploadFile] = File(
             stored_doc_response["uploaded_by_user_id"] = user_id # Return as string
             logger.info(f"File metadata stored in DB for {file.filename}, doc_id: {result.inserted_id}, openai_file_id: {openai_file_id}")
 
+            if index_locally:
+                try:
+                    text = await asyncio.to_thread(_extract_text, file_content, file.filename)
+                    await index_document_text(org_id, file.filename, text, file_id=openai_file_id)
+                except Exception as e_idx:
+                    logger.error(f"Failed to add {file.filename} to local index for org {org_id}: {str(e_idx)}")
+
             # New logic to add file to assistant vector stores
             if openai_file_id: # Ensure we have an OpenAI file ID
                 logger.info(f"Attempting to add OpenAI file {openai_file_id} to vector stores for organization {org_id}")
@@ -732,6 +827,7 @@ async def org_upload_file_to_openai(org_id: str, files: List[UploadFile] = File(
                                     file_id=openai_file_id
                                 )
                                 logger.info(f"Successfully added file {openai_file_id} to vector store {assistant_vector_store_id} for assistant {assistant_id_str}")
+                                await retrieval_cache.bump_when_indexed(assistant_vector_store_id, [openai_file_id])
                                 # Update the assistant document to include the new file_id
                                 await db.assistants.update_one(
                                     {"_id": assistant["_id"]},
@@ -786,7 +882,7 @@ async def list_organization_files(org_id: str, current_user=Depends(get_current_
     user_id = current_user[0] # Changed to current_user[0]
 
     # 1. Authorization (similar to file upload)
-    user_info = await db.users.find_one({"_id": ObjectId(user_id)})
+    user_info = await get_cached_user(user_id)
     if not user_info:
         raise HTTPException(status_code=403, detail="User not found.")
 
@@ -837,7 +933,7 @@ async def update_assistant_details(
     logger.info(f"User {user_id_from_token} attempting to update assistant {assistant_db_id} for org {org_id}.")
 
     # 1. Authorization
-    user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    user_doc = await get_cached_user(user_id_from_token)
     if not user_doc:
         logger.warning(f"User {user_id_from_token} not found in database.")
         raise HTTPException(status_code=404, detail="User not found.")
@@ -944,6 +1040,11 @@ async def update_assistant_details(
                         file_id=file_id
                     )
 
+                if files_to_add_to_vs:
+                    await retrieval_cache.bump_when_indexed(current_vector_store_id, list(files_to_add_to_vs))
+                elif files_to_remove_from_vs:
+                    await retrieval_cache.bump(current_vector_store_id)
+
                 if not payload.file_ids and existing_openai_files_in_vs:
                     logger.info(f"Payload file_ids is empty. All files removed from VS {current_vector_store_id}.")
                     update_data_openai_assistant["tool_resources"] = {"file_search": {"vector_store_ids": []}}
@@ -954,6 +1055,7 @@ async def update_assistant_details(
     # 5. Database Update
     if update_data_db:
         await db.assistants.update_one({"_id": assistant_obj_id}, {"$set": update_data_db})
+        invalidate_assistant_context(assistant_db_id)
         logger.info(f"Assistant {assistant_db_id} updated in DB with data: {update_data_db}")
 
     # 6. OpenAI Assistant Object Update
@@ -995,7 +1097,7 @@ async def delete_assistant_endpoint(
     logger.info(f"User {user_id_from_token} attempting to delete assistant {assistant_db_id} for org {org_id}.")
 
     # 1. Authorization
-    user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    user_doc = await get_cached_user(user_id_from_token)
     if not user_doc:
         logger.warning(f"User {user_id_from_token} not found in database during assistant deletion.")
         raise HTTPException(status_code=404, detail="User not found.")
@@ -1060,6 +1162,7 @@ async def delete_assistant_endpoint(
 
     # 5. Database Deletion
     delete_result = await db.assistants.delete_one({"_id": assistant_obj_id})
+    invalidate_assistant_context(assistant_db_id)
     if delete_result.deleted_count == 0:
         logger.error(f"Assistant {assistant_db_id} was fetched but not found for deletion from DB.")
         raise HTTPException(status_code=404, detail="Assistant found initially but could not be deleted from database.")
@@ -1073,7 +1176,7 @@ async def delete_org_openai_file(org_id: str, openai_file_id: str, current_user=
     logger.info(f"User {user_id_from_token} attempting to delete OpenAI file {openai_file_id} for org {org_id}.")
 
     # 1. Authorization
-    user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    user_doc = await get_cached_user(user_id_from_token)
     if not user_doc:
         logger.warning(f"User {user_id_from_token} not found in database.")
         raise HTTPException(status_code=404, detail="User not found.")
@@ -1113,6 +1216,7 @@ async def delete_org_openai_file(org_id: str, openai_file_id: str, current_user=
         raise HTTPException(status_code=404, detail="File not found in this organization's records.")
 
     original_filename = doc_to_delete.get("filename", "N/A")
+    citation_resolver.forget(openai_file_id)
     logger.info(f"File record for '{original_filename}' (OpenAI ID: {openai_file_id}) deleted from DB for org {org_id}.")
 
     # 3. Delete from OpenAI
@@ -1128,6 +1232,19 @@ async def delete_org_openai_file(org_id: str, openai_file_id: str, current_user=
 
         logger.info(f"File {openai_file_id} ('{original_filename}') successfully deleted from OpenAI by user {user_id_from_token} for org {org_id}.")
 
+        # Deleting the file detaches it from every vector store that referenced it
+        try:
+            await invalidate_org_vector_stores(org_id)
+        except Exception as e_cache:
+            logger.error(f"Failed to invalidate retrieval cache for org {org_id}: {str(e_cache)}")
+
+        try:
+            removed = await asyncio.to_thread(get_org_index(org_id).remove_file, openai_file_id)
+            if removed:
+                logger.info(f"Removed {removed} chunks of {openai_file_id} from local index for org {org_id}.")
+        except Exception as e_idx:
+            logger.error(f"Failed to remove {openai_file_id} from local index for org {org_id}: {str(e_idx)}")
+
     except openai.APIError as e: # More specific OpenAI error catching
         logger.error(f"CRITICAL: File {openai_file_id} ('{original_filename}') deleted from DB but FAILED to delete from OpenAI. Error: {str(e)}")
         # Attempt to restore the document record as the source of truth (OpenAI) still has the file.
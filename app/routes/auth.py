@@ -3,28 +3,45 @@ from bson import ObjectId
 from datetime import datetime
 from app.db import db
 from app.schemas.user import UserCreate, UserLogin, UserOut
-from app.utils.auth import get_current_user, hash_password, verify_password, create_access_token
+from app.services.password_hashing import password_hasher
+from app.utils.auth import get_current_user, hash_password, create_access_token
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
+
+def _issue_token(db_user: dict) -> str:
+    return create_access_token(
+        str(db_user["_id"]), db_user["role"], db_user["email"],
+        organization_id=db_user.get("organization_id"),
+        agent_id=db_user.get("agent_id"),
+        token_version=db_user.get("token_version", 0),
+    )
+
+
 @router.post("/signup", response_model=UserOut)
 async def signup(user: UserCreate):
     existing = await db.users.find_one({"email": user.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = hash_password(user.password)
+    hashed = await hash_password(user.password)
     result = await db.users.insert_one({"email": user.email, "password": hashed, "role": "user"})
     return UserOut(id=str(result.inserted_id), email=user.email, role="user")
 
 @router.post("/login")
 async def login(user: UserLogin):
     db_user = await db.users.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+    if not db_user or not db_user.get("password"):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await password_hasher.verify_and_update(user.password, db_user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Cost factor changed since this hash was made; upgrade it unless the password changed meanwhile
+        await db.users.update_one({"_id": db_user["_id"], "password": db_user["password"]}, {"$set": {"password": new_hash}})
 
     if db_user.get("role") == "admin":
         # If the user is an admin, allow login without further checks
-        token = create_access_token(str(db_user["_id"]), db_user["role"], db_user["email"])
+        token = _issue_token(db_user)
         return {"access_token": token}
     
     # Check organization status if user has an organization_id
@@ -60,7 +77,7 @@ async def login(user: UserLogin):
         if organization.get("is_active") is False: # Explicitly check for False
             raise HTTPException(status_code=403, detail="Your organization has been deactivated. Please contact support.")
 
-    token = create_access_token(str(db_user["_id"]), db_user["role"], db_user["email"])
+    token = _issue_token(db_user)
     return {"access_token": token}
 
 
@@ -101,7 +118,7 @@ async def complete_invite(request: Request):
     if user["invite_expiry"] < datetime.utcnow():
         raise HTTPException(status_code=400, detail="Invite token expired")
 
-    hashed = hash_password(password)
+    hashed = await hash_password(password)
 
     await db.users.update_one(
         {"_id": user["_id"]},
@@ -1,13 +1,12 @@
-import datetime
-from app.utils.email_templates import render_template
 import stripe
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
 from app.utils.auth import get_current_user
 from app.db import db
 from app.config import settings
 from bson import ObjectId
 from app.utils.logger import logger
-from app.utils.notifier import send_email
+from app.services.invoices import get_customer_invoices
+from app.services.stripe_events import enqueue_event, process_pending_events
 
 router = APIRouter(prefix="/billing", tags=["billing"])
 
@@ -32,20 +31,17 @@ async def get_billing_history(user=Depends(get_current_user)):
     if not stripe_customer_id:
         return []
 
-    try:
-        invoices = stripe.Invoice.list(customer=stripe_customer_id, limit=10)
-        return [
-            {
-                "amount": inv["amount_paid"] / 100,
-                "currency": inv["currency"].upper(),
-                "date": datetime.utcfromtimestamp(inv["created"]).strftime("%Y-%m-%d"),
-                "status": inv["status"],
-                "url": inv["hosted_invoice_url"]
-            }
-            for inv in invoices.auto_paging_iter()
-        ]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Stripe error: {str(e)}")
+    invoices = await get_customer_invoices(stripe_customer_id, limit=10)
+    return [
+        {
+            "amount": inv["amount_paid"] / 100,
+            "currency": inv["currency"].upper(),
+            "date": inv["created"][:10],
+            "status": inv["status"],
+            "url": inv.get("hosted_invoice_url")
+        }
+        for inv in invoices
+    ]
 
 
 @router.post("/cancel")
@@ -119,8 +115,8 @@ async def create_checkout_session(user=Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/webhook")
-async def stripe_webhook(request: Request):
-
+async def stripe_webhook(request: Request, background_tasks: BackgroundTasks):
+    """Verify and record the event, then acknowledge; the inbox consumer applies it."""
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
 
@@ -130,59 +126,7 @@ async def stripe_webhook(request: Request):
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    
-
-    # Handle subscription creation
-    if event["type"] == "customer.subscription.created":
-        subscription = event["data"]["object"]
-        metadata = subscription.get("metadata", {})
-        org_id = metadata.get("organization_id")
-
-        if org_id:
-            await db["organizations"].update_one(
-                {"_id": ObjectId(org_id)},
-                {"$set": {
-                    "stripe_subscription_id": subscription["id"],
-                    "stripe_customer_id": subscription["customer"],
-                    "plan": "pro",
-                    "usage_quota.total_limit": settings.PREMIUM_TOKENS,
-                }}
-            )
-            logger.info(f"✅ Upgraded organization {org_id} to Pro plan via Stripe.")
-            head_user = await db["users"].find_one({"organization_id": ObjectId(org_id), "role": "organization_head"})
-            
-            if head_user:
-                html = render_template("subscription_activated.html", {
-                "ORG_NAME": "Quran Scholars",
-                "ACTIVATED_DATE": "2025-05-26",
-                "DASHBOARD_URL": "https://quranai.app/dashboard/billing"
-            })
-            send_email(head_user["email"], "✅ QuranAI Pro Plan Activated", html)
-                
-    elif event["type"] == "customer.subscription.deleted":
-        subscription = event["data"]["object"]
-        metadata = subscription.get("metadata", {})
-        org_id = metadata.get("organization_id")
-
-        if org_id:
-            await db["organizations"].update_one(
-                {"_id": ObjectId(org_id)},
-                {"$set": {
-                    "plan": "free",
-                    "usage_quota.total_limit": 10000
-                },
-                "$unset": {
-                    "stripe_subscription_id": "",
-                    "stripe_customer_id": ""
-                }}
-            )
-            logger.warning(f"⚠️ Organization {org_id} was downgraded to Free (subscription cancelled).")
-            head_user = await db["users"].find_one({"organization_id": ObjectId(org_id), "role": "organization_head"})
-
-            html = render_template("subscription_fallback_cancelled.html", {
-            "ORG_NAME": "DCC Research",
-            "CANCELLED_DATE": "2025-05-26",
-            "DASHBOARD_URL": "https://quranai.app/dashboard/billing"
-        })
-        send_email(head_user["email"], "⚠️ Subscription Cancelled", html)
+
+    if await enqueue_event(event.to_dict()):
+        background_tasks.add_task(process_pending_events)
     return {"received": True}
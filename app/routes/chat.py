@@ -1,65 +1,155 @@
+import json
+import base64
 from datetime import datetime
-from typing import List
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from bson import ObjectId
+from bson.errors import InvalidId
 from app.db import db
-from app.schemas.chat import ChatCreate, ChatMessage, ChatResponse
+from app.schemas.chat import (
+    ChatCreate,
+    ChatHistoryPage,
+    ChatMessage,
+    ChatMessagesPage,
+    ChatResponse,
+    ChatSummary,
+)
+from app.services.messages import (
+    CHAT_PROJECTION,
+    append_message,
+    delete_chat_messages,
+    ensure_migrated,
+    get_messages_page,
+)
 from app.utils.auth import get_current_user
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Chat list fields; chats not yet migrated count their embedded messages
+SUMMARY_PROJECTION = {
+    "title": 1,
+    "updatedAt": 1,
+    "message_count": {"$ifNull": ["$message_count", {"$size": {"$ifNull": ["$messages", []]}}]},
+}
+
+
+def _encode_cursor(doc: dict) -> str:
+    updated = doc.get("updatedAt")
+    raw = json.dumps({"u": updated.isoformat() if updated else None, "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _cursor_filter(cursor: str) -> dict:
+    """Chats after ``cursor`` in (updatedAt desc, _id desc) order; chats without
+    updatedAt sort last."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last_id = ObjectId(data["id"])
+        updated = datetime.fromisoformat(data["u"]) if data["u"] else None
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if updated is None:
+        return {"updatedAt": None, "_id": {"$lt": last_id}}
+    return {"$or": [
+        {"updatedAt": {"$lt": updated}},
+        {"updatedAt": updated, "_id": {"$lt": last_id}},
+        {"updatedAt": None},
+    ]}
+
 @router.post("/create", response_model=ChatResponse)
 async def create_chat(chat: ChatCreate, user=Depends(get_current_user)):
     user_id, _ , email= user
     title = chat.title or "New Chat"
+    now = datetime.utcnow()
     doc = {
         "user_id": ObjectId(user_id),
         "title": title,
-        "messages": [],
-        "createdAt": datetime.utcnow()
+        "message_count": 0,
+        "createdAt": now,
+        "updatedAt": now,
     }
     result = await db.chats.insert_one(doc)
     return ChatResponse(id=str(result.inserted_id), title=title, messages=[])
 
-@router.get("/history", response_model=List[ChatResponse])
-async def get_user_chats(user=Depends(get_current_user)):
+@router.get("/history", response_model=ChatHistoryPage)
+async def get_user_chats(
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    user=Depends(get_current_user),
+):
+    """Most recently updated chats first, ``limit`` at a time, without messages."""
     user_id, _, email = user
-    cursor = db.chats.find({"user_id": ObjectId(user_id)})
-    chats = []
-    async for doc in cursor:
-        chats.append(ChatResponse(
-            id=str(doc['_id']),
-            title=doc['title'],
-            messages=doc.get('messages', [])
-        ))
-    return chats
+    query = {"user_id": ObjectId(user_id)}
+    if cursor:
+        query.update(_cursor_filter(cursor))
+    docs = await (
+        db.chats.find(query, SUMMARY_PROJECTION)
+        .sort([("updatedAt", -1), ("_id", -1)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    items = [
+        ChatSummary(
+            id=str(doc["_id"]),
+            title=doc.get("title", ""),
+            updatedAt=doc.get("updatedAt"),
+            message_count=doc.get("message_count", 0),
+        )
+        for doc in docs[:limit]
+    ]
+    next_cursor = _encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return ChatHistoryPage(items=items, next_cursor=next_cursor)
+
+@router.get("/{chat_id}/messages", response_model=ChatMessagesPage)
+async def get_chat_messages(
+    chat_id: str,
+    before: Optional[int] = Query(None, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    user=Depends(get_current_user),
+):
+    """The newest ``limit`` messages with seq below ``before`` (default: the end)."""
+    user_id, _, email = user
+    chat = await db.chats.find_one({"_id": ObjectId(chat_id), "user_id": ObjectId(user_id)}, CHAT_PROJECTION)
+    if not chat:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    if "messages" in chat:
+        await ensure_migrated(chat)
+        chat = await db.chats.find_one({"_id": chat["_id"]}, CHAT_PROJECTION)
+
+    messages, next_before = await get_messages_page(chat_id, before=before, limit=limit)
+    return ChatMessagesPage(
+        id=chat_id,
+        title=chat.get("title", ""),
+        messages=messages,
+        message_count=chat.get("message_count", 0),
+        next_before=next_before,
+    )
 
 @router.patch("/{chat_id}")
 async def rename_chat(chat_id: str, data: dict, user=Depends(get_current_user)):
     user_id, _ , email= user
     await db.chats.update_one(
         {"_id": ObjectId(chat_id), "user_id": ObjectId(user_id)},
-        {"$set": {"title": data["title"]}}
+        {"$set": {"title": data["title"], "updatedAt": datetime.utcnow()}}
     )
     return {"status": "updated"}
 
 @router.post("/{chat_id}/message", response_model=ChatResponse)
 async def post_message(chat_id: str, msg: ChatMessage, user=Depends(get_current_user)):
     user_id, _ , email= user
-    chat = await db.chats.find_one({"_id": ObjectId(chat_id), "user_id": ObjectId(user_id)})
+    chat = await db.chats.find_one({"_id": ObjectId(chat_id), "user_id": ObjectId(user_id)}, CHAT_PROJECTION)
     if not chat:
         raise HTTPException(status_code=404, detail="Chat not found")
+    await ensure_migrated(chat)
 
-    await db.chats.update_one(
-        {"_id": ObjectId(chat_id)},
-        {"$push": {"messages": msg.dict()}}
-    )
-    chat = await db.chats.find_one({"_id": ObjectId(chat_id)})
+    await append_message(chat_id, msg.dict())
+    # Only the new message is echoed back; use /{chat_id}/messages for history
     return ChatResponse(
         id=str(chat['_id']),
         title=chat['title'],
-        messages=chat.get('messages', [])
+        messages=[msg],
+        thread_id=chat.get("thread_id"),
     )
     
 @router.delete("/{chat_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -67,7 +157,8 @@ async def delete_chat(chat_id: str, user=Depends(get_current_user)):
     user_id, _ , email= user
     result = await db.chats.delete_one({"_id": ObjectId(chat_id), "user_id": ObjectId(user_id)})
     if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Chat not found")    
+        raise HTTPException(status_code=404, detail="Chat not found")
+    await delete_chat_messages(chat_id)
     
 @router.get("/find_ayat")
 async def find_ayat(ref: str = Query(...), user=Depends(get_current_user)):
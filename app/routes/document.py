@@ -11,6 +11,8 @@ from openai import OpenAI
 import os
 from bson import ObjectId
 from app.config import settings
+from app.services.citations import citation_resolver
+from app.services.retrieval_cache import invalidate_file_vector_stores
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
@@ -67,6 +69,7 @@ async def upload_doc(file: UploadFile = File(...), user=Depends(get_current_user
 
     try:
         result = await db.documents.insert_one(doc)
+        citation_resolver.remember(openai_file.id, file.filename)
         logger.info(f"Admin {user_id}: Successfully saved metadata for OpenAI file {openai_file.id} to DB, doc ID: {result.inserted_id}")
         return DocumentOut(
             id=str(result.inserted_id), 
@@ -115,6 +118,8 @@ async def delete_doc(doc_id: str, user=Depends(get_current_user)):
 
     openai_client.files.delete(doc['openai_file_id'])
     await db.documents.delete_one({"_id": ObjectId(doc_id)})
+    citation_resolver.forget(doc['openai_file_id'])
+    await invalidate_file_vector_stores([doc['openai_file_id']], [doc.get("organization_id")])
     return {"detail": "Deleted"}
 
 
@@ -183,6 +188,7 @@ async def bulk_delete_openai_files(
 
     deleted = []
     failed = []
+    org_ids = []
 
     for file_id in file_ids:
         try:
@@ -194,12 +200,17 @@ async def bulk_delete_openai_files(
             continue
 
         # Attempt to remove from MongoDB
-        result = await db.documents.delete_one({"openai_file_id": file_id})
-        if result.deleted_count:
+        doc = await db.documents.find_one_and_delete({"openai_file_id": file_id})
+        citation_resolver.forget(file_id)
+        if doc:
             deleted.append(file_id)
+            org_ids.append(doc.get("organization_id"))
         else:
             failed.append(file_id)
 
+    if deleted:
+        await invalidate_file_vector_stores(deleted, org_ids)
+
     return {
         "deleted": deleted,
         "failed": failed,
@@ -13,15 +13,19 @@ from app.schemas.organization import (
     OrgQuotaInfo,
     OrgQuotaDetailsResponse,
     UserQuotaUpdatePayload, # New import
+    BulkQuotaAllocationPayload,
     OrganizationUsageResponse # Import the new response model
 )
 # from app.schemas.agent import AgentCreate, AgentResponse # Agent schemas no longer used
 from app.schemas.user import UserQuota, UserResponse # UserQuota might be removed if UserQuotaUpdatePayload replaces its use case
 from app.utils.auth import get_current_user, hash_password, require_role, verify_token
+from app.utils.context import get_cached_user, invalidate_user_context, revoke_user_tokens
+from app.services.leaderboard import SCOPE_ORG, get_leaderboard
+from app.services.org_dashboard import get_org_dashboard
 from app.config import settings
-import stripe
-from collections import defaultdict
 from app.utils.logger import logger
+from app.utils.quota_allocation import adjust_allocated_total, allocate_user_quotas
+from app.utils.quota_periods import quota_used
 router = APIRouter(prefix="/org", tags=["Organization"])
 
 # Utils
@@ -30,9 +34,8 @@ def get_collection(name: str):
 
 @router.post("/create", response_model=OrganizationResponse)
 async def create_organization(payload: OrganizationCreate, user: str = Depends(get_current_user)):
-    # Ensure this is the platform admin
-    user = await db.users.find_one({"_id": ObjectId(user[0])})
-    if user["role"] != "admin":
+    # Ensure this is the platform admin (role claim from the JWT)
+    if user[1] != "admin":
         raise HTTPException(status_code=403, detail="Only admins can create organizations.")
 
     org = {
@@ -58,14 +61,15 @@ async def create_organization(payload: OrganizationCreate, user: str = Depends(g
             }
         }
     )
+    await revoke_user_tokens(payload.head_user_id)
 
     org["_id"] = result.inserted_id
     return Organization(org)
 
 @router.get("/orgs")
 async def get_all_orgs(user_id: str = Depends(verify_token)):
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if user["role"] != "admin":
+    user = await get_cached_user(user_id)
+    if not user or user["role"] != "admin":
         raise HTTPException(status_code=403)
 
     orgs = await db.organizations.find().to_list(length=100)
@@ -78,7 +82,7 @@ async def get_all_orgs(user_id: str = Depends(verify_token)):
             "name": org["name"],
             "created_at": str(org.get("_id").generation_time.date()),
             "users": user_count,
-            "tokens_used": org.get("usage_quota", {}).get("used", 0),
+            "tokens_used": quota_used(org.get("usage_quota")),
             "plan": org.get("plan", "free"),
             "total_quota": org.get("usage_quota", {}).get("total_limit", 0)
         })
@@ -114,7 +118,7 @@ async def get_org_quota_requests_list_placeholder(
 
 @router.post("/{org_id}/add-user")
 async def add_user_to_org(org_id: str, payload: dict, token_user_id: str = Depends(verify_token)): # Renamed user_id to token_user_id for clarity
-    requesting_user = await db.users.find_one({"_id": ObjectId(token_user_id)})
+    requesting_user = await get_cached_user(token_user_id)
 
     if not requesting_user:
         raise HTTPException(status_code=403, detail="Requesting user not found.")
@@ -141,31 +145,40 @@ async def add_user_to_org(org_id: str, payload: dict, token_user_id: str = Depen
     if not email and not password:
         raise HTTPException(status_code=400, detail="Email and password is required")
     
-    hashed = hash_password(password)
+    hashed = await hash_password(password)
     
-    existing = await db.users.find_one({"email": email, "organization_id": org_id})
-    
-    if existing:
+    org_object_id = ObjectId(org_id)
+    existing = await db.users.find_one({"email": email})
+
+    if existing and str(existing.get("organization_id")) == org_id:
         raise HTTPException(status_code=404, detail="User alread a member of organization")
     if not existing:
-        existing = await db.users.insert_one({
+        await db.users.insert_one({
             "email": email, "password": hashed, 
             "name": name, "created_at": datetime.utcnow(),
             "is_active": True, "is_verified": True,
-            "organization_id": ObjectId(org_id), "role": "member", 
+            "organization_id": org_object_id, "role": "member", 
             "quota": {"monthly_limit": settings.FREE_TOKENS, "used": 0, "reset_date": None}
             })
+        await adjust_allocated_total(org_object_id, settings.FREE_TOKENS)
     else:
-        await db.users.update_one(
-            {"_id": existing["_id"]},
-            {"$set": {"organization_id": ObjectId(org_id), "role": "member"}}
+        # The member brings their current limit along; it leaves their old org's allocation
+        monthly_limit = (existing.get("quota") or {}).get("monthly_limit") or 0
+        moved = await db.users.update_one(
+            {"_id": existing["_id"], "organization_id": existing.get("organization_id")},
+            {"$set": {"organization_id": org_object_id, "role": "member"}}
         )
+        if moved.matched_count:
+            await adjust_allocated_total(org_object_id, monthly_limit)
+            if existing.get("organization_id"):
+                await adjust_allocated_total(ObjectId(existing["organization_id"]), -monthly_limit)
+        await revoke_user_tokens(existing["_id"])
     return {"message": "User added to organization"}
 
 @router.patch("/{org_id}/update-role")
 async def update_user_role(org_id: str, payload: dict, user_id: str = Depends(verify_token)):
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if user["role"] != "admin":
+    user = await get_cached_user(user_id)
+    if not user or user["role"] != "admin":
         raise HTTPException(status_code=403)
 
     target_user_id = payload.get("userId")
@@ -178,12 +191,13 @@ async def update_user_role(org_id: str, payload: dict, user_id: str = Depends(ve
         {"_id": ObjectId(target_user_id)},
         {"$set": {"role": new_role}}
     )
+    await revoke_user_tokens(target_user_id)
     return {"message": f"Role updated to {new_role}"}
 
 @router.patch("/{org_id}/toggle-active")
 async def toggle_user_status(org_id: str, payload: dict, user_id: str = Depends(verify_token)):
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if user["role"] != "admin":
+    user = await get_cached_user(user_id)
+    if not user or user["role"] != "admin":
         raise HTTPException(status_code=403)
 
     target_user_id = payload.get("userId")
@@ -192,15 +206,19 @@ async def toggle_user_status(org_id: str, payload: dict, user_id: str = Depends(
         {"_id": ObjectId(target_user_id)},
         {"$set": {"is_active": is_active}}
     )
+    await revoke_user_tokens(target_user_id)
     return {"message": "User status updated"}
 
 @router.delete("/{org_id}/delete-user/{user_id}")
 async def delete_user_from_org(org_id: str, user_id: str, admin_id: str = Depends(verify_token)):
-    admin = await db.users.find_one({"_id": ObjectId(admin_id)})
-    if admin["role"] != "admin":
+    admin = await get_cached_user(admin_id)
+    if not admin or admin["role"] != "admin":
         raise HTTPException(status_code=403)
 
-    await db.users.delete_one({"_id": ObjectId(user_id), "organization_id": org_id})
+    deleted = await db.users.find_one_and_delete({"_id": ObjectId(user_id), "organization_id": org_id})
+    invalidate_user_context(user_id)
+    if deleted:
+        await adjust_allocated_total(ObjectId(org_id), -((deleted.get("quota") or {}).get("monthly_limit") or 0))
     return {"message": "User deleted from organization"}
 
 @router.patch("/assign-agent")
@@ -210,18 +228,24 @@ async def assign_agent_to_user(user_id: str, agent_id: str, user: str = Depends(
         {"_id": ObjectId(user_id)},
         {"$set": {"agent_id": agent_id}}
     )
+    await revoke_user_tokens(user_id)
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="User not found or unchanged")
     return {"message": "Agent assigned successfully"}
 
 @router.patch("/update-quota")
 async def update_user_quota(user_id: str, quota: UserQuota, user: str = Depends(get_current_user)):
-    result = await get_collection("users").update_one(
-        {"_id": ObjectId(user_id)},
-        {"$set": {"quota": quota.dict()}}
-    )
-    if result.modified_count == 0:
+    target = await get_collection("users").find_one({"_id": ObjectId(user_id)}, {"organization_id": 1})
+    if target is None:
         raise HTTPException(status_code=404, detail="User not found or unchanged")
+    if target.get("organization_id"):
+        # Checked against the org's total_limit like the other quota routes
+        await allocate_user_quotas(ObjectId(target["organization_id"]), {target["_id"]: quota.monthly_limit})
+    else:
+        await get_collection("users").update_one(
+            {"_id": target["_id"]}, {"$set": {"quota.monthly_limit": quota.monthly_limit}}
+        )
+        invalidate_user_context(user_id)
     return {"message": "Quota updated successfully"}
 
 @router.get("/users", response_model=list[UserResponse])
@@ -247,7 +271,7 @@ async def get_organization_usage(org_id: str, current_user_tuple=Depends(get_cur
     user_id_from_token, _, _ = current_user_tuple
 
     # 1. Authorization
-    user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    user_doc = await get_cached_user(user_id_from_token)
     if not user_doc:
         logger.error(f"User not found for token ID: {user_id_from_token} when trying to access org usage for {org_id}")
         raise HTTPException(status_code=404, detail="Requesting user not found.")
@@ -281,18 +305,40 @@ async def get_organization_usage(org_id: str, current_user_tuple=Depends(get_cur
     # 3. Extract Usage Quota
     usage_quota_data = organization_doc.get("usage_quota", {}) # Default to empty dict if 'usage_quota' field doesn't exist
     total_limit = usage_quota_data.get("total_limit", 0) # Default to 0 if 'total_limit' doesn't exist
-    used = usage_quota_data.get("used", 0) # Default to 0 if 'used' doesn't exist
+    used = quota_used(usage_quota_data)
 
     logger.info(f"Successfully retrieved usage for org {org_id} by user {user_id_from_token}. Usage: {used}/{total_limit}")
     return OrganizationUsageResponse(total_limit=total_limit, used=used)
 
 
+@router.get("/{org_id}/leaderboard")
+async def get_organization_leaderboard(
+    org_id: str,
+    period: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}$"),
+    limit: int = Query(10, ge=1, le=settings.LEADERBOARD_SIZE),
+    current_user_tuple=Depends(get_current_user),
+):
+    """Top token users of the organization for a month (default: the current one)."""
+    user_id_from_token, _, _ = current_user_tuple
+    user_doc = await get_cached_user(user_id_from_token)
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="Requesting user not found.")
+
+    user_role = user_doc.get("role")
+    user_org_id_db = str(user_doc.get("organization_id")) if user_doc.get("organization_id") else None
+    if not (user_role == "admin" or (user_role == "organization_head" and user_org_id_db == org_id)):
+        logger.warning(f"User {user_id_from_token} (Role: {user_role}, Org: {user_org_id_db}) unauthorized to view leaderboard for org {org_id}.")
+        raise HTTPException(status_code=403, detail="User not authorized to view this organization's leaderboard.")
+
+    return await get_leaderboard(SCOPE_ORG, org_id, period=period, limit=limit)
+
+
 @router.get("/{org_id}/quota-details", response_model=OrgQuotaDetailsResponse)
 async def get_organization_quota_details(org_id: str, current_user_tuple=Depends(get_current_user)):
     user_id_from_token, _, _ = current_user_tuple
 
     # 1. Authorization
-    user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    user_doc = await get_cached_user(user_id_from_token)
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found.")
 
@@ -321,7 +367,7 @@ async def get_organization_quota_details(org_id: str, current_user_tuple=Depends
         id=str(organization_doc["_id"]),
         name=organization_doc["name"],
         total_quota_limit=org_quota_data.get("total_limit", 0),
-        total_quota_used=org_quota_data.get("used", 0)
+        total_quota_used=quota_used(org_quota_data)
     )
 
     # 3. Fetch Users Data for the Organization
@@ -334,8 +380,11 @@ async def get_organization_quota_details(org_id: str, current_user_tuple=Depends
             name=user_db_doc.get("name", "N/A"),
             email=user_db_doc["email"],
             monthly_limit=user_quota_data.get("monthly_limit", 0),
-            monthly_used=user_quota_data.get("used", 0)
+            monthly_used=quota_used(user_quota_data)
         ))
+    org_info.total_quota_allocated = org_quota_data.get(
+        "allocated_total", sum(u.monthly_limit for u in users_list_info)
+    )
 
     return OrgQuotaDetailsResponse(
         organization=org_info,
@@ -352,7 +401,7 @@ async def update_single_user_quota(
     user_id_from_token, _, _ = current_user_tuple
 
     # 1. Authorization
-    actor_user_doc = await db.users.find_one({"_id": ObjectId(user_id_from_token)})
+    actor_user_doc = await get_cached_user(user_id_from_token)
     if not actor_user_doc:
         raise HTTPException(status_code=404, detail="Requesting user not found.")
 
@@ -377,64 +426,11 @@ async def update_single_user_quota(
     if str(target_user_doc.get("organization_id")) != org_id:
         raise HTTPException(status_code=400, detail=f"Target user {user_db_id} does not belong to organization {org_id}.")
 
-    # 3. Fetch Organization
+    # 3. Allocate: the change is reserved against the org's total_limit atomically
     org_object_id = ObjectId(org_id)
-    organization_doc = await db.organizations.find_one({"_id": org_object_id})
-    if not organization_doc:
-        # This should ideally not happen if previous checks are fine, but good for robustness
-        raise HTTPException(status_code=404, detail=f"Organization with ID {org_id} not found.")
-
-    # 4. Payload Validation (already handled by Pydantic model for monthly_limit >= 0)
-    # No specific check needed here for payload.monthly_limit >= 0 due to Pydantic model
-
-    # 5. Total Quota Validation
-    organization_total_limit = organization_doc.get("usage_quota", {}).get("total_limit", 0)
-
-    other_users_cursor = db.users.find({
-        "organization_id": org_object_id,
-        "_id": {"$ne": target_user_obj_id} # Exclude the target user
-    })
-
-    sum_other_users_limits = 0
-    async for other_user in other_users_cursor:
-        sum_other_users_limits += other_user.get("quota", {}).get("monthly_limit", 0)
-
-    total_proposed_user_limits = sum_other_users_limits + payload.monthly_limit
-
-    if total_proposed_user_limits > organization_total_limit:
-        raise HTTPException(
-            status_code=400,
-            detail=(
-                f"Proposed total user quotas ({total_proposed_user_limits}) would exceed "
-                f"the organization's total quota limit ({organization_total_limit}). "
-                f"Current sum of other users' limits: {sum_other_users_limits}."
-            )
-        )
-
-    # 6. Database Update
-    # We need to ensure the 'quota' field exists. If not, create it.
-    # Using $set for "quota.monthly_limit" will create 'quota' if it doesn't exist,
-    # but it might be better to ensure the full quota structure if it's entirely missing.
-    # For now, assuming 'quota' object might exist or `.` notation handles it.
-    # A more robust update might look like:
-    # current_quota = target_user_doc.get("quota", {})
-    # current_quota["monthly_limit"] = payload.monthly_limit
-    # await db.users.update_one({"_id": target_user_obj_id}, {"$set": {"quota": current_quota}})
-    # However, the simpler "$set": {"quota.monthly_limit": ...} works if "quota" object already exists.
-    # If quota can be null or not present, a more careful update is needed.
-    # Let's ensure 'quota' exists and then update 'monthly_limit'
-
-    update_result = await db.users.update_one(
-        {"_id": target_user_obj_id},
-        {"$set": {"quota.monthly_limit": payload.monthly_limit}}
-        # Consider if quota.used should be reset or checked against new limit
-    )
+    [updated_user_doc] = await allocate_user_quotas(org_object_id, {target_user_obj_id: payload.monthly_limit})
 
-    if update_result.matched_count == 0: # Should not happen if user was fetched
-        raise HTTPException(status_code=404, detail="Target user not found during update attempt.")
-
-    # 7. Response
-    updated_user_doc = await db.users.find_one({"_id": target_user_obj_id})
+    # 4. Response
     updated_user_quota_data = updated_user_doc.get("quota", {})
 
     return UserQuotaInfo(
@@ -442,76 +438,58 @@ async def update_single_user_quota(
         name=updated_user_doc.get("name", "N/A"),
         email=updated_user_doc["email"],
         monthly_limit=updated_user_quota_data.get("monthly_limit", 0),
-        monthly_used=updated_user_quota_data.get("used", 0) # 'used' is not modified by this endpoint
+        monthly_used=quota_used(updated_user_quota_data) # 'used' is not modified by this endpoint
     )
 
+@router.patch("/{org_id}/users/quotas", response_model=List[UserQuotaInfo])
+async def update_user_quotas(
+    org_id: str,
+    payload: BulkQuotaAllocationPayload,
+    current_user_tuple=Depends(get_current_user)
+):
+    """Set many members' monthly limits in one validated, all-or-nothing allocation."""
+    user_id_from_token, _, _ = current_user_tuple
+
+    actor_user_doc = await get_cached_user(user_id_from_token)
+    if not actor_user_doc:
+        raise HTTPException(status_code=404, detail="Requesting user not found.")
+    actor_org_id_db = str(actor_user_doc.get("organization_id")) if actor_user_doc.get("organization_id") else None
+    if not (actor_user_doc.get("role") == "admin" or (actor_user_doc.get("role") == "organization_head" and actor_org_id_db == org_id)):
+        raise HTTPException(status_code=403, detail="User not authorized to update quotas for this organization.")
+
+    limits = {}
+    for allocation in payload.allocations:
+        if not ObjectId.is_valid(allocation.user_id):
+            raise HTTPException(status_code=400, detail=f"Invalid user ID {allocation.user_id}.")
+        limits[ObjectId(allocation.user_id)] = allocation.monthly_limit
+
+    users = await allocate_user_quotas(ObjectId(org_id), limits)
+    return [
+        UserQuotaInfo(
+            id=str(u["_id"]),
+            name=u.get("name", "N/A"),
+            email=u["email"],
+            monthly_limit=u["quota"]["monthly_limit"],
+            monthly_used=quota_used(u["quota"]),
+        )
+        for u in users
+    ]
+
 # Moved get_org_with_users to the end of GET routes with similar path structure
 @router.get("/{org_id}")
-async def get_org_with_users(org_id: str, user_id: str = Depends(verify_token)): # user_id from token is admin making request
-    actor_user_doc = await db.users.find_one({"_id": ObjectId(user_id)}) # Renamed to actor_user_doc for clarity
+async def get_org_with_users(
+    org_id: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=200),
+    user_id: str = Depends(verify_token), # user_id from token is admin making request
+):
+    actor_user_doc = await get_cached_user(user_id)
     if not actor_user_doc or (actor_user_doc["role"] != "admin" and actor_user_doc["role"] != "organization_head"): # Ensure requesting user is admin
         raise HTTPException(status_code=403, detail="User not authorized for this action.")
 
-    org_obj_id = ObjectId(org_id) # Renamed for clarity
-    org = await db.organizations.find_one({"_id": org_obj_id})
-    if not org:
+    # Org, one page of members (with this period's usage and assistant counts)
+    # and billing history from the invoice mirror, in one aggregation
+    dashboard = await get_org_dashboard(ObjectId(org_id), page=page, page_size=page_size)
+    if not dashboard:
         raise HTTPException(status_code=404, detail="Organization not found")
-
-    # Fetch users belonging to the organization
-    org_users = await db.users.find({"organization_id": org_obj_id}).to_list(length=None) # Renamed for clarity, fetch all
-
-    # The following enrichment logic can remain similar, ensuring variable names are consistent
-    billing_history = []
-    usage_logs = await db["usage"].find({
-        "user_id": {"$in": [str(u["_id"]) for u in org_users]}, # Use org_users
-        "timestamp": {"$gte": datetime.utcnow().replace(day=1)}
-    }).to_list(None)
-
-    usage_map = defaultdict(int)
-    for log in usage_logs:
-        usage_map[log["user_id"]] += log.get("tokens_used", 0)
-
-    if "stripe_customer_id" in org:
-        try:
-            invoices = stripe.Invoice.list(customer=org["stripe_customer_id"], limit=10)
-            for inv in invoices.auto_paging_iter():
-                billing_history.append({
-                    "date": datetime.fromtimestamp(inv["created"]).strftime("%Y-%m-%d"),
-                    "amount": round(inv["amount_paid"] / 100, 2),
-                    "status": inv["status"],
-                    "plan": inv.get("lines", {}).get("data", [{}])[0].get("plan", {}).get("nickname", "Unknown")
-                })
-        except Exception as e:
-            # Log stripe error, but don't fail the whole request
-            print(f"Error fetching Stripe invoices: {e}")
-
-
-    # Fetch assistant counts for users in this org
-    # Assuming assistants collection has 'created_by' field linking to user ObjectId
-    # And 'org_id' field linking to organization ObjectId
-    assistant_counts = await db.assistants.aggregate([
-        {"$match": {"org_id": str(org_obj_id)}}, # Match assistants by org_id
-        {"$group": {"_id": "$created_by", "count": {"$sum": 1}}} # Group by user who created assistant
-    ]).to_list(None)
-
-    assistant_map = {item["_id"]: item["count"] for item in assistant_counts}
-
-    processed_users = []
-    for u_doc in org_users: # Iterate over org_users
-        uid_str = str(u_doc["_id"])
-        # Create a dictionary from the BSON document for modification
-        user_data_dict = dict(u_doc)
-        user_data_dict["monthly_usage"] = usage_map.get(uid_str, 0)
-        user_data_dict["assistant_count"] = assistant_map.get(uid_str, 0) # Assuming created_by is string of user_id
-        processed_users.append(User(user_data_dict)) # Use User model for consistent response
-
-    return {
-        "org": {
-            "_id": str(org["_id"]), # Ensure org ID is string
-            "name": org["name"],
-            "plan": org.get("plan", "free"),
-            "quota": org.get("usage_quota", {}),
-            "billing_history": billing_history
-        },
-        "users": processed_users, # Return list of User model instances
-    }
+    return dashboard
@@ -15,6 +15,7 @@ from app.services.questionnaire import (
     generate_pdf,
 )
 from app.schemas.questionnaire import QAResult
+from app.services.local_index import RETRIEVAL_BACKEND_LOCAL, get_retrieval_backend
 
 router = APIRouter(prefix="/questionnaire", tags=["questionnaire"])
 openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
@@ -40,11 +41,14 @@ async def process_questions(
 
     file_bytes = await file.read()
 
-    assistant = await db.assistants.find_one({"org_id": ObjectId(org_id)})
-    if not assistant or not assistant.get("vector_store_id"):
-        logger.error(f"No assistant or vector store found for org_id: {org_id}")
-        raise HTTPException(status_code=400, detail="Organization has no vector store")
-    vector_store_id = assistant["vector_store_id"]
+    backend = await get_retrieval_backend(org_id)
+    vector_store_id = None
+    if backend != RETRIEVAL_BACKEND_LOCAL:
+        assistant = await db.assistants.find_one({"org_id": ObjectId(org_id)})
+        if not assistant or not assistant.get("vector_store_id"):
+            logger.error(f"No assistant or vector store found for org_id: {org_id}")
+            raise HTTPException(status_code=400, detail="Organization has no vector store")
+        vector_store_id = assistant["vector_store_id"]
 
     file_map: Dict[str, str] = {}
     docs_cursor = db.documents.find({"organization_id": org_id})
@@ -60,6 +64,8 @@ async def process_questions(
             vector_store_id,
             file_map,
             openai_client,
+            org_id=org_id,
+            backend=backend,
         )
     except ValueError as e:
         logger.error(f"Error processing questions for org_id: {org_id}, error: {e}")
@@ -22,3 +22,20 @@ class ChatResponse(BaseModel):
     messages: List[ChatMessage]
     createdAt: datetime = Field(default_factory=datetime.utcnow)
     thread_id: Optional[str] = None
+
+class ChatSummary(BaseModel):
+    id: str
+    title: str
+    updatedAt: Optional[datetime] = None
+    message_count: int = 0
+
+class ChatHistoryPage(BaseModel):
+    items: List[ChatSummary]
+    next_cursor: Optional[str] = None
+
+class ChatMessagesPage(BaseModel):
+    id: str
+    title: str
+    messages: List[ChatMessage]
+    message_count: int
+    next_before: Optional[int] = None  # pass as `before` to load older messages
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 class AgentEntry(BaseModel):
@@ -37,6 +37,7 @@ class AdminOrganizationUpdate(BaseModel):
     name: Optional[str] = None
     head_user_id: Optional[str] = None
     usage_quota: Optional[QuotaInfo] = None  # Admin can update quota if needed
+    retrieval_backend: Optional[Literal["openai", "local"]] = None  # Where questionnaire/chat retrieval runs
     # We might want to update other fields like quota in the future,
     # but for now, let's stick to name and head_user_id as per typical admin actions.
 
@@ -66,6 +67,7 @@ class OrgQuotaInfo(BaseModel):
     name: str
     total_quota_limit: int
     total_quota_used: int
+    total_quota_allocated: int = 0  # Sum of the members' monthly limits
 
 class OrgQuotaDetailsResponse(BaseModel):
     organization: OrgQuotaInfo
@@ -75,6 +77,13 @@ class OrgQuotaDetailsResponse(BaseModel):
 class UserQuotaUpdatePayload(BaseModel):
     monthly_limit: int = Field(..., ge=0) # Ensure non-negative
 
+# Model for PATCH /org/{org_id}/users/quotas endpoint
+class UserQuotaAllocation(UserQuotaUpdatePayload):
+    user_id: str
+
+class BulkQuotaAllocationPayload(BaseModel):
+    allocations: List[UserQuotaAllocation] = Field(..., min_length=1)
+
 class OrganizationUsageResponse(BaseModel):
     total_limit: int
     used: int
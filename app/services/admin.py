@@ -7,6 +7,7 @@ from docx import Document
 from fastapi import UploadFile
 
 from app.config import settings
+from app.services.citations import citation_resolver
 
 OPENAI_API = "https://api.openai.com/v1"
 HEADERS = {
@@ -37,6 +38,7 @@ class OpenAIAdminService:
                     resp.raise_for_status()
                     file_id = resp.json()["id"]
                     file_ids.append(file_id)
+                    citation_resolver.remember(file_id, name)
                     print(f"✅ Uploaded {name} → {file_id}")
                 except httpx.HTTPStatusError as e:
                     print(f"❌ Upload failed for {name}: {e.response.status_code} - {e.response.text}")
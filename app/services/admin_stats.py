@@ -0,0 +1,96 @@
+import asyncio
+from typing import List
+
+from app.db import db
+from app.utils.context import as_object_id
+from app.utils.quota_periods import current_period, flat_counter_expr, usage_field
+
+# All admin stats are computed by the server; only final numbers come back.
+# Cross-collection references are stored as strings, hence the conversions.
+
+
+def _lookup_by_id(collection: str, local_field: str, project: dict, as_field: str) -> dict:
+    return {"$lookup": {
+        "from": collection,
+        "let": {"ref_id": as_object_id(local_field)},
+        "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$ref_id"]}}}, {"$project": project}],
+        "as": as_field,
+    }}
+
+
+def _first(field: str, default=None) -> dict:
+    return {"$ifNull": [{"$arrayElemAt": [field, 0]}, default]}
+
+
+def _period_tokens(doc: str, period: str) -> dict:
+    """A usage doc's tokens this period; docs not yet on period counters use the flat one."""
+    return {"$cond": [
+        {"$eq": [{"$type": f"{doc}.periods"}, "missing"]},
+        flat_counter_expr(doc, "token_usage_monthly", period),
+        {"$ifNull": [f"{doc}.{usage_field('tokens', period)}", 0]},
+    ]}
+
+
+async def get_summary(database=None) -> dict:
+    database = db if database is None else database
+    period = current_period()
+    roles, tokens, orgs_total, pending = await asyncio.gather(
+        database["users"].aggregate([{"$group": {"_id": "$role", "count": {"$sum": 1}}}]).to_list(length=None),
+        database["usage"].aggregate([
+            {"$group": {"_id": None, "tokens": {"$sum": _period_tokens("$$ROOT", period)}}},
+        ]).to_list(length=1),
+        database["organizations"].count_documents({}),
+        database["quota_requests"].count_documents({"status": "pending"}),
+    )
+    breakdown = {str(row["_id"]): row["count"] for row in roles}
+    return {
+        "users_total": sum(breakdown.values()),
+        "users_breakdown": breakdown,
+        "orgs_total": orgs_total,
+        "tokens_used": tokens[0]["tokens"] if tokens else 0,
+        "quota_requests_pending": pending,
+    }
+
+
+def tokens_per_organization_pipeline(period: str = None) -> List[dict]:
+    # Equality $lookup on the indexed usage.user_id; cheaper than a per-document sub-pipeline
+    period = period or current_period()
+    return [
+        {"$project": {"organization_id": 1, "uid": {"$toString": "$_id"}}},
+        {"$lookup": {"from": "usage", "localField": "uid", "foreignField": "user_id", "as": "usage"}},
+        {"$match": {"usage.0": {"$exists": True}}},
+        {"$group": {"_id": "$organization_id", "tokens": {"$sum": {"$sum": {
+            "$map": {"input": "$usage", "in": _period_tokens("$$this", period)},
+        }}}}},
+        _lookup_by_id("organizations", "_id", {"name": 1}, "org"),
+        {"$project": {"_id": 0, "org": _first("$org.name", "—"), "tokens": 1}},
+    ]
+
+
+async def get_tokens_per_organization(database=None) -> List[dict]:
+    database = db if database is None else database
+    return await database["users"].aggregate(tokens_per_organization_pipeline()).to_list(length=None)
+
+
+def assistant_stats_pipeline() -> List[dict]:
+    # Assistants carry org_id as an ObjectId or, in older documents, a string:
+    # one equality $lookup per form, both served by the org_id index
+    return [
+        {"$project": {"name": 1, "id_str": {"$toString": "$_id"}}},
+        {"$lookup": {"from": "assistants", "localField": "_id", "foreignField": "org_id", "as": "by_oid"}},
+        {"$lookup": {"from": "assistants", "localField": "id_str", "foreignField": "org_id", "as": "by_str"}},
+        {"$project": {"name": 1, "assistants": {"$concatArrays": ["$by_oid", "$by_str"]}}},
+        {"$project": {
+            "_id": 0,
+            "organization": "$name",
+            "assistant_count": {"$size": "$assistants"},
+            "total_files": {"$sum": {"$map": {
+                "input": "$assistants", "in": {"$size": {"$ifNull": ["$$this.file_ids", []]}},
+            }}},
+        }},
+    ]
+
+
+async def get_assistant_stats(database=None) -> List[dict]:
+    database = db if database is None else database
+    return await database["organizations"].aggregate(assistant_stats_pipeline()).to_list(length=None)
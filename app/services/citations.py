@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+
+from pymongo.errors import PyMongoError
+
+from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+
+Citation = Tuple[str, int]  # (display name, page)
+
+
+def parse_citation_name(filename: str) -> Citation:
+    """Split ``report.pdf_chunk_3.txt`` into ``("report.pdf", 4)``."""
+    if "_chunk_" not in filename:
+        return filename, 1
+    base_name, rest = filename.split("_chunk_", 1)
+    try:
+        return base_name, int(rest.split(".")[0]) + 1
+    except ValueError:
+        return base_name, 1
+
+
+class CitationResolver:
+    """Resolves cited OpenAI file ids to (display name, page).
+
+    Known ids are answered from an in-process LRU that uploads populate via
+    ``remember``; the rest are loaded with a single ``$in`` query.
+    """
+
+    def __init__(self, max_entries: int = settings.CITATION_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Citation]" = OrderedDict()
+
+    def _put(self, file_id: str, citation: Citation):
+        self._entries[file_id] = citation
+        self._entries.move_to_end(file_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def remember(self, file_id: str, filename: str):
+        self._put(file_id, parse_citation_name(filename))
+
+    def forget(self, file_id: str):
+        self._entries.pop(file_id, None)
+
+    async def resolve(self, file_ids: Iterable[str]) -> Dict[str, Citation]:
+        wanted = list(dict.fromkeys(fid for fid in file_ids if fid))
+        resolved = {}
+        missing = []
+        for fid in wanted:
+            if fid in self._entries:
+                self._entries.move_to_end(fid)
+                resolved[fid] = self._entries[fid]
+            else:
+                missing.append(fid)
+
+        if missing:
+            try:
+                cursor = db.documents.find(
+                    {"openai_file_id": {"$in": missing}}, {"openai_file_id": 1, "filename": 1}
+                )
+                async for doc in cursor:
+                    self.remember(doc["openai_file_id"], doc.get("filename") or doc["openai_file_id"])
+                    resolved[doc["openai_file_id"]] = self._entries[doc["openai_file_id"]]
+            except PyMongoError as e:
+                logger.error(f"Failed to resolve citations {missing}: {e}")
+            for fid in missing:
+                resolved.setdefault(fid, parse_citation_name(fid))
+        return resolved
+
+
+citation_resolver = CitationResolver()
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from pymongo import DESCENDING
+
+from app.config import settings
+from app.db import db
+from app.services.admin_stats import get_assistant_stats, get_summary, get_tokens_per_organization
+from app.services.leaderboard import get_leaderboard
+from app.services.usage_events import ALL_KEY, SCOPE_ALL, USAGE_EVENTS, get_daily_series
+from app.tasks.usage_rollup import ROLLUP_STATE_ID
+from app.utils.logger import logger
+
+SNAPSHOT_ID = "admin"
+
+
+async def _usage_section() -> dict:
+    per_organization, daily_usage = await asyncio.gather(
+        get_tokens_per_organization(), get_daily_series(SCOPE_ALL, ALL_KEY, days=30)
+    )
+    return {"per_organization": per_organization, "daily_usage": daily_usage}
+
+
+async def _top_users_section() -> list:
+    return await get_leaderboard(limit=10)
+
+
+SECTIONS = {
+    "summary": get_summary,
+    "usage": _usage_section,
+    "top_users": _top_users_section,
+    "assistants": get_assistant_stats,
+}
+# Sections to recompute when new usage events arrive / when a usage rollup
+# lands / when the collection fingerprint (document counts) changes
+EVENT_SECTIONS = {"summary", "top_users"}
+ROLLUP_SECTIONS = {"usage"}
+STRUCTURE_SECTIONS = {"summary", "assistants"}
+
+
+def _etag(data: Any) -> str:
+    raw = json.dumps(jsonable_encoder(data), sort_keys=True, default=str)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest() + '"'
+
+
+async def _latest_usage_event() -> Optional[datetime]:
+    event = await db[USAGE_EVENTS].find_one({}, {"ts": 1}, sort=[("ts", DESCENDING)])
+    return event["ts"] if event else None
+
+
+async def _latest_rollup() -> Optional[datetime]:
+    state = await db.rollup_state.find_one({"_id": ROLLUP_STATE_ID}, {"watermark": 1})
+    return state["watermark"] if state else None
+
+
+async def _fingerprint() -> list:
+    return list(await asyncio.gather(
+        db.users.estimated_document_count(),
+        db.organizations.estimated_document_count(),
+        db.assistants.estimated_document_count(),
+        db.quota_requests.count_documents({"status": "pending"}),
+    ))
+
+
+async def refresh_dashboard_snapshot(force: bool = False) -> dict:
+    """Recompute the sections of the admin dashboard snapshot whose inputs changed.
+
+    Sections reading live counters follow the usage event log, the usage
+    charts follow the rollup watermark, the rest follow a cheap fingerprint of
+    collection counts; missing sections are always computed, and everything
+    is rebuilt once the snapshot is older than
+    ``DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS``.
+    """
+    now = datetime.utcnow()
+    snapshot = await db.dashboard_snapshots.find_one({"_id": SNAPSHOT_ID}) or {}
+    latest_event, latest_rollup, fingerprint = await asyncio.gather(
+        _latest_usage_event(), _latest_rollup(), _fingerprint()
+    )
+
+    full_refresh_at = snapshot.get("full_refresh_at")
+    if force or not full_refresh_at or (now - full_refresh_at).total_seconds() > settings.DASHBOARD_SNAPSHOT_MAX_AGE_SECONDS:
+        stale = set(SECTIONS)
+        full_refresh_at = now
+    else:
+        stale = set(SECTIONS) - set(snapshot.get("sections", {}))
+        if latest_event and latest_event != snapshot.get("usage_watermark"):
+            stale |= EVENT_SECTIONS
+        if latest_rollup and latest_rollup != snapshot.get("rollup_watermark"):
+            stale |= ROLLUP_SECTIONS
+        if fingerprint != snapshot.get("fingerprint"):
+            stale |= STRUCTURE_SECTIONS
+    if not stale:
+        return snapshot
+
+    names = sorted(stale)
+    results = await asyncio.gather(*(SECTIONS[name]() for name in names))
+    sections = dict(snapshot.get("sections", {}))
+    for name, data in zip(names, results):
+        sections[name] = {"data": jsonable_encoder(data), "etag": _etag(data)}
+
+    snapshot = {
+        "_id": SNAPSHOT_ID,
+        "sections": sections,
+        "usage_watermark": latest_event,
+        "rollup_watermark": latest_rollup,
+        "fingerprint": fingerprint,
+        "refreshed_at": now,
+        "full_refresh_at": full_refresh_at,
+    }
+    await db.dashboard_snapshots.replace_one({"_id": SNAPSHOT_ID}, snapshot, upsert=True)
+    logger.info(f"📸 Dashboard snapshot refreshed: {', '.join(names)}")
+    return snapshot
+
+
+_cached: Tuple[float, Optional[dict]] = (0.0, None)
+# One reload (or rebuild) at a time per worker; waiters reuse its result
+_refresh_lock = asyncio.Lock()
+
+
+def _cached_snapshot(name: str) -> Optional[dict]:
+    expires_at, snapshot = _cached
+    if snapshot is None or expires_at < time.monotonic() or name not in snapshot.get("sections", {}):
+        return None
+    return snapshot
+
+
+async def get_dashboard_section(name: str) -> Tuple[Any, str]:
+    """Return ``(data, etag)`` for a snapshot section.
+
+    Workers re-read the snapshot document at most every
+    ``DASHBOARD_SNAPSHOT_CACHE_SECONDS``, so serving the dashboard costs the
+    same however many admins have it open.
+    """
+    global _cached
+    snapshot = _cached_snapshot(name)
+    if snapshot is None:
+        async with _refresh_lock:
+            snapshot = _cached_snapshot(name)  # loaded by the request we waited on
+            if snapshot is None:
+                snapshot = await db.dashboard_snapshots.find_one({"_id": SNAPSHOT_ID})
+                if not snapshot or name not in snapshot.get("sections", {}):
+                    snapshot = await refresh_dashboard_snapshot()
+                _cached = (time.monotonic() + settings.DASHBOARD_SNAPSHOT_CACHE_SECONDS, snapshot)
+    section = snapshot["sections"][name]
+    return section["data"], section["etag"]
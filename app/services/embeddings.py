@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import fcntl
+import asyncio
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+import tiktoken
+
+from app.config import settings
+from app.utils.logger import logger
+
+_tokenizer = tiktoken.get_encoding("cl100k_base")
+
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.txt"
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache: a memory-mapped float32 array plus a key index.
+
+    ``keys.txt`` maps a (model, text) hash to its row in ``vectors.f32``.
+    Appends take an exclusive file lock so several workers can share one
+    cache directory; each process picks up rows written by the others the
+    next time it misses. Within a process, a thread lock serialises access to
+    the key index and the mapping, since lookups and appends run in worker
+    threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rows: Dict[str, int] = {}
+        self._keys_offset = 0
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _refresh(self):
+        """Read key lines appended since the last refresh. Caller holds ``_lock``."""
+        if self._dim is None and os.path.exists(self._file(META_FILE)):
+            with open(self._file(META_FILE), "r", encoding="utf-8") as f:
+                self._dim = json.load(f)["dim"]
+        if not os.path.exists(self._file(KEYS_FILE)):
+            return
+        with open(self._file(KEYS_FILE), "r", encoding="utf-8") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break  # partially written by another process; read it next time
+                key, row = line.split()
+                self._rows[key] = int(row)
+                self._keys_offset += len(line.encode("utf-8"))
+        self._matrix = None
+
+    def _vectors(self) -> Optional[np.memmap]:
+        if self._matrix is None and self._rows:
+            rows = max(self._rows.values()) + 1
+            self._matrix = np.memmap(self._file(VECTORS_FILE), dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return self._matrix
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        with self._lock:
+            if any(k not in self._rows for k in keys):
+                self._refresh()
+            found = [k for k in keys if k in self._rows]
+            if not found:
+                return {}
+            matrix = self._vectors()
+            return {k: np.array(matrix[self._rows[k]]) for k in found}
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, open(self._file(LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                if self._dim is None:
+                    self._dim = int(vectors.shape[1])
+                    with open(self._file(META_FILE), "w", encoding="utf-8") as f:
+                        json.dump({"dim": self._dim}, f)
+                new = [(k, v) for k, v in zip(keys, vectors) if k not in self._rows]
+                if not new:
+                    return
+                size = os.path.getsize(self._file(VECTORS_FILE)) if os.path.exists(self._file(VECTORS_FILE)) else 0
+                start = size // (self._dim * 4)
+                with open(self._file(VECTORS_FILE), "ab") as f:
+                    f.write(np.stack([v for _, v in new]).astype(np.float32).tobytes())
+                with open(self._file(KEYS_FILE), "a", encoding="utf-8") as f:
+                    f.write("".join(f"{k} {start + i}\n" for i, (k, _) in enumerate(new)))
+                self._refresh()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class RateLimiter:
+    """Spaces requests so no more than ``requests_per_minute`` start per minute."""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class EmbeddingService:
+    """Embeds texts in token-bounded batches with an on-disk vector cache.
+
+    Only cache misses reach the embeddings endpoint. Misses are split into
+    batches of at most ``max_batch_tokens`` tokens / ``max_batch_inputs``
+    inputs, sent concurrently (bounded by ``max_concurrency`` and the rate
+    limiter) over an async HTTP client so callers never block the event loop.
+    """
+
+    def __init__(
+        self,
+        model: str = settings.EMBEDDING_MODEL,
+        cache_dir: str = settings.EMBEDDING_CACHE_DIR,
+        api_base: str = settings.OPENAI_API_BASE,
+        api_key: str = settings.OPENAI_API_KEY,
+        max_batch_tokens: int = settings.EMBEDDING_BATCH_MAX_TOKENS,
+        max_batch_inputs: int = settings.EMBEDDING_BATCH_MAX_INPUTS,
+        max_concurrency: int = settings.EMBEDDING_MAX_CONCURRENCY,
+        requests_per_minute: int = settings.EMBEDDING_REQUESTS_PER_MINUTE,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.model = model
+        self.api_base = api_base.rstrip("/")
+        self.api_key = api_key
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_inputs = max_batch_inputs
+        self.cache = EmbeddingCache(os.path.join(cache_dir, model))
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = RateLimiter(requests_per_minute)
+        self._transport = transport
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        batches, current, current_tokens = [], [], 0
+        for text in texts:
+            tokens = len(_tokenizer.encode(text))
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_inputs):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _request(self, client: httpx.AsyncClient, batch: List[str]) -> np.ndarray:
+        async with self._semaphore:
+            await self._rate_limiter.wait()
+            resp = await client.post(
+                f"{self.api_base}/embeddings",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                json={"model": self.model, "input": batch},
+            )
+            resp.raise_for_status()
+        data = sorted(resp.json()["data"], key=lambda record: record["index"])
+        return np.array([record["embedding"] for record in data], dtype=np.float32)
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [cache_key(self.model, t) for t in texts]
+        cached = await asyncio.to_thread(self.cache.get_many, keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+
+        if missing:
+            batches = self._batches(list(missing.values()))
+            logger.info(
+                f"📡 Embedding {len(missing)} texts in {len(batches)} batches "
+                f"({len(texts) - len(missing)} cache hits)"
+            )
+            async with httpx.AsyncClient(timeout=60.0, transport=self._transport) as client:
+                results = await asyncio.gather(*(self._request(client, b) for b in batches))
+            vectors = np.concatenate(results)
+            new_keys = list(missing.keys())
+            await asyncio.to_thread(self.cache.put_many, new_keys, vectors)
+            cached.update(zip(new_keys, vectors))
+        else:
+            logger.info(f"✅ All {len(texts)} embeddings served from cache")
+
+        return np.stack([cached[k] for k in keys]).astype(np.float32)
+
+
+embedding_service = EmbeddingService()
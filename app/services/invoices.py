@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import stripe
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+
+# Local mirror of Stripe invoices; billing views read only from here.
+INVOICES = "billing_events"
+SYNC_STATE_ID = "stripe_invoices"
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+
+
+def _as_dict(obj) -> dict:
+    return obj.to_dict() if hasattr(obj, "to_dict") else dict(obj)
+
+
+def invoice_doc(invoice) -> dict:
+    """Flatten a Stripe invoice into the mirror's document shape."""
+    invoice = _as_dict(invoice)
+    lines = (invoice.get("lines") or {}).get("data") or [{}]
+    plan = lines[0].get("plan") or (lines[0].get("price") or {})
+    return {
+        "_id": invoice["id"],
+        "customer": invoice.get("customer"),
+        "amount_paid": invoice.get("amount_paid", 0),
+        "currency": invoice.get("currency", "usd"),
+        "status": invoice.get("status", "unknown"),
+        "created": datetime.utcfromtimestamp(invoice.get("created", 0)).isoformat(),
+        "hosted_invoice_url": invoice.get("hosted_invoice_url"),
+        "plan": plan.get("nickname") or "Unknown",
+        "synced_at": datetime.utcnow(),
+    }
+
+
+async def upsert_invoice(invoice, event_created: int = 0):
+    """Mirror an invoice from a webhook event, unless a newer event already
+    updated it (Stripe doesn't deliver events in order)."""
+    doc = {**invoice_doc(invoice), "stripe_event_created": event_created}
+    try:
+        await db[INVOICES].update_one(
+            {"_id": doc["_id"], "$or": [
+                {"stripe_event_created": {"$exists": False}},
+                {"stripe_event_created": {"$lte": event_created}},
+            ]},
+            {"$set": doc},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The invoice exists and a newer event has been applied to it
+        logger.info(f"Skipped stale event for invoice {doc['_id']}")
+
+
+def _list_invoices(created_gte: Optional[int]) -> List[dict]:
+    """Walk Stripe's invoice pagination; blocking, so run it in a thread."""
+    params = {"limit": 100}
+    if created_gte is not None:
+        params["created"] = {"gte": created_gte}
+    return [_as_dict(inv) for inv in stripe.Invoice.list(**params).auto_paging_iter()]
+
+
+async def sync_invoices(now: datetime = None) -> int:
+    """Mirror recently created invoices; the first run mirrors all of them.
+
+    Only invoices created within ``INVOICE_SYNC_LOOKBACK_DAYS`` are re-read, so
+    late status changes inside a billing cycle are picked up; webhooks cover
+    the rest as they happen.
+    """
+    now = now or datetime.utcnow()
+    state = await db.sync_state.find_one({"_id": SYNC_STATE_ID})
+    created_gte = None
+    if state:
+        since = min(state["synced_at"], now - timedelta(days=settings.INVOICE_SYNC_LOOKBACK_DAYS))
+        created_gte = int((since - datetime(1970, 1, 1)).total_seconds())
+
+    try:
+        invoices = await asyncio.to_thread(_list_invoices, created_gte)
+    except stripe.StripeError as e:
+        logger.error(f"❌ Stripe invoice sync failed: {e}")
+        return 0
+
+    if invoices:
+        await db[INVOICES].bulk_write(
+            [UpdateOne({"_id": doc["_id"]}, {"$set": doc}, upsert=True) for doc in map(invoice_doc, invoices)],
+            ordered=False,
+        )
+    await db.sync_state.update_one({"_id": SYNC_STATE_ID}, {"$set": {"synced_at": now}}, upsert=True)
+    logger.info(f"🧾 Synced {len(invoices)} Stripe invoices")
+    return len(invoices)
+
+
+async def get_customer_invoices(customer_id: str, limit: int = 10) -> List[dict]:
+    return await (
+        db[INVOICES].find({"customer": customer_id})
+        .sort("created", DESCENDING)
+        .limit(limit)
+        .to_list(length=limit)
+    )
@@ -0,0 +1,141 @@
+from typing import List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+from app.utils.quota_periods import current_period
+
+SCOPE_GLOBAL, SCOPE_ORG = "global", "org"
+GLOBAL_KEY = "*"
+
+
+def board_id(scope: str, key: str, period: str) -> str:
+    return f"{scope}:{key}:{period}"
+
+
+async def _raise_entry(_id: str, user_id: str, tokens: int) -> bool:
+    # $max, not $set: a slower concurrent charge must not lower a newer total
+    raised = await db.leaderboards.update_one(
+        {"_id": _id, "entries.user_id": user_id},
+        {"$max": {"entries.$.tokens": tokens}},
+    )
+    if raised.matched_count:
+        await db.leaderboards.update_one(
+            {"_id": _id},
+            {"$push": {"entries": {"$each": [], "$sort": {"tokens": -1}}}},
+        )
+    return bool(raised.matched_count)
+
+
+async def _update_board(scope: str, key: str, period: str, user_id: str, tokens: int, size: int):
+    """Place ``user_id`` with its new monthly ``tokens`` on one bounded board.
+
+    Totals only grow, so an entry already on the board is raised in place and
+    re-sorted; otherwise the user is pushed only if they are not on the board
+    yet and it has room or they beat its last entry, and ``$slice`` keeps it
+    at ``size``.
+    """
+    _id = board_id(scope, key, period)
+    if await _raise_entry(_id, user_id, tokens):
+        return
+    entry = {"user_id": user_id, "tokens": tokens}
+    has_room = {
+        "_id": _id,
+        "entries.user_id": {"$ne": user_id},
+        "$or": [
+            {f"entries.{size - 1}": {"$exists": False}},
+            {f"entries.{size - 1}.tokens": {"$lt": tokens}},
+        ],
+    }
+    push = {"$push": {"entries": {"$each": [entry], "$sort": {"tokens": -1}, "$slice": size}}}
+    try:
+        await db.leaderboards.update_one(
+            has_room, {**push, "$setOnInsert": {"scope": scope, "key": key, "period": period}}, upsert=True
+        )
+    except DuplicateKeyError:
+        # The board exists: it is full and the user does not make the cut, a
+        # concurrent charge just created it, or a concurrent charge of the
+        # same user pushed them first and only their total needs raising
+        pushed = await db.leaderboards.update_one(has_room, push)
+        if not pushed.matched_count:
+            await _raise_entry(_id, user_id, tokens)
+
+
+async def record_charge(user_id, org_id, tokens_used: int, size: int = settings.LEADERBOARD_SIZE):
+    """Add a quota charge to the user's monthly total and update the global and
+    org leaderboards. Failures are logged, never raised into the request."""
+    if tokens_used <= 0:
+        return
+    user_id = str(user_id)
+    org_id = str(org_id) if org_id else None
+    period = current_period()
+    try:
+        total = await db.leaderboard_totals.find_one_and_update(
+            {"_id": f"{period}:{user_id}"},
+            {
+                "$inc": {"tokens": tokens_used},
+                "$set": {"org_id": org_id},
+                "$setOnInsert": {"user_id": user_id, "period": period},
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        await _update_board(SCOPE_GLOBAL, GLOBAL_KEY, period, user_id, total["tokens"], size)
+        if org_id:
+            await _update_board(SCOPE_ORG, org_id, period, user_id, total["tokens"], size)
+    except PyMongoError as e:
+        logger.error(f"Failed to update leaderboards for user {user_id}: {e}")
+
+
+def _object_ids(ids) -> List[ObjectId]:
+    result = []
+    for value in ids:
+        try:
+            result.append(ObjectId(value))
+        except (InvalidId, TypeError):
+            continue
+    return result
+
+
+async def get_leaderboard(
+    scope: str = SCOPE_GLOBAL, key: str = GLOBAL_KEY, period: Optional[str] = None, limit: int = 10
+) -> List[dict]:
+    """Top ``limit`` users of a board with their email, role and organization name."""
+    board = await db.leaderboards.find_one(
+        {"_id": board_id(scope, key, period or current_period())},
+        {"entries": {"$slice": limit}},
+    )
+    entries = (board or {}).get("entries", [])
+    if not entries:
+        return []
+
+    users = await db.users.find(
+        {"_id": {"$in": _object_ids(e["user_id"] for e in entries)}},
+        {"email": 1, "role": 1, "organization_id": 1},
+    ).to_list(length=len(entries))
+    users_by_id = {str(u["_id"]): u for u in users}
+    org_ids = {str(u["organization_id"]) for u in users if u.get("organization_id")}
+    orgs = await db.organizations.find(
+        {"_id": {"$in": _object_ids(org_ids)}}, {"name": 1}
+    ).to_list(length=len(org_ids))
+    org_names = {str(o["_id"]): o.get("name") for o in orgs}
+
+    leaderboard = []
+    for entry in entries:
+        user = users_by_id.get(entry["user_id"])
+        if not user:
+            continue
+        org_id = user.get("organization_id")
+        leaderboard.append({
+            "user_id": entry["user_id"],
+            "email": user.get("email"),
+            "role": user.get("role"),
+            "organization": org_names.get(str(org_id)) if org_id else None,
+            "tokens_used": entry["tokens"],
+        })
+    return leaderboard
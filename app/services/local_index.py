@@ -0,0 +1,321 @@
+import os
+import json
+import fcntl
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from app.config import settings
+from app.db import db
+from app.services.organization import OpenAIOrganizationService
+from app.utils.logger import logger
+
+# Retrieval backends selectable per organization (organizations.retrieval_backend)
+RETRIEVAL_BACKEND_OPENAI = "openai"
+RETRIEVAL_BACKEND_LOCAL = "local"
+RETRIEVAL_BACKENDS = (RETRIEVAL_BACKEND_OPENAI, RETRIEVAL_BACKEND_LOCAL)
+# Set on an org whose switch to the local backend is waiting for documents
+# that could not be backfilled to be uploaded again
+LOCAL_INDEX_PENDING = "local_index_pending"
+
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.jsonl"
+HEADER_FILE = "index.json"
+LOCK_FILE = ".lock"
+
+# An embedder turns a batch of texts into a (len(texts), dim) float32 matrix
+Embedder = Callable[[List[str]], Awaitable[np.ndarray]]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class LocalVectorIndex:
+    """Chunk embeddings stored as a memory-mapped float32 matrix.
+
+    Rows are L2-normalised on insert so cosine similarity is a plain dot
+    product. ``meta.jsonl`` holds one metadata record per row (filename,
+    file id, page, chunk text). With ``quantize=True`` searches first scan an
+    int8 copy of the matrix and re-score the best candidates in float32.
+
+    Several workers can share one index directory: writers take an exclusive
+    file lock and re-read the header under it, readers take a shared lock
+    when they (re)map the files and notice other writers by the header
+    changing on disk.
+    """
+
+    def __init__(self, path: str, quantize: bool = False):
+        self.path = path
+        self.quantize = quantize
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._header = {"dim": None, "count": 0}
+        self._matrix: Optional[np.memmap] = None
+        self._quantized: Optional[np.ndarray] = None
+        self._meta: Optional[List[dict]] = None
+
+    # --- storage ---
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(LOCK_FILE), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_header(self) -> dict:
+        try:
+            with open(self._file(HEADER_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"dim": None, "count": 0}
+
+    def _save_header(self, header: dict):
+        tmp = self._file(HEADER_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp, self._file(HEADER_FILE))
+
+    def _replace(self, name: str, data: bytes):
+        tmp = self._file(name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._file(name))
+
+    def _header_stamp(self):
+        try:
+            st = os.stat(self._file(HEADER_FILE))
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _check_stamp(self):
+        """Drop cached views if any writer, in any process, changed the index. Caller holds ``_lock``."""
+        stamp = self._header_stamp()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._header = self._load_header()
+            self._matrix = None
+            self._quantized = None
+            self._meta = None
+
+    @property
+    def dim(self) -> Optional[int]:
+        with self._lock:
+            self._check_stamp()
+            return self._header.get("dim")
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._check_stamp()
+            return self._header.get("count", 0)
+
+    def _read(self, header: dict) -> Tuple[Optional[np.ndarray], List[dict]]:
+        count, dim = header.get("count", 0), header.get("dim")
+        matrix = None
+        if count:
+            matrix = np.memmap(self._file(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, dim))
+        meta = []
+        if os.path.exists(self._file(META_FILE)):
+            with open(self._file(META_FILE), "r", encoding="utf-8") as f:
+                meta = [json.loads(line) for line in f if line.strip()][:count]
+        return matrix, meta
+
+    def _load(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray], List[dict]]:
+        """A consistent (matrix, int8 matrix, metadata) snapshot for searching."""
+        with self._lock:
+            self._check_stamp()
+            if self._meta is None:
+                with self._file_lock(exclusive=False):
+                    self._stamp = self._header_stamp()
+                    self._header = self._load_header()
+                    self._matrix, self._meta = self._read(self._header)
+                if self.quantize and self._matrix is not None:
+                    self._quantized = np.round(np.asarray(self._matrix) * 127).astype(np.int8)
+            return self._matrix, self._quantized, self._meta
+
+    def add(self, vectors: np.ndarray, metadata: List[dict]):
+        vectors = _normalize(vectors)
+        if len(vectors) != len(metadata):
+            raise ValueError("vectors and metadata must have the same length")
+
+        with self._lock, self._file_lock(exclusive=True):
+            # Another worker may have appended since we last looked
+            header = self._load_header()
+            if header.get("dim") is None:
+                header["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != header["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {header['dim']}")
+
+            with open(self._file(VECTORS_FILE), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(self._file(META_FILE), "a", encoding="utf-8") as f:
+                for record in metadata:
+                    f.write(json.dumps(record) + "\n")
+            header["count"] = header.get("count", 0) + len(vectors)
+            self._save_header(header)
+            # The next search remaps the grown file
+            self._stamp = None
+
+    def remove_file(self, file_id: str) -> int:
+        """Rewrite the index without the chunks of ``file_id``."""
+        with self._lock, self._file_lock(exclusive=True):
+            header = self._load_header()
+            matrix, meta = self._read(header)
+            keep = [i for i, m in enumerate(meta) if m.get("file_id") != file_id]
+            removed = len(meta) - len(keep)
+            if not removed:
+                return 0
+            vectors = np.asarray(matrix)[keep] if keep else np.zeros((0, header["dim"]), dtype=np.float32)
+            del matrix
+            # Replace rather than rewrite in place: readers in other processes
+            # keep their mapping of the old file until they remap
+            self._replace(VECTORS_FILE, vectors.tobytes())
+            self._replace(META_FILE, "".join(json.dumps(meta[i]) + "\n" for i in keep).encode("utf-8"))
+            header["count"] = len(keep)
+            self._save_header(header)
+            self._stamp = None
+            return removed
+
+    # --- search ---
+    def file_ids(self) -> Set[str]:
+        """Ids of the files that have rows in the index."""
+        _, _, meta = self._load()
+        return {m["file_id"] for m in meta if m.get("file_id")}
+
+    def search(self, query_vectors: np.ndarray, k: int = 5) -> List[List[Tuple[float, dict]]]:
+        """Return the ``k`` best ``(score, metadata)`` pairs for each query row."""
+        queries = _normalize(query_vectors)
+        matrix, quantized, meta = self._load()
+        if matrix is None or not meta:
+            return [[] for _ in range(len(queries))]
+        n = len(matrix)
+        k = min(k, n)
+
+        if self.quantize:
+            q8 = np.round(queries * 127).astype(np.int8)
+            approx = q8.astype(np.int32) @ quantized.astype(np.int32).T
+            n_candidates = min(n, max(k * 4, k))
+            candidates = np.argpartition(-approx, n_candidates - 1, axis=1)[:, :n_candidates]
+            scores = np.einsum("bd,bcd->bc", queries, np.asarray(matrix)[candidates])
+        else:
+            candidates = None
+            scores = queries @ np.asarray(matrix).T
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, idx in enumerate(top):
+            ordered = idx[np.argsort(-scores[row, idx])]
+            hits = []
+            for col in ordered:
+                meta_idx = candidates[row, col] if candidates is not None else col
+                hits.append((float(scores[row, col]), meta[meta_idx]))
+            results.append(hits)
+        return results
+
+
+_indexes: Dict[str, LocalVectorIndex] = {}
+
+
+def get_org_index(org_id: str) -> LocalVectorIndex:
+    """Return the process-wide index for ``org_id``, opening it on first use."""
+    org_id = str(org_id)
+    index = _indexes.get(org_id)
+    if index is None:
+        index = LocalVectorIndex(
+            os.path.join(settings.LOCAL_INDEX_DIR, org_id),
+            quantize=settings.LOCAL_INDEX_QUANTIZE,
+        )
+        _indexes[org_id] = index
+    return index
+
+
+async def get_retrieval_backend(org_id, org: Optional[dict] = None) -> str:
+    """Backend configured for the organization; pass ``org`` if it is already loaded."""
+    if not org_id:
+        return RETRIEVAL_BACKEND_OPENAI
+    if org is None:
+        org = await db.organizations.find_one({"_id": ObjectId(org_id)}, {"retrieval_backend": 1})
+    backend = (org or {}).get("retrieval_backend", RETRIEVAL_BACKEND_OPENAI)
+    return backend if backend in RETRIEVAL_BACKENDS else RETRIEVAL_BACKEND_OPENAI
+
+
+async def indexes_uploads_locally(org_id) -> bool:
+    """Whether new uploads of the org go into its local index: once it uses the
+    local backend, and while a switch to it waits for the backfill."""
+    if not org_id:
+        return False
+    org = await db.organizations.find_one(
+        {"_id": ObjectId(org_id)}, {"retrieval_backend": 1, LOCAL_INDEX_PENDING: 1}
+    ) or {}
+    return org.get("retrieval_backend") == RETRIEVAL_BACKEND_LOCAL or bool(org.get(LOCAL_INDEX_PENDING))
+
+
+async def index_document_text(
+    org_id: str,
+    filename: str,
+    text: str,
+    file_id: str = "",
+    embedder: Optional[Embedder] = None,
+    chunker: Optional[Callable[[str], List[str]]] = None,
+) -> int:
+    """Chunk, embed and append ``text`` to the organization's local index."""
+    chunks = [c for c in (chunker or OpenAIOrganizationService.chunk_text)(text) if c.strip()]
+    if not chunks:
+        logger.info(f"No text to index for {filename} (org {org_id})")
+        return 0
+
+    vectors = await (embedder or OpenAIOrganizationService.get_embeddings)(chunks)
+    metadata = [
+        {"file_id": file_id, "filename": filename, "page": i + 1, "text": chunk}
+        for i, chunk in enumerate(chunks)
+    ]
+    index = get_org_index(org_id)
+    await asyncio.to_thread(index.add, vectors, metadata)
+    logger.info(f"Indexed {len(chunks)} chunks of {filename} into local index for org {org_id}")
+    return len(chunks)
+
+
+async def search_org(
+    org_id: str,
+    queries: List[str],
+    k: int = 5,
+    embedder: Optional[Embedder] = None,
+) -> List[List[Tuple[float, dict]]]:
+    """Embed ``queries`` in one batch and search the organization's local index."""
+    index = get_org_index(org_id)
+    if not len(index) or not queries:
+        return [[] for _ in queries]
+    query_vectors = await (embedder or OpenAIOrganizationService.get_embeddings)(queries)
+    return await asyncio.to_thread(index.search, query_vectors, k)
+
+
+def build_context_instructions(hits: List[Tuple[float, dict]]) -> Tuple[str, List[str]]:
+    """Render local hits as run instructions plus the matching reference strings."""
+    if not hits:
+        return "", []
+    sections = []
+    references = []
+    for _, meta in hits:
+        sections.append(f"[{meta.get('filename', '')}, page {meta.get('page', 1)}]\n{meta.get('text', '')}")
+        references.append(f"({meta.get('filename', '')}, {meta.get('page', 1)}, {meta.get('text', '')[:20]}...)")
+    instructions = (
+        "Answer using the following excerpts from the organization's documents "
+        "as reference:\n\n" + "\n\n".join(sections)
+    )
+    return instructions, references
@@ -0,0 +1,143 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from app.db import db
+from app.utils.logger import logger
+
+# Loads a chat document without its legacy embedded `messages` array; the
+# field comes back as [] when the chat still needs migrating.
+CHAT_PROJECTION = {"messages": {"$slice": 0}}
+
+PREVIEW_CHARS = 200
+
+
+def _summary(message: dict) -> dict:
+    return {
+        "role": message.get("role"),
+        "preview": (message.get("content") or "")[:PREVIEW_CHARS],
+        "createdAt": message.get("createdAt"),
+    }
+
+
+async def migrate_chat(chat_id) -> int:
+    """Move a chat's embedded messages into the `messages` collection.
+
+    Idempotent: messages are upserted by (chat_id, seq) and the embedded array
+    is only removed once they are all stored. Returns the number moved.
+    """
+    chat_id = ObjectId(chat_id)
+    chat = await db.chats.find_one({"_id": chat_id, "messages": {"$exists": True}}, {"messages": 1})
+    if not chat:
+        return 0
+
+    legacy = chat.get("messages") or []
+    if legacy:
+        await db.messages.bulk_write(
+            [
+                UpdateOne(
+                    {"chat_id": chat_id, "seq": seq},
+                    {"$setOnInsert": {**message, "chat_id": chat_id, "seq": seq}},
+                    upsert=True,
+                )
+                for seq, message in enumerate(legacy)
+            ],
+            ordered=False,
+        )
+
+    update = {"$set": {"message_count": len(legacy)}, "$unset": {"messages": ""}}
+    if legacy:
+        update["$set"]["last_message"] = _summary(legacy[-1])
+    await db.chats.update_one({"_id": chat_id, "messages": {"$exists": True}}, update)
+    logger.info(f"📦 Migrated {len(legacy)} messages out of chat {chat_id}")
+    return len(legacy)
+
+
+async def ensure_migrated(chat: dict):
+    """Migrate ``chat`` (loaded with CHAT_PROJECTION) if it still embeds messages."""
+    if "messages" in chat:
+        await migrate_chat(chat["_id"])
+
+
+async def append_messages(chat_id, messages: List[dict]) -> List[dict]:
+    """Store ``messages`` as the chat's next messages and return them with their seq.
+
+    One update reserves the seq range and refreshes the chat summary, one
+    ordered insert stores the messages; neither grows with the conversation.
+    """
+    chat_id = ObjectId(chat_id)
+    now = datetime.utcnow()
+    messages = [{**message, "createdAt": message.get("createdAt") or now} for message in messages]
+    chat = await db.chats.find_one_and_update(
+        {"_id": chat_id},
+        {
+            "$inc": {"message_count": len(messages)},
+            "$set": {"updatedAt": now, "last_message": _summary(messages[-1])},
+        },
+        projection={"message_count": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if not chat:
+        raise ValueError(f"Chat {chat_id} not found")
+    first_seq = chat["message_count"] - len(messages)
+    for offset, message in enumerate(messages):
+        message["seq"] = first_seq + offset
+    await db.messages.insert_many([{**message, "chat_id": chat_id} for message in messages], ordered=True)
+    return messages
+
+
+async def append_message(chat_id, message: dict) -> int:
+    """Store ``message`` as the chat's next message and return its seq."""
+    stored = await append_messages(chat_id, [message])
+    return stored[0]["seq"]
+
+
+async def persist_turn(
+    chat_id,
+    question: str,
+    reply: Optional[str] = None,
+    *,
+    footnotes: Optional[list] = None,
+    references: Optional[list] = None,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+) -> List[dict]:
+    """Write a chat turn (the user's question and, if there is one, the
+    assistant's reply) in one batch and return just those messages."""
+    now = datetime.utcnow()
+    turn = [{"role": "user", "content": question, "tokens": input_tokens, "createdAt": now}]
+    if reply is not None:
+        turn.append({
+            "role": "assistant",
+            "content": reply,
+            "footnotes": footnotes or [],
+            "references": references or [],
+            "tokens": output_tokens,
+            "createdAt": now,
+        })
+    return await append_messages(chat_id, turn)
+
+
+async def get_messages_page(
+    chat_id, before: Optional[int] = None, limit: int = 50
+) -> Tuple[List[dict], Optional[int]]:
+    """The newest ``limit`` messages with seq < ``before`` (oldest first), and
+    the ``before`` value for the page preceding them, if any."""
+    query = {"chat_id": ObjectId(chat_id)}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+    docs = await (
+        db.messages.find(query, {"_id": 0, "chat_id": 0})
+        .sort("seq", -1)
+        .limit(limit)
+        .to_list(length=limit)
+    )
+    docs.reverse()
+    next_before = docs[0]["seq"] if docs and docs[0]["seq"] > 0 else None
+    return docs, next_before
+
+
+async def delete_chat_messages(chat_id):
+    await db.messages.delete_many({"chat_id": ObjectId(chat_id)})
@@ -0,0 +1,147 @@
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo import DESCENDING
+
+from app.db import db
+from app.services.invoices import INVOICES
+from app.utils.quota_periods import current_period, flat_counter_expr, quota_field
+
+BILLING_HISTORY_LIMIT = 10
+
+
+def _period_used(prefix: str, period: str) -> dict:
+    """Tokens used this period from the ``quota``/``usage_quota`` subdocument at
+    ``prefix``; documents not yet on period counters use the flat one."""
+    return {"$cond": [
+        {"$eq": [{"$type": f"${prefix}.periods"}, "missing"]},
+        flat_counter_expr(f"${prefix}", "used", period),
+        {"$ifNull": [f"${quota_field(prefix, period)}", 0]},
+    ]}
+
+
+def _quota_with_usage(prefix: str, period: str) -> dict:
+    """The quota subdocument with ``used`` for this period in place of the raw counters."""
+    return {"$mergeObjects": [
+        {"$arrayToObject": {"$filter": {
+            "input": {"$objectToArray": {"$ifNull": [f"${prefix}", {}]}},
+            "cond": {"$ne": ["$$this.k", "periods"]},
+        }}},
+        {"used": _period_used(prefix, period)},
+    ]}
+
+
+def _members_lookup(org_id: ObjectId, skip: int, limit: int, period: str) -> dict:
+    # Members were stored with either form of the org id over time
+    return {"$lookup": {
+        "from": "users",
+        "pipeline": [
+            {"$match": {"organization_id": {"$in": [org_id, str(org_id)]}}},
+            {"$sort": {"_id": 1}},
+            {"$facet": {
+                "total": [{"$count": "count"}],
+                "page": [
+                    {"$skip": skip},
+                    {"$limit": limit},
+                    {"$project": {
+                        "_id": 0,
+                        "id": {"$toString": "$_id"},
+                        "email": 1,
+                        "name": {"$ifNull": ["$name", "Unknown User"]},
+                        "created_at": 1,
+                        "updated_at": 1,
+                        "is_active": {"$ifNull": ["$is_active", True]},
+                        "is_verified": {"$ifNull": ["$is_verified", False]},
+                        "role": {"$ifNull": ["$role", "user"]},
+                        "organization_id": {"$toString": "$organization_id"},
+                        "agent_id": {"$toString": "$agent_id"},
+                        "quota": _quota_with_usage("quota", period),
+                        "monthly_usage": _period_used("quota", period),
+                    }},
+                ],
+            }},
+        ],
+        "as": "members",
+    }}
+
+
+def _assistant_counts_lookup(org_id: ObjectId) -> dict:
+    # One indexed pass over the org's assistants, grouped by creator
+    return {"$lookup": {
+        "from": "assistants",
+        "pipeline": [
+            {"$match": {"org_id": {"$in": [org_id, str(org_id)]}}},
+            {"$group": {"_id": {"$toString": "$created_by"}, "count": {"$sum": 1}}},
+        ],
+        "as": "assistant_counts",
+    }}
+
+
+def _with_assistant_count(users: dict) -> dict:
+    return {"$map": {"input": users, "as": "user", "in": {"$mergeObjects": ["$$user", {"assistant_count": {"$ifNull": [
+        {"$arrayElemAt": [{"$map": {
+            "input": {"$filter": {
+                "input": "$assistant_counts", "as": "row", "cond": {"$eq": ["$$row._id", "$$user.id"]},
+            }},
+            "as": "row",
+            "in": "$$row.count",
+        }}, 0]},
+        0,
+    ]}}]}}}
+
+
+def _billing_lookup() -> dict:
+    # Invoices come from the webhook/sync mirror, never from Stripe on the request path
+    return {"$lookup": {
+        "from": INVOICES,
+        "let": {"customer": {"$ifNull": ["$stripe_customer_id", None]}},
+        "pipeline": [
+            {"$match": {"$expr": {"$and": [
+                {"$ne": ["$$customer", None]},
+                {"$eq": ["$customer", "$$customer"]},
+            ]}}},
+            {"$sort": {"created": DESCENDING}},
+            {"$limit": BILLING_HISTORY_LIMIT},
+            {"$project": {
+                "_id": 0,
+                "date": {"$substrCP": ["$created", 0, 10]},
+                "amount": {"$round": [{"$divide": [{"$ifNull": ["$amount_paid", 0]}, 100]}, 2]},
+                "status": 1,
+                "plan": {"$ifNull": ["$plan", "Unknown"]},
+            }},
+        ],
+        "as": "billing_history",
+    }}
+
+
+def org_dashboard_pipeline(org_id: ObjectId, skip: int, limit: int, period: str = None) -> List[dict]:
+    period = period or current_period()
+    return [
+        {"$match": {"_id": org_id}},
+        _members_lookup(org_id, skip, limit, period),
+        _assistant_counts_lookup(org_id),
+        _billing_lookup(),
+        {"$project": {
+            "_id": 0,
+            "org": {
+                "_id": {"$toString": "$_id"},
+                "name": "$name",
+                "plan": {"$ifNull": ["$plan", "free"]},
+                "quota": _quota_with_usage("usage_quota", period),
+                "billing_history": "$billing_history",
+            },
+            "users": _with_assistant_count({"$ifNull": [{"$arrayElemAt": ["$members.page", 0]}, []]}),
+            "users_total": {"$ifNull": [{"$arrayElemAt": [{"$arrayElemAt": ["$members.total.count", 0]}, 0]}, 0]},
+        }},
+    ]
+
+
+async def get_org_dashboard(org_id: ObjectId, page: int = 1, page_size: int = 50, database=None) -> Optional[dict]:
+    """The org, one page of its members with this period's usage and assistant
+    counts, and recent invoices, in a single aggregation. None if the org doesn't exist."""
+    database = db if database is None else database
+    pipeline = org_dashboard_pipeline(org_id, (page - 1) * page_size, page_size)
+    result = await database.organizations.aggregate(pipeline).to_list(length=1)
+    if not result:
+        return None
+    return {**result[0], "page": page, "page_size": page_size}
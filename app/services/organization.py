@@ -13,6 +13,8 @@ from datetime import datetime
 from bson import ObjectId
 from app.config import settings
 from app.db import db
+from app.services.embeddings import embedding_service
+from app.services.citations import citation_resolver
 from app.utils.logger import logger # Changed to use app.utils.logger
 
 # Cached tokenizer
@@ -69,6 +71,7 @@ class OpenAIOrganizationService:
                 "purpose": "assistants"
             }
             result = await db["documents"].insert_one(document_to_store)
+            citation_resolver.remember(openai_file_id, file.filename)
             logger.info(f"File metadata stored in DB for org {org_id}, user {user_id}. Doc ID: {result.inserted_id}, OpenAI File ID: {openai_file_id}")
             
             return [openai_file_id]
@@ -102,11 +105,5 @@ class OpenAIOrganizationService:
 
     @staticmethod
     async def get_embeddings(texts: list[str]) -> np.ndarray:
-        logger.info("📡 Requesting OpenAI embeddings")
-        response = openai.embeddings.create(
-            input=texts,
-            model="text-embedding-3-small"
-        )
-        vectors = [record.embedding for record in response.data]
-        logger.info("✅ Embeddings received from OpenAI")
-        return np.array(vectors, dtype=np.float32)
+        # Batched, rate-limited and cached; see app.services.embeddings
+        return await embedding_service.embed(texts)
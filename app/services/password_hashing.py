@@ -0,0 +1,99 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+from fastapi import HTTPException
+
+from app.config import settings
+from app.utils.logger import logger
+
+# bcrypt only looks at the first 72 bytes; longer secrets are truncated the
+# way passlib used to, so hashes created before this module still verify.
+BCRYPT_MAX_BYTES = 72
+
+
+def _secret(password: str) -> bytes:
+    return password.encode("utf-8")[:BCRYPT_MAX_BYTES]
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """The cost factor of a ``$2b$12$...`` hash, or None if it isn't bcrypt."""
+    parts = hashed.split("$")
+    if len(parts) < 4 or parts[1] not in ("2a", "2b", "2y"):
+        return None
+    try:
+        return int(parts[2])
+    except ValueError:
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL, so ``workers`` hashes run in parallel. At most
+    ``max_pending`` calls may be queued or running; beyond that callers get a
+    429 straight away instead of waiting behind a burst of logins.
+    """
+
+    def __init__(
+        self,
+        rounds: int = settings.BCRYPT_ROUNDS,
+        workers: int = settings.PASSWORD_HASH_WORKERS,
+        max_pending: int = settings.PASSWORD_HASH_MAX_PENDING,
+    ):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            logger.warning(f"🔐 Password hashing saturated ({self._pending} pending); rejecting request")
+            raise HTTPException(
+                status_code=429,
+                detail="Too many sign-in attempts in progress. Please retry shortly.",
+                headers={"Retry-After": "1"},
+            )
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(_secret(password), bcrypt.gensalt(rounds=self.rounds)).decode("utf-8")
+
+    def _verify(self, password: str, hashed: str) -> bool:
+        try:
+            return bcrypt.checkpw(_secret(password), hashed.encode("utf-8"))
+        except ValueError:
+            return False
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return hash_cost(hashed) != self.rounds
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self._verify, password, hashed)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check ``password`` and, when ``hashed`` uses another cost factor,
+        return a replacement hash at the current one (else None)."""
+        if not await self.verify(password, hashed):
+            return False, None
+        if not self.needs_rehash(hashed):
+            return True, None
+        return True, await self.hash(password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
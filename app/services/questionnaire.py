@@ -3,10 +3,11 @@ import os
 import re
 import tempfile
 import asyncio
-from typing import List, Tuple, Dict
+from typing import List, Optional, Tuple, Dict
 
 import requests
 import aiohttp
+import tiktoken
 
 from PyPDF2 import PdfReader
 from docx import Document
@@ -19,23 +20,55 @@ from fpdf import FPDF
 
 from app.utils.logger import logger
 from app.config import settings
+from app.services.local_index import RETRIEVAL_BACKEND_LOCAL, search_org
+from app.services.rerank import pack_chunks, rerank
+from app.services.retrieval_cache import retrieval_cache
 
 # Cache for generated answers to avoid repeated token usage
 QA_CACHE: Dict[Tuple[str, str], str] = {}
 
-# Maximum words from context to send to the model
-DEFAULT_MAX_CONTEXT_WORDS = 250
+# Maximum tokens from context to send to the model
+DEFAULT_MAX_CONTEXT_TOKENS = 600
+
+# Number of vector store hits fetched per question before reranking
+RETRIEVAL_TOP_K = 8
 
 # Cheaper model for question answering
 CHEAPER_MODEL = "gpt-4o"
 
-def _trim_context(context: str, max_words: int = DEFAULT_MAX_CONTEXT_WORDS) -> str:
-    """Return a truncated context limited to ``max_words`` words."""
-    words = context.split()
-    if len(words) <= max_words:
+_tokenizer = tiktoken.get_encoding("cl100k_base")
+
+
+def _count_tokens(text: str) -> int:
+    return len(_tokenizer.encode(text))
+
+
+def _trim_context(context: str, max_tokens: int = DEFAULT_MAX_CONTEXT_TOKENS) -> str:
+    """Return a truncated context limited to ``max_tokens`` tokens."""
+    tokens = _tokenizer.encode(context)
+    if len(tokens) <= max_tokens:
         return context
-    logger.info(f"Trimming context from {len(words)} to {max_words} words")
-    return " ".join(words[:max_words])
+    logger.info(f"Trimming context from {len(tokens)} to {max_tokens} tokens")
+    return _tokenizer.decode(tokens[:max_tokens])
+
+
+def _select_context(question: str, hits: List[dict]) -> Tuple[str, str, str, int]:
+    """Rerank retrieval hits and pack the best ones into the context budget.
+
+    Returns the packed context plus the filename, snippet and page of the
+    top-ranked hit, which is the one cited in the reference.
+    """
+    hits = [h for h in hits if h.get("text")]
+    if not hits:
+        return "", "", "", 0
+    ranked = rerank(question, hits)
+    packed = pack_chunks(ranked, DEFAULT_MAX_CONTEXT_TOKENS, _count_tokens)
+    if not packed:
+        # Even the best chunk is over budget; send it trimmed
+        packed = ranked[:1]
+    top = packed[0]
+    context = "\n\n".join(h["text"] for h in packed)
+    return _trim_context(context), top.get("filename", ""), top["text"][:20], int(top.get("page", 1))
 
 def _extract_text(file_bytes: bytes, filename: str) -> str:
     ext = os.path.splitext(filename)[1].lower()
@@ -151,69 +184,92 @@ def process_questionnaire(
     return results
 
 
-async def _query_vector_store(
-    question: str, vector_store_id: str, file_map: Dict[str, str], openai_api_key: str
-) -> Tuple[str, str, str, int]:
-    """
-    Query the vector store using an HTTP call to retrieve relevant chunks.
-    
-    Args:
-        question (str): The question to query the vector store with.
-        vector_store_id (str): The ID of the vector store.
-        file_map (Dict[str, str]): A mapping of file IDs to filenames.
-        openai_api_key (str): The OpenAI API key for authentication.
-    
-    Returns:
-        Tuple[str, str, str, int]: Chunk text, filename, snippet, and page number.
-    """
-    logger.info(f"Querying vector store for question: '{question}' with vector_store_id: {vector_store_id}")
-    
+async def _search_vector_store(
+    question: str, vector_store_id: str, openai_api_key: str
+) -> Optional[List[dict]]:
+    """Fetch the top ``RETRIEVAL_TOP_K`` raw hits, or ``None`` if the search failed."""
     # Define the API endpoint for searching
     url = f"https://api.openai.com/v1/vector_stores/{vector_store_id}/search"
-    
+
     # Set up headers with authentication
     headers = {
         "Authorization": f"Bearer {openai_api_key}",
         "Content-Type": "application/json"
     }
-    
+
     # Prepare the request body
     data = {
         "query": question,
+        "max_num_results": RETRIEVAL_TOP_K,
     }
-    
+
     try:
         # Send the POST request
-        response = requests.post(url, headers=headers, data=json.dumps(data))
-        
-        # Check for successful response
-        if response.status_code == 200:
-            resp_data = response.json()
-            if resp_data.get("data") and len(resp_data["data"]) > 0:
-                record = resp_data["data"][0]
-                content = record["content"][0]
-                chunk = content.get("text", "")
-                meta = content.get("metadata", {})
-                page_no = int(meta.get("page", 1))
-                if not chunk:
-                    logger.warning(f"Empty chunk received for question '{question}'")
-                file_id = record.get("file_id", "")
-                filename = file_map.get(file_id, file_id)
-                logger.info(
-                    f"Found match for question '{question}': file_id {file_id}, filename {filename}, page {page_no}"
-                )
-                return chunk, filename, chunk[:20], page_no
-            else:
-                logger.info(f"No match found in vector store for question '{question}'")
-                return "", "", "", 0
-        else:
-            logger.error(f"API request failed with status code {response.status_code}: {response.text}")
-            return "", "", "", 0
-    
+        response = await asyncio.to_thread(requests.post, url, headers=headers, data=json.dumps(data))
     except Exception as e:
         logger.error(f"Vector store query failed for question '{question}': {e}")
+        return None
+
+    # Check for successful response
+    if response.status_code != 200:
+        logger.error(f"API request failed with status code {response.status_code}: {response.text}")
+        return None
+
+    hits = []
+    for record in response.json().get("data") or []:
+        contents = record.get("content") or []
+        meta = (contents[0].get("metadata") if contents else None) or record.get("attributes") or {}
+        hits.append({
+            "text": "\n".join(c.get("text", "") for c in contents),
+            "score": record.get("score", 0.0),
+            "file_id": record.get("file_id", ""),
+            "filename": record.get("filename", ""),
+            "page": int(meta.get("page", 1)),
+        })
+    return hits
+
+
+async def _query_vector_store(
+    question: str, vector_store_id: str, file_map: Dict[str, str], openai_api_key: str
+) -> Tuple[str, str, str, int]:
+    """
+    Query the vector store using an HTTP call to retrieve relevant chunks.
+
+    The top ``RETRIEVAL_TOP_K`` hits are served from the retrieval cache when
+    possible, reranked together with a lexical score and packed into the
+    context budget.
+
+    Args:
+        question (str): The question to query the vector store with.
+        vector_store_id (str): The ID of the vector store.
+        file_map (Dict[str, str]): A mapping of file IDs to filenames.
+        openai_api_key (str): The OpenAI API key for authentication.
+
+    Returns:
+        Tuple[str, str, str, int]: Context text, filename, snippet, and page number.
+    """
+    logger.info(f"Querying vector store for question: '{question}' with vector_store_id: {vector_store_id}")
+
+    hits = await retrieval_cache.get_or_fetch(
+        vector_store_id, question,
+        lambda: _search_vector_store(question, vector_store_id, openai_api_key),
+    )
+    if not hits:
+        logger.info(f"No match found in vector store for question '{question}'")
         return "", "", "", 0
-        
+
+    hits = [
+        dict(h, filename=file_map.get(h["file_id"], h.get("filename") or h["file_id"]))
+        for h in hits
+    ]
+    context, filename, snippet, page_no = _select_context(question, hits)
+    if not context:
+        logger.warning(f"Empty chunks received for question '{question}'")
+    logger.info(
+        f"Found {len(hits)} matches for question '{question}': best filename {filename}, page {page_no}"
+    )
+    return context, filename, snippet, page_no
+
 async def _generate_answer(question: str, context: str, openai_client) -> str:
     logger.info(f"Generating answer for question: '{question}'")
     if not context:
@@ -261,15 +317,30 @@ async def process_questionnaire_rag(
     vector_store_id: str,
     file_map: Dict[str, str],
     openai_client,
+    org_id: Optional[str] = None,
+    backend: Optional[str] = None,
 ) -> List[dict]:
     logger.info(f"Processing questionnaire_rag for file: {filename} with vector_store_id: {vector_store_id}")
     text = _extract_text(file_bytes, filename)
     questions = _extract_questions(text)
+
+    # The local backend embeds every question in one batch and searches the
+    # organization's on-disk index instead of calling the vector store per question.
+    local_hits = None
+    if backend == RETRIEVAL_BACKEND_LOCAL:
+        logger.info(f"Using local retrieval index for org {org_id}")
+        local_hits = await search_org(org_id, questions, k=settings.LOCAL_RETRIEVAL_TOP_K)
+
     results = []
-    for q in questions:
-        para, fname, snippet, page_no = await _query_vector_store(
-            q, vector_store_id, file_map, settings.OPENAI_API_KEY
-        )
+    for i, q in enumerate(questions):
+        if local_hits is not None:
+            para, fname, snippet, page_no = _select_context(
+                q, [dict(meta, score=score) for score, meta in local_hits[i]]
+            )
+        else:
+            para, fname, snippet, page_no = await _query_vector_store(
+                q, vector_store_id, file_map, settings.OPENAI_API_KEY
+            )
         answer = "No matching information found."
         if para:
             gen = await _generate_answer(q, para, openai_client)
@@ -0,0 +1,98 @@
+import re
+import math
+from collections import Counter
+from typing import Callable, List
+
+# Weights of the three signals after each is min-max normalised over the candidates
+VECTOR_WEIGHT = 0.5
+BM25_WEIGHT = 0.3
+CROSS_WEIGHT = 0.2
+
+_WORD_RE = re.compile(r"\w+")
+
+# Function words that would otherwise dominate BM25 on short question text
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from has have how in is it its of on or "
+    "our that the this to was we what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _WORD_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def bm25_scores(query: str, documents: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Okapi BM25 of ``query`` against each document, with IDF over ``documents`` only."""
+    docs = [tokenize(d) for d in documents]
+    if not docs:
+        return []
+    n = len(docs)
+    avg_len = sum(len(d) for d in docs) / n or 1.0
+    doc_freq = Counter(term for d in docs for term in set(d))
+    query_terms = set(tokenize(query))
+
+    scores = []
+    for doc in docs:
+        tf = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            if term not in tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            denom = tf[term] + k1 * (1 - b + b * len(doc) / avg_len)
+            score += idf * tf[term] * (k1 + 1) / denom
+        scores.append(score)
+    return scores
+
+
+def cross_score(query: str, document: str) -> float:
+    """Cheap query/passage interaction score: term coverage plus bigram matches."""
+    q_terms = tokenize(query)
+    if not q_terms:
+        return 0.0
+    d_terms = tokenize(document)
+    d_set = set(d_terms)
+    coverage = sum(1 for t in set(q_terms) if t in d_set) / len(set(q_terms))
+    q_bigrams = set(zip(q_terms, q_terms[1:]))
+    if not q_bigrams:
+        return coverage
+    d_bigrams = set(zip(d_terms, d_terms[1:]))
+    return coverage + len(q_bigrams & d_bigrams) / len(q_bigrams)
+
+
+def _normalize(values: List[float]) -> List[float]:
+    if not values:
+        return []
+    lo, hi = min(values), max(values)
+    if hi == lo:
+        return [1.0 if hi > 0 else 0.0 for _ in values]
+    return [(v - lo) / (hi - lo) for v in values]
+
+
+def rerank(query: str, hits: List[dict]) -> List[dict]:
+    """Order search hits by a blend of vector, BM25 and cross scores.
+
+    Each hit needs ``text`` and ``score`` (the vector similarity). The blended
+    value is stored on the hit as ``rerank_score``.
+    """
+    if not hits:
+        return []
+    texts = [h.get("text", "") for h in hits]
+    vector = _normalize([float(h.get("score", 0.0)) for h in hits])
+    lexical = _normalize(bm25_scores(query, texts))
+    cross = _normalize([cross_score(query, t) for t in texts])
+    for hit, v, l, c in zip(hits, vector, lexical, cross):
+        hit["rerank_score"] = VECTOR_WEIGHT * v + BM25_WEIGHT * l + CROSS_WEIGHT * c
+    return sorted(hits, key=lambda h: h["rerank_score"], reverse=True)
+
+
+def pack_chunks(hits: List[dict], max_tokens: int, count_tokens: Callable[[str], int]) -> List[dict]:
+    """Greedily keep the best-ranked hits whose text fits in ``max_tokens``."""
+    packed, used = [], 0
+    for hit in hits:
+        tokens = count_tokens(hit.get("text", ""))
+        if not tokens or used + tokens > max_tokens:
+            continue
+        packed.append(hit)
+        used += tokens
+    return packed
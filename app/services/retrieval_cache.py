@@ -0,0 +1,234 @@
+import re
+import time
+import asyncio
+import hashlib
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from openai import OpenAI
+
+from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+
+_SPACE_RE = re.compile(r"\s+")
+
+openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+# Keeps references to background "bump when indexed" tasks until they finish
+_background: Set[asyncio.Task] = set()
+
+
+def normalize_query(query: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation."""
+    return _SPACE_RE.sub(" ", query.lower()).strip().rstrip("?!.").strip()
+
+
+class RetrievalCache:
+    """Two-tier cache of vector store search results.
+
+    Entries are keyed by (vector_store_id, manifest version, normalised query).
+    The manifest version lives in ``vector_store_manifests`` and is bumped
+    whenever the store's file set changes, so stale entries simply stop being
+    addressed; the Mongo tier is reaped by a TTL index on ``expires_at``
+    (see app.utils.indexes).
+    Workers re-read a store's version at most every
+    ``RETRIEVAL_CACHE_MANIFEST_TTL_SECONDS``.
+
+    OpenAI indexes newly attached files asynchronously, so while a store has
+    files in progress its searches are only cached for
+    ``RETRIEVAL_CACHE_INDEXING_TTL_SECONDS``, and the manifest is bumped again
+    once they finish (see ``bump_when_indexed``).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = settings.RETRIEVAL_CACHE_TTL_SECONDS,
+        manifest_ttl_seconds: int = settings.RETRIEVAL_CACHE_MANIFEST_TTL_SECONDS,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.manifest_ttl_seconds = manifest_ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, Tuple[float, int, bool]] = {}  # store -> (read at, version, indexing)
+        self.metrics = Counter()
+
+    @staticmethod
+    def _key(vector_store_id: str, version: int, query: str) -> str:
+        raw = f"{vector_store_id}\x00{version}\x00{normalize_query(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember_manifest(self, vector_store_id: str, doc: Optional[dict]) -> int:
+        doc = doc or {}
+        # A crashed worker can't leave a store marked as indexing past its deadline
+        indexing = doc.get("indexing", 0) > 0 and (doc.get("indexing_until") or datetime.min) > datetime.utcnow()
+        self._versions[vector_store_id] = (time.monotonic(), doc.get("version", 0), indexing)
+        return doc.get("version", 0)
+
+    async def manifest_version(self, vector_store_id: str) -> int:
+        cached = self._versions.get(vector_store_id)
+        if cached and time.monotonic() - cached[0] < self.manifest_ttl_seconds:
+            return cached[1]
+        doc = await db.vector_store_manifests.find_one(
+            {"_id": vector_store_id}, {"version": 1, "indexing": 1, "indexing_until": 1}
+        )
+        return self._remember_manifest(vector_store_id, doc)
+
+    def _entry_ttl(self, vector_store_id: str) -> int:
+        cached = self._versions.get(vector_store_id)
+        if cached and cached[2]:
+            return min(self.ttl_seconds, settings.RETRIEVAL_CACHE_INDEXING_TTL_SECONDS)
+        return self.ttl_seconds
+
+    async def bump(self, vector_store_id: str, indexing: Optional[bool] = None) -> int:
+        """Invalidate every cached search of ``vector_store_id``.
+
+        ``indexing=True`` also marks files of the store as being indexed and
+        ``indexing=False`` marks them done.
+        """
+        update = {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}}
+        if indexing is not None:
+            update["$inc"]["indexing"] = 1 if indexing else -1
+        if indexing:
+            deadline = datetime.utcnow() + timedelta(seconds=settings.RETRIEVAL_CACHE_INDEXING_TIMEOUT_SECONDS)
+            update["$max"] = {"indexing_until": deadline}
+        doc = await db.vector_store_manifests.find_one_and_update(
+            {"_id": vector_store_id}, update, upsert=True, return_document=True,
+        )
+        version = self._remember_manifest(vector_store_id, doc)
+        self.metrics["invalidations"] += 1
+        logger.info(f"🧹 Retrieval cache invalidated for vector store {vector_store_id} (v{version})")
+        return version
+
+    async def bump_when_indexed(self, vector_store_id: str, file_ids: List[str]) -> asyncio.Task:
+        """Invalidate now, and again once OpenAI has finished indexing ``file_ids``.
+
+        Results cached in between (possibly missing the new files) expire
+        after the short indexing TTL.
+        """
+        await self.bump(vector_store_id, indexing=True)
+        task = asyncio.create_task(self._finish_indexing(vector_store_id, list(file_ids)))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+        return task
+
+    async def _finish_indexing(self, vector_store_id: str, file_ids: List[str]):
+        deadline = time.monotonic() + settings.RETRIEVAL_CACHE_INDEXING_TIMEOUT_SECONDS
+        pending = file_ids
+        try:
+            while pending and time.monotonic() < deadline:
+                statuses = await asyncio.to_thread(_file_statuses, vector_store_id, pending)
+                pending = [fid for fid, status in zip(pending, statuses) if status == "in_progress"]
+                if pending:
+                    await asyncio.sleep(settings.RETRIEVAL_CACHE_INDEXING_POLL_SECONDS)
+            if pending:
+                logger.warning(f"Vector store {vector_store_id} still indexing {len(pending)} files; giving up waiting")
+        except Exception as e:
+            logger.error(f"Failed to poll indexing status of vector store {vector_store_id}: {e}")
+        finally:
+            await self.bump(vector_store_id, indexing=False)
+
+    async def get(self, vector_store_id: str, query: str) -> Optional[Any]:
+        key = self._key(vector_store_id, await self.manifest_version(vector_store_id), query)
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.time():
+            self._entries.move_to_end(key)
+            self.metrics["memory_hits"] += 1
+            return entry[1]
+
+        doc = await db.retrieval_cache.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        if doc:
+            self.metrics["mongo_hits"] += 1
+            remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+            self._remember(key, doc["value"], time.time() + remaining)
+            return doc["value"]
+
+        self.metrics["misses"] += 1
+        return None
+
+    def _remember(self, key: str, value: Any, expires: float):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def set(self, vector_store_id: str, query: str, value: Any):
+        version = await self.manifest_version(vector_store_id)
+        key = self._key(vector_store_id, version, query)
+        ttl = self._entry_ttl(vector_store_id)
+        self._remember(key, value, time.time() + ttl)
+        try:
+            await db.retrieval_cache.replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "vector_store_id": vector_store_id,
+                    "version": version,
+                    "query": normalize_query(query),
+                    "value": value,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=ttl),
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            logger.error(f"Failed to write retrieval cache entry for {vector_store_id}: {e}")
+
+    async def get_or_fetch(
+        self, vector_store_id: str, query: str, fetch: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        """Return the cached result or call ``fetch``; ``None`` results are not cached."""
+        cached = await self.get(vector_store_id, query)
+        if cached is not None:
+            return cached
+        value = await fetch()
+        if value is not None:
+            await self.set(vector_store_id, query, value)
+        return value
+
+    def stats(self) -> dict:
+        hits = self.metrics["memory_hits"] + self.metrics["mongo_hits"]
+        lookups = hits + self.metrics["misses"]
+        return {
+            "memory_hits": self.metrics["memory_hits"],
+            "mongo_hits": self.metrics["mongo_hits"],
+            "misses": self.metrics["misses"],
+            "invalidations": self.metrics["invalidations"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+
+def _file_statuses(vector_store_id: str, file_ids: List[str]) -> List[str]:
+    """Indexing status of each file in the store; blocking, so run it in a thread."""
+    return [
+        openai_client.beta.vector_stores.files.retrieve(vector_store_id=vector_store_id, file_id=fid).status
+        for fid in file_ids
+    ]
+
+
+retrieval_cache = RetrievalCache()
+
+
+async def invalidate_org_vector_stores(org_id: str):
+    """Bump the manifest of every assistant vector store of ``org_id``."""
+    cursor = db.assistants.find({"org_id": ObjectId(org_id)}, {"vector_store_id": 1})
+    async for assistant in cursor:
+        if assistant.get("vector_store_id"):
+            await retrieval_cache.bump(assistant["vector_store_id"])
+
+
+async def invalidate_file_vector_stores(file_ids: List[str], org_ids=()):
+    """Bump the manifest of every assistant vector store that held one of
+    ``file_ids``: stores listing the file, and those of the files' orgs."""
+    query = [{"file_ids": {"$in": list(file_ids)}}]
+    org_ids = [ObjectId(org_id) for org_id in {str(org_id) for org_id in org_ids if org_id}]
+    if org_ids:
+        query.append({"org_id": {"$in": org_ids}})
+    store_ids = await db.assistants.distinct("vector_store_id", {"$or": query})
+    for vector_store_id in filter(None, store_ids):
+        await retrieval_cache.bump(vector_store_id)
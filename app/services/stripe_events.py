@@ -0,0 +1,179 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.config import settings
+from app.db import db
+from app.services.invoices import upsert_invoice
+from app.utils.context import invalidate_org_context
+from app.utils.email_templates import render_template
+from app.utils.logger import logger
+from app.utils.notifier import send_email
+
+# Verified webhook events, keyed by Stripe event id so redeliveries are no-ops.
+INBOX = "stripe_webhook_inbox"
+
+PENDING, PROCESSING, DONE, FAILED = "pending", "processing", "done", "failed"
+# A claim older than this is assumed to belong to a crashed worker
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def _ordering_key(event: dict) -> Optional[str]:
+    """Events for the same org (or Stripe customer) are applied in order."""
+    obj = event.get("data", {}).get("object", {})
+    return (obj.get("metadata") or {}).get("organization_id") or obj.get("customer")
+
+
+async def enqueue_event(event: dict) -> bool:
+    """Record a verified event in the inbox; False if it was already recorded."""
+    try:
+        await db[INBOX].insert_one({
+            "_id": event["id"],
+            "type": event["type"],
+            "created": event.get("created", 0),
+            "ordering_key": _ordering_key(event),
+            "event": event,
+            "status": PENDING,
+            "attempts": 0,
+            "received_at": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        logger.info(f"🔁 Duplicate Stripe event {event['id']} ignored")
+        return False
+    return True
+
+
+async def _head_user(org_id: str) -> Optional[dict]:
+    ids = [org_id, ObjectId(org_id)] if ObjectId.is_valid(org_id) else [org_id]
+    return await db.users.find_one({"organization_id": {"$in": ids}, "role": "organization_head"})
+
+
+async def _notify_once(event_id: str, org_id: str, template: str, subject: str, values: dict):
+    """Send the event's email at most once, even if the event is re-applied."""
+    claimed = await db[INBOX].update_one({"_id": event_id, "notified": {"$ne": True}}, {"$set": {"notified": True}})
+    if not claimed.modified_count:
+        return
+    head_user = await _head_user(org_id)
+    if not head_user:
+        logger.warning(f"No organization head to notify for org {org_id}")
+        return
+    html = render_template(template, values)
+    await asyncio.to_thread(send_email, head_user["email"], subject, html)
+
+
+async def _apply_subscription(event_id: str, created: int, subscription: dict, active: bool):
+    org_id = (subscription.get("metadata") or {}).get("organization_id")
+    if not org_id:
+        return
+    if active:
+        update = {"$set": {
+            "stripe_subscription_id": subscription["id"],
+            "stripe_customer_id": subscription["customer"],
+            "plan": "pro",
+            "usage_quota.total_limit": settings.PREMIUM_TOKENS,
+            "stripe_event_created": created,
+        }}
+    else:
+        update = {
+            "$set": {"plan": "free", "usage_quota.total_limit": settings.FREE_TOKENS, "stripe_event_created": created},
+            "$unset": {"stripe_subscription_id": "", "stripe_customer_id": ""},
+        }
+    # Skip events older than the last one applied to this org
+    org = await db.organizations.find_one_and_update(
+        {"_id": ObjectId(org_id), "$or": [
+            {"stripe_event_created": {"$exists": False}},
+            {"stripe_event_created": {"$lte": created}},
+        ]},
+        update,
+        return_document=ReturnDocument.AFTER,
+    )
+    if not org:
+        logger.info(f"Skipped stale subscription event {event_id} for org {org_id}")
+        return
+    invalidate_org_context(org_id)
+
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    if active:
+        logger.info(f"✅ Upgraded organization {org_id} to Pro plan via Stripe.")
+        await _notify_once(event_id, org_id, "subscription_activated.html", "✅ QuranAI Pro Plan Activated", {
+            "ORG_NAME": org.get("name", ""),
+            "ACTIVATED_DATE": today,
+            "DASHBOARD_URL": f"{settings.FRONT_END_URL}/dashboard/billing",
+        })
+    else:
+        logger.warning(f"⚠️ Organization {org_id} was downgraded to Free (subscription cancelled).")
+        await _notify_once(event_id, org_id, "subscription_fallback_cancelled.html", "⚠️ Subscription Cancelled", {
+            "ORG_NAME": org.get("name", ""),
+            "CANCELLED_DATE": today,
+            "DASHBOARD_URL": f"{settings.FRONT_END_URL}/dashboard/billing",
+        })
+
+
+async def apply_event(event: dict):
+    """Apply one Stripe event's state changes; safe to repeat."""
+    event_type = event["type"]
+    obj = event["data"]["object"]
+    if event_type.startswith("invoice."):
+        await upsert_invoice(obj, event.get("created", 0))
+    elif event_type == "customer.subscription.created":
+        await _apply_subscription(event["id"], event.get("created", 0), obj, active=True)
+    elif event_type == "customer.subscription.deleted":
+        await _apply_subscription(event["id"], event.get("created", 0), obj, active=False)
+
+
+async def process_pending_events(batch_size: int = 100) -> int:
+    """Apply pending inbox events oldest first.
+
+    Each event is claimed before it is applied so concurrent consumers never
+    share one; while an event of an ordering key is claimed by another
+    consumer, or once one fails, later events of that key wait for the next
+    run.
+    """
+    now = datetime.utcnow()
+    await db[INBOX].update_many(
+        {"status": PROCESSING, "claimed_at": {"$lt": now - CLAIM_TIMEOUT}},
+        {"$set": {"status": PENDING}},
+    )
+    pending = await (
+        db[INBOX].find({"status": PENDING}, {"_id": 1, "ordering_key": 1})
+        .sort([("created", ASCENDING), ("received_at", ASCENDING)])
+        .limit(batch_size)
+        .to_list(length=batch_size)
+    )
+    # Listed after the pending events, so a key claimed in between is seen
+    blocked = set(await db[INBOX].distinct("ordering_key", {"status": PROCESSING})) - {None}
+    applied = 0
+    for item in pending:
+        key = item.get("ordering_key")
+        if key and key in blocked:
+            continue
+        doc = await db[INBOX].find_one_and_update(
+            {"_id": item["_id"], "status": PENDING},
+            {"$set": {"status": PROCESSING, "claimed_at": datetime.utcnow()}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not doc:
+            # Claimed by a concurrent consumer, which must finish it first
+            if key:
+                blocked.add(key)
+            continue
+        try:
+            await apply_event(doc["event"])
+        except Exception as e:
+            logger.exception(f"❌ Failed to apply Stripe event {doc['_id']} ({doc['type']})")
+            status = FAILED if doc["attempts"] >= settings.STRIPE_EVENT_MAX_ATTEMPTS else PENDING
+            await db[INBOX].update_one({"_id": doc["_id"]}, {"$set": {"status": status, "error": str(e)}})
+            if key:
+                blocked.add(key)
+            continue
+        await db[INBOX].update_one(
+            {"_id": doc["_id"]}, {"$set": {"status": DONE, "processed_at": datetime.utcnow()}, "$unset": {"error": ""}}
+        )
+        applied += 1
+    if applied:
+        logger.info(f"📬 Applied {applied} Stripe events")
+    return applied
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pymongo.errors import CollectionInvalid, OperationFailure, PyMongoError
+
+from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+
+USAGE_EVENTS = "usage_events"
+HOURLY_ROLLUPS = "usage_rollups_hourly"
+DAILY_ROLLUPS = "usage_rollups_daily"
+
+# Rollup scopes; "all" buckets use ALL_KEY so every bucket has a non-null key
+SCOPE_ALL, SCOPE_ORG, SCOPE_USER = "all", "org", "user"
+ALL_KEY = "*"
+
+
+async def ensure_usage_events_collection(database=None):
+    """Create ``usage_events`` as a time-series collection (MongoDB 5.0+)."""
+    database = db if database is None else database
+    try:
+        await database.create_collection(
+            USAGE_EVENTS,
+            timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+            expireAfterSeconds=settings.USAGE_EVENTS_RETENTION_DAYS * 24 * 3600,
+        )
+        logger.info(f"✅ Created time-series collection {USAGE_EVENTS}")
+    except CollectionInvalid:
+        pass
+    except OperationFailure as e:
+        if e.code != 48:  # NamespaceExists
+            logger.error(f"❌ Could not create time-series collection {USAGE_EVENTS}: {e}")
+
+
+async def record_usage_event(
+    user_id: str,
+    org_id: Optional[str],
+    assistant_id: Optional[str],
+    tokens_in: int,
+    tokens_out: int,
+    model: Optional[str] = None,
+):
+    """Append one charged turn to ``usage_events``; failures are logged, not raised."""
+    event = {
+        "ts": datetime.utcnow(),
+        "meta": {
+            "user_id": str(user_id),
+            "org_id": str(org_id) if org_id else None,
+            "assistant_id": str(assistant_id) if assistant_id else None,
+            "model": model,
+        },
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+    }
+    try:
+        await db[USAGE_EVENTS].insert_one(event)
+    except PyMongoError as e:
+        logger.error(f"Failed to record usage event for user {user_id}: {e}")
+
+
+async def get_daily_series(
+    scope: str = SCOPE_ALL, key: str = ALL_KEY, days: int = 30, database=None
+) -> List[dict]:
+    """Daily token totals for the last ``days`` days from the daily rollups, zero-filled."""
+    database = db if database is None else database
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    since = today - timedelta(days=days - 1)
+    buckets = await database[DAILY_ROLLUPS].find(
+        {"scope": scope, "key": key, "start": {"$gte": since}},
+        {"_id": 0, "start": 1, "tokens": 1},
+    ).to_list(length=days)
+    tokens_by_day = {b["start"].date(): b.get("tokens", 0) for b in buckets}
+    return [
+        {"date": day.strftime("%Y-%m-%d"), "tokens": tokens_by_day.get(day.date(), 0)}
+        for day in (since + timedelta(days=i) for i in range(days))
+    ]
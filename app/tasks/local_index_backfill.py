@@ -0,0 +1,47 @@
+import asyncio
+from typing import List, Optional
+
+from bson import ObjectId
+from openai import OpenAI
+
+from app.config import settings
+from app.db import db
+from app.services.local_index import Embedder, get_org_index, index_document_text
+from app.services.questionnaire import _extract_text
+from app.utils.logger import logger
+
+openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+
+
+def _download(file_id: str) -> bytes:
+    return openai_client.files.content(file_id).content
+
+
+async def backfill_local_index(org_id: str, embedder: Optional[Embedder] = None, database=None) -> List[str]:
+    """Add the org's existing documents that aren't in its local index yet.
+
+    Returns the filenames that could not be indexed; OpenAI doesn't hand back
+    the content of files uploaded for assistants, so those have to be uploaded
+    again.
+    """
+    database = db if database is None else database
+    indexed = await asyncio.to_thread(get_org_index(org_id).file_ids)
+    documents = await database.documents.find(
+        {"organization_id": {"$in": [org_id, ObjectId(org_id)]}, "openai_file_id": {"$nin": [None, ""]}},
+        {"filename": 1, "openai_file_id": 1},
+    ).to_list(length=None)
+
+    failed = []
+    for doc in documents:
+        file_id, filename = doc["openai_file_id"], doc.get("filename", "")
+        if file_id in indexed:
+            continue
+        try:
+            content = await asyncio.to_thread(_download, file_id)
+            text = await asyncio.to_thread(_extract_text, content, filename)
+            await index_document_text(org_id, filename, text, file_id=file_id, embedder=embedder)
+        except Exception as e:
+            logger.error(f"Failed to backfill {filename} ({file_id}) into the local index of org {org_id}: {e}")
+            failed.append(filename)
+    logger.info(f"Local index backfill for org {org_id}: {len(documents) - len(failed)}/{len(documents)} documents indexed")
+    return failed
@@ -0,0 +1,28 @@
+"""Move embedded `chats.messages` arrays into the `messages` collection.
+
+Run once after deploying: ``python -m app.tasks.migrate_chat_messages``.
+Safe to re-run; chats that are already migrated are skipped. Chats that are
+missed are migrated lazily the next time they are read or written.
+"""
+import asyncio
+
+from app.db import db
+from app.services.messages import migrate_chat
+from app.utils.indexes import ensure_indexes
+from app.utils.logger import logger
+
+
+async def migrate_chat_messages(batch_size: int = 500) -> int:
+    await ensure_indexes()
+    migrated_chats = 0
+    migrated_messages = 0
+    cursor = db.chats.find({"messages": {"$exists": True}}, {"_id": 1}).batch_size(batch_size)
+    async for chat in cursor:
+        migrated_messages += await migrate_chat(chat["_id"])
+        migrated_chats += 1
+    logger.info(f"✅ Migrated {migrated_messages} messages from {migrated_chats} chats")
+    return migrated_chats
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_chat_messages())
@@ -0,0 +1,176 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config import settings
+from app.db import db
+from app.utils.locks import acquire_lock, release_lock
+from app.utils.logger import logger
+from app.utils.quota_periods import current_period, flat_counter_expr
+
+LOCK_NAME = "quota_compaction"
+STATE = "quota_compaction_state"
+
+
+@dataclass(frozen=True)
+class CompactionPhase:
+    collection: str
+    periods: str  # path of the period -> counters map
+    legacy: tuple  # flat counters from before period keys; folded in, then removed
+    seed: dict = field(hash=False)  # this period's counters, computed from the legacy fields
+    zero: object = 0  # counters of a period with no usage
+
+    def _old_periods(self, oldest: str) -> dict:
+        return {"$filter": {
+            "input": {"$objectToArray": {"$ifNull": [f"${self.periods}", {}]}},
+            "cond": {"$lt": ["$$this.k", oldest]},
+        }}
+
+    def needs_compaction(self, oldest: str) -> dict:
+        return {"$or": [
+            *({name: {"$exists": True}} for name in self.legacy),
+            {"$expr": {"$gt": [{"$size": self._old_periods(oldest)}, 0]}},
+        ]}
+
+    def pipeline(self, period: str, oldest: str) -> list:
+        current = {"$ifNull": [f"${self.periods}", {"$arrayToObject": [[{"k": period, "v": self.seed}]]}]}
+        return [
+            {"$set": {self.periods: {"$arrayToObject": {"$filter": {
+                "input": {"$objectToArray": current},
+                "cond": {"$gte": ["$$this.k", oldest]},
+            }}}}},
+            {"$unset": list(self.legacy)},
+        ]
+
+
+def phases(period: str) -> list:
+    # Flat counters last reset in an earlier period seed zero
+    return [
+        CompactionPhase(
+            "users", "quota.periods", ("quota.used", "quota.reset_period"),
+            flat_counter_expr("$quota", "used", period),
+        ),
+        CompactionPhase(
+            "organizations", "usage_quota.periods", ("usage_quota.used", "usage_quota.reset_period"),
+            flat_counter_expr("$usage_quota", "used", period),
+        ),
+        CompactionPhase(
+            "usage", "periods", ("token_usage_monthly", "message_count_monthly", "reset_period"),
+            {
+                "tokens": flat_counter_expr("$$ROOT", "token_usage_monthly", period),
+                "messages": flat_counter_expr("$$ROOT", "message_count_monthly", period),
+            },
+            zero={"tokens": 0, "messages": 0},
+        ),
+    ]
+
+
+
+def oldest_kept_period(now: datetime, months: int) -> str:
+    """The earliest period kept when ``months`` periods (this one included) are retained."""
+    index = now.year * 12 + now.month - 1 - (months - 1)
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+async def _compact_batch(phase: CompactionPhase, after, period: str, oldest: str, database) -> Optional[tuple]:
+    """Compact the next ``_id`` range after ``after``; returns (last _id, docs modified) or None when done."""
+    query = {"_id": {"$gt": after}} if after is not None else {}
+    ids = await (
+        database[phase.collection].find(query, {"_id": 1})
+        .sort("_id", 1)
+        .limit(settings.QUOTA_COMPACTION_BATCH_SIZE)
+        .to_list(length=settings.QUOTA_COMPACTION_BATCH_SIZE)
+    )
+    if not ids:
+        return None
+    first, last = ids[0]["_id"], ids[-1]["_id"]
+    result = await database[phase.collection].update_many(
+        {"_id": {"$gte": first, "$lte": last}, **phase.needs_compaction(oldest)},
+        phase.pipeline(period, oldest),
+    )
+    return last, result.modified_count
+
+
+async def compact_quota_periods(now: datetime = None, database=None) -> int:
+    """Drop period counters older than QUOTA_PERIOD_RETENTION_MONTHS and move
+    documents still on flat monthly counters onto period keys.
+
+    Nothing has to happen at the month boundary (old periods just read as
+    zero), so this runs at its own pace: ``_id`` batches, at most
+    QUOTA_COMPACTION_MAX_DOCS_PER_SECOND, only touching documents that need
+    it. Progress is checkpointed per period and the job is scheduled every
+    QUOTA_COMPACTION_INTERVAL_MINUTES, so a crashed run resumes shortly and
+    runs after the period is done return at once; a lease keeps it to one
+    process in the cluster. Returns documents modified.
+    """
+    database = db if database is None else database
+    now = now or datetime.utcnow()
+    period = current_period(now)
+    oldest = oldest_kept_period(now, settings.QUOTA_PERIOD_RETENTION_MONTHS)
+    lock_ttl = timedelta(seconds=settings.QUOTA_COMPACTION_LOCK_SECONDS)
+
+    if not await acquire_lock(LOCK_NAME, lock_ttl, database=database):
+        logger.info("🗜️ Quota compaction already running elsewhere; skipping")
+        return 0
+
+    total = 0
+    try:
+        state = await database[STATE].find_one({"_id": period}) or {}
+        if state.get("done"):
+            return 0
+        logger.info(f"🗜️ Compacting quota periods before {oldest} (resuming at {state.get('phase') or 'start'})")
+        todo = phases(period)
+        names = [phase.collection for phase in todo]
+        start = names.index(state["phase"]) if state.get("phase") in names else 0
+        min_batch_seconds = settings.QUOTA_COMPACTION_BATCH_SIZE / settings.QUOTA_COMPACTION_MAX_DOCS_PER_SECOND
+
+        for phase in todo[start:]:
+            after = state.get("last_id") if state.get("phase") == phase.collection else None
+            while True:
+                started = time.monotonic()
+                batch = await _compact_batch(phase, after, period, oldest, database)
+                if batch is None:
+                    break
+                after, modified = batch
+                total += modified
+                await database[STATE].update_one(
+                    {"_id": period},
+                    {"$set": {"phase": phase.collection, "last_id": after, "updated_at": datetime.utcnow()},
+                     "$inc": {"compacted": modified}},
+                    upsert=True,
+                )
+                if not await acquire_lock(LOCK_NAME, lock_ttl, database=database):
+                    logger.error(f"❌ Lost the quota compaction lock during {phase.collection}; stopping")
+                    return total
+                await asyncio.sleep(max(0.0, min_batch_seconds - (time.monotonic() - started)))
+            logger.info(f"🗜️ Compacted {phase.collection} quota periods")
+
+        await database[STATE].update_one(
+            {"_id": period}, {"$set": {"done": True, "finished_at": datetime.utcnow()}}, upsert=True
+        )
+        logger.info(f"✅ Quota periods compacted for {period}: {total} documents updated.")
+        return total
+    finally:
+        await release_lock(LOCK_NAME, database=database)
+
+
+async def reset_current_period(now: datetime = None, database=None) -> int:
+    """Forgive this period's usage everywhere (the admin "reset quotas" action).
+
+    Only documents with a counter for the period, or still on the flat
+    counters, are written.
+    """
+    database = db if database is None else database
+    period = current_period(now)
+    total = 0
+    for phase in phases(period):
+        counter = f"{phase.periods}.{period}"
+        result = await database[phase.collection].update_many(
+            {"$or": [{counter: {"$exists": True}}, *({name: {"$exists": True}} for name in phase.legacy)]},
+            {"$set": {counter: phase.zero}, "$unset": {name: "" for name in phase.legacy}},
+        )
+        total += result.modified_count
+    logger.info(f"🔁 Reset {total} quota counters for {period}")
+    return total
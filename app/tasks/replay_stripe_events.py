@@ -0,0 +1,57 @@
+"""Backfill or re-apply Stripe webhook events through the inbox.
+
+    python -m app.tasks.replay_stripe_events --since 2026-01-01 [--type invoice.paid]
+    python -m app.tasks.replay_stripe_events --since 2026-01-01 --reapply
+
+Events are fetched from Stripe's event list and enqueued; ones already in the
+inbox are skipped unless --reapply resets them to pending. Applying an event
+is idempotent and emails are never sent twice, so replays are safe.
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+
+import stripe
+
+from app.db import db
+from app.services.stripe_events import DONE, FAILED, INBOX, PENDING, enqueue_event, process_pending_events
+from app.utils.logger import logger
+
+
+def _list_events(since: datetime, event_type: Optional[str]) -> List[dict]:
+    params = {"limit": 100, "created": {"gte": int((since - datetime(1970, 1, 1)).total_seconds())}}
+    if event_type:
+        params["type"] = event_type
+    return [event.to_dict() for event in stripe.Event.list(**params).auto_paging_iter()]
+
+
+async def replay_stripe_events(since: datetime, event_type: Optional[str] = None, reapply: bool = False) -> int:
+    events = await asyncio.to_thread(_list_events, since, event_type)
+    enqueued = 0
+    for event in sorted(events, key=lambda e: e.get("created", 0)):
+        enqueued += await enqueue_event(event)
+    if reapply:
+        query = {"created": {"$gte": int((since - datetime(1970, 1, 1)).total_seconds())}, "status": {"$in": [DONE, FAILED]}}
+        if event_type:
+            query["type"] = event_type
+        result = await db[INBOX].update_many(query, {"$set": {"status": PENDING, "attempts": 0}})
+        logger.info(f"🔁 Reset {result.modified_count} inbox events to pending")
+
+    applied = 0
+    while True:
+        batch = await process_pending_events()
+        applied += batch
+        if not batch:
+            break
+    logger.info(f"✅ Replay done: {len(events)} events from Stripe, {enqueued} new, {applied} applied")
+    return applied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--since", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--type", dest="event_type")
+    parser.add_argument("--reapply", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(replay_stripe_events(args.since, args.event_type, args.reapply))
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+from app.db import db
+from app.services.usage_events import (
+    ALL_KEY,
+    DAILY_ROLLUPS,
+    HOURLY_ROLLUPS,
+    SCOPE_ALL,
+    SCOPE_ORG,
+    SCOPE_USER,
+    USAGE_EVENTS,
+)
+from app.utils.logger import logger
+
+ROLLUP_STATE_ID = "usage_rollup"
+# Re-read a little before the watermark so events inserted late still land
+LATE_EVENT_GRACE = timedelta(minutes=5)
+
+_MERGE_ON = ["scope", "key", "start"]
+
+
+def _hourly_pipeline(start: datetime, end: datetime) -> list:
+    return [
+        {"$match": {"ts": {"$gte": start, "$lt": end}}},
+        {"$project": {
+            "start": {"$dateTrunc": {"date": "$ts", "unit": "hour"}},
+            "tokens_in": 1,
+            "tokens_out": 1,
+            "bucket": [
+                {"scope": SCOPE_ALL, "key": ALL_KEY},
+                {"scope": SCOPE_ORG, "key": "$meta.org_id"},
+                {"scope": SCOPE_USER, "key": "$meta.user_id"},
+            ],
+        }},
+        {"$unwind": "$bucket"},
+        {"$match": {"bucket.key": {"$ne": None}}},
+        {"$group": {
+            "_id": {"scope": "$bucket.scope", "key": "$bucket.key", "start": "$start"},
+            "tokens_in": {"$sum": "$tokens_in"},
+            "tokens_out": {"$sum": "$tokens_out"},
+            "events": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "scope": "$_id.scope",
+            "key": "$_id.key",
+            "start": "$_id.start",
+            "tokens_in": 1,
+            "tokens_out": 1,
+            "tokens": {"$add": ["$tokens_in", "$tokens_out"]},
+            "events": 1,
+        }},
+        {"$merge": {"into": HOURLY_ROLLUPS, "on": _MERGE_ON, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def _daily_pipeline(start: datetime, end: datetime) -> list:
+    return [
+        {"$match": {"start": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {"scope": "$scope", "key": "$key", "start": {"$dateTrunc": {"date": "$start", "unit": "day"}}},
+            "tokens_in": {"$sum": "$tokens_in"},
+            "tokens_out": {"$sum": "$tokens_out"},
+            "tokens": {"$sum": "$tokens"},
+            "events": {"$sum": "$events"},
+        }},
+        {"$project": {
+            "_id": 0,
+            "scope": "$_id.scope",
+            "key": "$_id.key",
+            "start": "$_id.start",
+            "tokens_in": 1,
+            "tokens_out": 1,
+            "tokens": 1,
+            "events": 1,
+        }},
+        {"$merge": {"into": DAILY_ROLLUPS, "on": _MERGE_ON, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+async def rollup_usage(now: datetime = None):
+    """Fold new usage events into hourly buckets, then the touched days into daily ones.
+
+    Only whole hours (and days) that may have changed since the last run are
+    recomputed, and the results replace the previous buckets, so re-running
+    is harmless.
+    """
+    now = now or datetime.utcnow()
+    state = await db.rollup_state.find_one({"_id": ROLLUP_STATE_ID})
+    watermark = state["watermark"] if state else datetime(1970, 1, 1)
+
+    hour_start = (watermark - LATE_EVENT_GRACE).replace(minute=0, second=0, microsecond=0)
+    day_start = hour_start.replace(hour=0)
+
+    await db[USAGE_EVENTS].aggregate(_hourly_pipeline(hour_start, now)).to_list(length=None)
+    await db[HOURLY_ROLLUPS].aggregate(_daily_pipeline(day_start, now)).to_list(length=None)
+    await db.rollup_state.update_one({"_id": ROLLUP_STATE_ID}, {"$set": {"watermark": now}}, upsert=True)
+    logger.info(f"📊 Usage rolled up from {hour_start:%Y-%m-%d %H:00} to {now:%Y-%m-%d %H:%M}")
@@ -1,29 +1,67 @@
-from app import db
 from fastapi import HTTPException, Depends
-from passlib.context import CryptContext
 import jwt
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+from typing import Optional, Tuple
 from app.config import settings
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from bson import ObjectId
+from app.services.password_hashing import password_hasher
+from app.utils.context import RequestContext, get_cached_user, get_token_version, load_user_context
 
 auth_scheme = HTTPBearer()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 SECRET_KEY = settings.JWT_SECRET
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
 
-def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+class VerifiedTokenCache:
+    """LRU of decoded JWT payloads keyed by signature; an entry expires with the token."""
+
+    def __init__(self, max_entries: int = settings.TOKEN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, dict]]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        signing_input, _, signature = token.rpartition(".")
+        entry = self._entries.get(signature)
+        # The signed part must match too, so a reused signature never serves another payload
+        if not entry or entry[0] != signing_input:
+            return None
+        if entry[1].get("exp", 0) <= time.time():
+            self._entries.pop(signature, None)
+            return None
+        self._entries.move_to_end(signature)
+        return entry[1]
+
+    def put(self, token: str, payload: dict):
+        signing_input, _, signature = token.rpartition(".")
+        self._entries[signature] = (signing_input, payload)
+        self._entries.move_to_end(signature)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+verified_tokens = VerifiedTokenCache()
+
+# Claims of the token that authenticated the current request, set by the auth dependencies
+_request_claims: ContextVar[Optional[dict]] = ContextVar("request_claims", default=None)
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
 
 def create_access_token(
     user_id: str,
     role: str,
     email: str,
     expires_minutes=settings.JWT_EXPIRES_MINUTES,
+    *,
+    organization_id=None,
+    agent_id=None,
+    token_version: int = 0,
 ) -> str:
     try:
         expiry = int(expires_minutes)
@@ -34,6 +72,9 @@ def create_access_token(
         "sub": user_id,
         "role": role,
         "email": email,
+        "organization_id": str(organization_id) if organization_id else None,
+        "agent_id": str(agent_id) if agent_id else None,
+        "token_version": token_version,
         "exp": datetime.utcnow() + timedelta(minutes=expiry)
     }
     return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
@@ -41,20 +82,39 @@ def create_access_token(
 def decode_token(token: str):
     if not token or token.count('.') != 2:
         raise HTTPException(status_code=401, detail="Invalid token format")
+    payload = verified_tokens.get(token)
+    if payload is not None:
+        return dict(payload)
     try:
-        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.DecodeError:
         raise HTTPException(status_code=401, detail="Token decode error")
+    verified_tokens.put(token, payload)
+    return dict(payload)
+
+async def verify_claims(token: str) -> dict:
+    """Decode ``token`` and reject it if its user's token_version has moved on.
+
+    Tokens issued before claims existed carry no version and are only checked
+    for signature and expiry.
+    """
+    payload = decode_token(token)
+    if "token_version" in payload:
+        current = await get_token_version(payload["sub"])
+        if current is None or current != payload["token_version"]:
+            raise HTTPException(status_code=401, detail="Token revoked")
+    _request_claims.set(payload)
+    return payload
     
-def get_current_user(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
-    payload = decode_token(token.credentials)
+async def get_current_user(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+    payload = await verify_claims(token.credentials)
     return payload['sub'], payload['role'], payload.get('email')
 
-def verify_token(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+async def verify_token(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     try:
-        payload = decode_token(token.credentials)
+        payload = await verify_claims(token.credentials)
         user_id = payload['sub']
         return user_id
     except HTTPException as e:
@@ -63,7 +123,28 @@ def verify_token(token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 async def require_role(user_id: str, allowed_roles: list[str]):
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    """Raise 403 unless ``user_id`` has one of ``allowed_roles``.
+
+    Answered from the request's token claims when they belong to ``user_id``
+    (a role change revokes the token); otherwise from the cached user doc.
+    """
+    claims = _request_claims.get()
+    if claims and claims.get("sub") == str(user_id) and "token_version" in claims:
+        if claims.get("role") not in allowed_roles:
+            raise HTTPException(status_code=403, detail="Access denied")
+        return claims
+    user = await get_cached_user(user_id)
     if not user or user["role"] not in allowed_roles:
         raise HTTPException(status_code=403, detail="Access denied")
-    return user
\ No newline at end of file
+    return user
+
+async def get_request_context(user=Depends(get_current_user)) -> RequestContext:
+    """User, organization and assistant docs for the caller, loaded once per request."""
+    user_id, role, email = user
+    user_doc, org_doc, assistant_doc = await load_user_context(user_id)
+    if not user_doc:
+        raise HTTPException(status_code=403, detail="User not found.")
+    return RequestContext(
+        user_id=user_id, role=role, email=email,
+        user=user_doc, organization=org_doc, assistant=assistant_doc,
+    )
\ No newline at end of file
@@ -0,0 +1,178 @@
+import copy
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+from app.utils.quota_periods import current_period, quota_used
+
+
+@dataclass
+class RequestContext:
+    """The caller's user, organization and assigned assistant documents."""
+
+    user_id: str
+    role: str
+    email: Optional[str]
+    user: dict
+    organization: Optional[dict] = None
+    assistant: Optional[dict] = None
+
+    @property
+    def organization_id(self) -> Optional[str]:
+        org_id = self.user.get("organization_id")
+        return str(org_id) if org_id else None
+
+
+class _TTLCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, Optional[dict]]] = {}
+
+    def get(self, key: str) -> Tuple[bool, Optional[dict]]:
+        entry = self._entries.get(key)
+        if not entry or entry[0] < time.monotonic():
+            return False, None
+        return True, entry[1]
+
+    def put(self, key: str, doc: Optional[dict]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, doc)
+
+    def pop(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+_users = _TTLCache(settings.CONTEXT_CACHE_TTL_SECONDS)
+_organizations = _TTLCache(settings.CONTEXT_CACHE_TTL_SECONDS)
+_assistants = _TTLCache(settings.CONTEXT_CACHE_TTL_SECONDS)
+_token_versions = _TTLCache(settings.CONTEXT_CACHE_TTL_SECONDS)
+
+
+def as_object_id(field: str) -> dict:
+    return {"$convert": {"input": f"${field}", "to": "objectId", "onError": None, "onNull": None}}
+
+
+def _context_pipeline(user_id: str) -> list:
+    return [
+        {"$match": {"_id": ObjectId(user_id)}},
+        {"$limit": 1},
+        {"$lookup": {
+            "from": "organizations",
+            "let": {"org_id": as_object_id("organization_id")},
+            "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$org_id"]}}}],
+            "as": "_organization",
+        }},
+        {"$lookup": {
+            "from": "assistants",
+            "let": {"agent_id": as_object_id("agent_id")},
+            "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$agent_id"]}}}],
+            "as": "_assistant",
+        }},
+    ]
+
+
+async def load_user_context(user_id: str) -> Tuple[Optional[dict], Optional[dict], Optional[dict]]:
+    """Return copies of (user, organization, assistant) for ``user_id``.
+
+    Served from a short-TTL process cache; on a miss all three documents are
+    fetched with one aggregation. Writers call the ``invalidate_*`` helpers.
+    """
+    user_id = str(user_id)
+    hit, user = _users.get(user_id)
+    if hit and user is not None:
+        org_id, agent_id = user.get("organization_id"), user.get("agent_id")
+        org_hit, org = _organizations.get(str(org_id)) if org_id else (True, None)
+        assistant_hit, assistant = _assistants.get(str(agent_id)) if agent_id else (True, None)
+        if org_hit and assistant_hit:
+            return copy.deepcopy(user), copy.deepcopy(org), copy.deepcopy(assistant)
+
+    docs = await db.users.aggregate(_context_pipeline(user_id)).to_list(length=1)
+    if not docs:
+        return None, None, None
+    user = docs[0]
+    org = (user.pop("_organization") or [None])[0]
+    assistant = (user.pop("_assistant") or [None])[0]
+    _users.put(user_id, user)
+    if user.get("organization_id"):
+        _organizations.put(str(user["organization_id"]), org)
+    if user.get("agent_id"):
+        _assistants.put(str(user["agent_id"]), assistant)
+    logger.debug(f"Loaded request context for user {user_id}")
+    return copy.deepcopy(user), copy.deepcopy(org), copy.deepcopy(assistant)
+
+
+async def get_cached_user(user_id: str) -> Optional[dict]:
+    """Drop-in for ``db.users.find_one({"_id": ObjectId(user_id)})`` in auth checks."""
+    user, _, _ = await load_user_context(user_id)
+    return user
+
+
+async def get_token_version(user_id: str) -> Optional[int]:
+    """The user's current ``token_version`` (None if the user is gone).
+
+    Answered from the context cache when the user doc is there, else from a
+    short-TTL cache of a projected lookup.
+    """
+    user_id = str(user_id)
+    hit, doc = _users.get(user_id)
+    if not hit:
+        hit, doc = _token_versions.get(user_id)
+    if not hit:
+        try:
+            doc = await db.users.find_one({"_id": ObjectId(user_id)}, {"token_version": 1})
+        except InvalidId:
+            doc = None
+        _token_versions.put(user_id, doc)
+    return doc.get("token_version", 0) if doc else None
+
+
+async def revoke_user_tokens(user_id):
+    """Invalidate every token issued to ``user_id`` so far; call after changing
+    anything tokens carry as claims (role, organization, agent) or deactivating."""
+    await db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"token_version": 1}})
+    invalidate_user_context(user_id)
+
+
+def invalidate_user_context(user_id):
+    _users.pop(str(user_id))
+    _token_versions.pop(str(user_id))
+
+
+def invalidate_org_context(org_id):
+    _organizations.pop(str(org_id))
+
+
+def invalidate_assistant_context(assistant_id):
+    _assistants.pop(str(assistant_id))
+
+
+def _distinct(*docs):
+    return list({id(doc): doc for doc in docs if doc is not None}.values())
+
+
+def _add_period_usage(quota: dict, tokens_used: int):
+    quota.setdefault("periods", {})[current_period()] = quota_used(quota) + tokens_used
+
+
+def apply_usage_increment(user_id, org_id, tokens_used: int, user_quota: bool, user_doc: dict = None, org_doc: dict = None):
+    """Mirror quota ``$inc`` writes into cached documents instead of evicting them.
+
+    ``user_doc``/``org_doc`` are the caller's copies, updated the same way so a
+    second charge in the same request sees the first.
+    """
+    hit, cached_user = _users.get(str(user_id))
+    if user_quota:
+        for user in _distinct(user_doc, cached_user if hit else None):
+            _add_period_usage(user.setdefault("quota", {}), tokens_used)
+    if org_id:
+        hit, cached_org = _organizations.get(str(org_id))
+        for org in _distinct(org_doc, cached_org if hit else None):
+            _add_period_usage(org.setdefault("usage_quota", {}), tokens_used)
@@ -0,0 +1,133 @@
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+
+# Indexes every deployment needs, per collection. ensure_indexes() creates them
+# at startup; create_indexes is a no-op for indexes that already exist.
+REQUIRED_INDEXES: Dict[str, List[IndexModel]] = {
+    "chats": [
+        IndexModel([("user_id", ASCENDING), ("createdAt", DESCENDING)], name="user_id_createdAt"),
+        IndexModel(
+            [("user_id", ASCENDING), ("updatedAt", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_updatedAt_id",
+        ),
+    ],
+    "messages": [
+        IndexModel([("chat_id", ASCENDING), ("seq", ASCENDING)], name="chat_id_seq_unique", unique=True),
+    ],
+    "usage": [
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ],
+    "verses": [
+        IndexModel([("reference", ASCENDING)], name="reference"),
+    ],
+    "documents": [
+        IndexModel(
+            [("openai_file_id", ASCENDING)],
+            name="openai_file_id_unique",
+            unique=True,
+            partialFilterExpression={"openai_file_id": {"$type": "string"}},
+        ),
+        IndexModel([("organization_id", ASCENDING)], name="organization_id"),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email"),
+        IndexModel([("organization_id", ASCENDING), ("role", ASCENDING)], name="organization_id_role"),
+        IndexModel([("invite_token", ASCENDING)], name="invite_token", sparse=True),
+    ],
+    "assistants": [
+        IndexModel([("org_id", ASCENDING)], name="org_id"),
+    ],
+    "quota_requests": [
+        IndexModel([("status", ASCENDING), ("user_id", ASCENDING)], name="status_user_id"),
+    ],
+    "usage_rollups_hourly": [
+        IndexModel([("scope", ASCENDING), ("key", ASCENDING), ("start", ASCENDING)], name="scope_key_start", unique=True),
+        IndexModel([("start", ASCENDING)], name="start"),
+    ],
+    "usage_rollups_daily": [
+        IndexModel([("scope", ASCENDING), ("key", ASCENDING), ("start", ASCENDING)], name="scope_key_start", unique=True),
+    ],
+    "billing_events": [
+        IndexModel([("customer", ASCENDING), ("created", DESCENDING)], name="customer_created"),
+    ],
+    "stripe_webhook_inbox": [
+        IndexModel([("status", ASCENDING), ("created", ASCENDING)], name="status_created"),
+    ],
+    "job_runs": [
+        IndexModel([("job", ASCENDING), ("started_at", DESCENDING)], name="job_started_at"),
+        IndexModel(
+            [("started_at", ASCENDING)],
+            name="started_at_ttl",
+            expireAfterSeconds=settings.JOB_RUNS_RETENTION_DAYS * 24 * 3600,
+        ),
+    ],
+    "retrieval_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Representative filters of the hot read paths: (collection, filter, sort).
+# Values only need the right shape; the plan checker runs them with explain().
+HOT_QUERIES: List[Tuple[str, dict, Optional[list]]] = [
+    ("chats", {"user_id": "u"}, [("createdAt", DESCENDING)]),
+    ("chats", {"user_id": "u"}, [("updatedAt", DESCENDING), ("_id", DESCENDING)]),
+    ("messages", {"chat_id": "c"}, [("seq", DESCENDING)]),
+    ("messages", {"chat_id": "c", "seq": {"$lt": 50}}, [("seq", DESCENDING)]),
+    ("usage", {"user_id": "u"}, None),
+    ("usage_rollups_daily", {"scope": "org", "key": "o", "start": {"$gte": 0}}, None),
+    ("usage_rollups_hourly", {"start": {"$gte": 0}}, None),
+    ("billing_events", {"customer": "cus_x"}, [("created", DESCENDING)]),
+    ("stripe_webhook_inbox", {"status": "pending"}, [("created", ASCENDING)]),
+    ("job_runs", {"job": "rollup_usage"}, [("started_at", DESCENDING)]),
+    ("verses", {"reference": "1:1"}, None),
+    ("documents", {"openai_file_id": "file-x"}, None),
+    ("documents", {"openai_file_id": {"$in": ["file-x", "file-y"]}}, None),
+    ("documents", {"organization_id": "o"}, None),
+    ("users", {"email": "a@b.c"}, None),
+    ("users", {"organization_id": "o"}, None),
+    ("users", {"organization_id": "o", "role": "organization_head"}, None),
+    ("users", {"invite_token": "t", "status": "invited"}, None),
+    ("assistants", {"org_id": "o"}, None),
+    ("quota_requests", {"status": "pending"}, None),
+    ("quota_requests", {"user_id": {"$in": ["u"]}, "status": "pending"}, None),
+]
+
+
+async def ensure_indexes(database=None):
+    """Create every index in REQUIRED_INDEXES; failures are logged, not raised."""
+    database = db if database is None else database
+    for collection, models in REQUIRED_INDEXES.items():
+        try:
+            await database[collection].create_indexes(models)
+        except PyMongoError as e:
+            logger.error(f"❌ Failed to ensure indexes on {collection}: {e}")
+    logger.info(f"✅ Indexes ensured on {len(REQUIRED_INDEXES)} collections")
+
+
+def _stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if isinstance(plan.get(key), dict):
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def find_collscans(database) -> List[str]:
+    """Run every HOT_QUERY with explain() and describe those whose winning plan is a COLLSCAN."""
+    offenders = []
+    for collection, query, sort in HOT_QUERIES:
+        cursor = database[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in set(_stages(winning)):
+            offenders.append(f"{collection}.find({query})")
+    return offenders
@@ -0,0 +1,39 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.db import db
+
+LOCKS = "job_locks"
+
+# Identifies this process as a lock owner
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+async def acquire_lock(name: str, ttl: timedelta, owner: str = INSTANCE_ID, database=None) -> bool:
+    """Take (or extend, if ``owner`` already holds it) the lease ``name`` for ``ttl``.
+
+    A lease whose holder stopped renewing is taken over once it expires.
+    """
+    database = db if database is None else database
+    now = datetime.utcnow()
+    try:
+        doc = await database[LOCKS].find_one_and_update(
+            {"_id": name, "$or": [{"owner": owner}, {"expires_at": {"$lte": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + ttl}, "$setOnInsert": {"acquired_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # Someone else holds a live lease, so the upsert collided with their doc
+        return False
+    return bool(doc) and doc.get("owner") == owner
+
+
+async def release_lock(name: str, owner: str = INSTANCE_ID, database=None):
+    database = db if database is None else database
+    await database[LOCKS].delete_one({"_id": name, "owner": owner})
@@ -1,6 +1,12 @@
+import atexit
+import json
 import os
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from collections import Counter
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from app.config import settings
 
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -13,17 +19,6 @@ LOG_FILES = {
     "error": os.path.join(LOG_DIR, "error.log"),
 }
 
-# Set up base logger
-logger = logging.getLogger("quran_logger")
-logger.setLevel(logging.DEBUG)
-
-# Formatter for all logs
-formatter = logging.Formatter(
-    "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
-
-# Create handlers for each log level
 levels = {
     "debug": logging.DEBUG,
     "info": logging.INFO,
@@ -31,10 +26,96 @@ levels = {
     "error": logging.ERROR
 }
 
-for level_name, level in levels.items():
-    handler = RotatingFileHandler(LOG_FILES[level_name], maxBytes=2_000_000, backupCount=5)
-    handler.setLevel(level)
-    handler.setFormatter(formatter)
-    # Filter to allow only that level
-    handler.addFilter(lambda record, lvl=level: record.levelno == lvl)
-    logger.addHandler(handler)
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample_every"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra=`` fields are included as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ExactLevelFilter:
+    """Let through only records of one level, so each file holds a single level."""
+
+    def __init__(self, level: int):
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno == self.level
+
+
+class ModuleLevelFilter:
+    """Per-module minimum levels, e.g. ``{"assistant": "INFO"}``."""
+
+    def __init__(self, module_levels: dict):
+        self.module_levels = {module: logging.getLevelName(level.upper()) for module, level in module_levels.items()}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        minimum = self.module_levels.get(record.module)
+        return minimum is None or record.levelno >= minimum
+
+
+class SamplingFilter:
+    """Keep one in ``sample_every`` records per call site for records logged
+    with ``extra={"sample_every": n}``; everything else passes."""
+
+    def __init__(self):
+        self._seen = Counter()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", 1)
+        if every <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        self._seen[key] += 1
+        return self._seen[key] % every == 1
+
+
+class LazyQueueHandler(QueueHandler):
+    """Enqueue the record as-is; the message is only formatted on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _file_handlers() -> list:
+    formatter = JsonFormatter() if settings.LOG_JSON else logging.Formatter(
+        "[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S"
+    )
+    handlers = []
+    for level_name, level in levels.items():
+        handler = RotatingFileHandler(LOG_FILES[level_name], maxBytes=2_000_000, backupCount=5, encoding="utf-8")
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        handler.addFilter(ExactLevelFilter(level))
+        handlers.append(handler)
+    return handlers
+
+
+# Set up base logger: callers only pay for building a record and a queue put;
+# formatting and file writes happen on the listener's thread.
+logger = logging.getLogger("quran_logger")
+logger.setLevel(settings.LOG_LEVEL.upper())
+logger.propagate = False
+logger.addFilter(ModuleLevelFilter(settings.LOG_MODULE_LEVELS))
+logger.addFilter(SamplingFilter())
+
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+logger.addHandler(LazyQueueHandler(log_queue))
+
+listener = QueueListener(log_queue, *_file_handlers(), respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
@@ -5,35 +5,68 @@ from bson import ObjectId
 from app.db import db
 from app.utils.logger import logger
 from app.config import settings
+from app.utils.context import apply_usage_increment
+from app.services.leaderboard import record_charge
+from app.utils.quota_periods import current_period, quota_field, quota_used, usage_counts, usage_field
 
 DEFAULT_LIMITS = settings.DEFAULT_LIMITS # Tier-based limits
 
-async def enforce_quota_and_update(user_id: str, tokens_used: int = 0, send_warning: bool = True): # Added send_warning
+
+async def _charge_period(collection, doc_filter: dict, periods_path: str, increments: dict, seed: dict = None):
+    """``$inc`` this period's counters. ``seed`` (counter -> current value) is
+    passed for documents still on the old flat counters: the first charge then
+    writes seed + increment, carrying the month's usage over to the new layout."""
+    if seed is not None:
+        result = await collection.update_one(
+            {**doc_filter, periods_path: {"$exists": False}},
+            {"$set": {field: seed.get(field, 0) + inc for field, inc in increments.items()}},
+        )
+        if result.matched_count:
+            return
+    await collection.update_one(doc_filter, {"$inc": increments})
+
+async def enforce_quota_and_update(
+    user_id: str,
+    tokens_used: int = 0,
+    send_warning: bool = True,
+    user_profile: dict = None,
+    org_doc: dict = None,
+):
+    """Check and charge ``tokens_used`` against the user's and organization's quotas.
+
+    Callers holding a ``RequestContext`` pass its ``user``/``organization`` docs
+    to skip the lookups; the charged amounts are applied to those dicts so a
+    second charge in the same request sees the new totals.
+    """
     if tokens_used < 0:
         logger.error(f"Attempted to process negative tokens_used ({tokens_used}) for user {user_id}.")
         raise HTTPException(status_code=400, detail="Tokens used cannot be negative.")
 
     # 1. Fetch User Profile
-    user_profile = await db.users.find_one({"_id": ObjectId(user_id)})
+    if user_profile is None:
+        user_profile = await db.users.find_one({"_id": ObjectId(user_id)})
     if not user_profile:
         # This should ideally not happen for an authenticated user if token validation is robust
         logger.error(f"CRITICAL: User profile not found for user_id: {user_id} during quota enforcement.")
         raise HTTPException(status_code=500, detail="User profile not found. Please contact support.")
 
     organization_id = user_profile.get("organization_id")
-    org_doc = None
     is_org_member = bool(organization_id)
+    if not is_org_member:
+        org_doc = None
+    period = current_period()
 
     # 2. Organization Quota Check (Priority Check, if user belongs to an org)
     if is_org_member:
-        org_doc = await db.organizations.find_one({"_id": organization_id})
+        if org_doc is None:
+            org_doc = await db.organizations.find_one({"_id": organization_id})
         if not org_doc:
             logger.error(f"CRITICAL: Organization document not found for organization_id: {organization_id} linked to user {user_id}.")
             raise HTTPException(status_code=500, detail="User's organization data not found. Data inconsistency.")
 
         org_usage_quota = org_doc.get("usage_quota", {})
         org_total_limit = org_usage_quota.get("total_limit", 0)
-        org_current_used = org_usage_quota.get("used", 0)
+        org_current_used = quota_used(org_usage_quota, period)
 
         if org_current_used + tokens_used > org_total_limit:
             logger.warning(f"Organization {organization_id} quota limit reached. User {user_id} denied usage of {tokens_used} tokens.")
@@ -44,10 +77,11 @@ async def enforce_quota_and_update(user_id: str, tokens_used: int = 0, send_warn
     effective_user_token_limit = -1 # -1 can mean unlimited or fallback to a very high number if not set by tier
     current_user_tokens_spent = 0
     user_quota_field = user_profile.get("quota")
+    usage_doc = None
 
     if is_org_member and user_quota_field and isinstance(user_quota_field.get("monthly_limit"), (int, float)) and user_quota_field["monthly_limit"] >= 0:
         effective_user_token_limit = user_quota_field["monthly_limit"]
-        current_user_tokens_spent = user_quota_field.get("used", 0)
+        current_user_tokens_spent = quota_used(user_quota_field, period)
         is_org_managed_user_quota = True
         logger.info(f"User {user_id} is using organization-defined quota. Limit: {effective_user_token_limit}, Used: {current_user_tokens_spent}")
     else:
@@ -61,15 +95,14 @@ async def enforce_quota_and_update(user_id: str, tokens_used: int = 0, send_warn
             usage_doc = {
                 "user_id": user_id,
                 "tier": tier,
-                "token_usage_monthly": 0,
-                "message_count_monthly": 0,
+                "periods": {},
                 "limits": tier_limits, # Set limits from tier
                 "last_reset": datetime.utcnow() # Consider if reset logic needs to be more sophisticated
             }
             await db.usage.insert_one(usage_doc)
 
         effective_user_token_limit = usage_doc["limits"].get("tokens", 0)
-        current_user_tokens_spent = usage_doc.get("token_usage_monthly", 0)
+        current_user_tokens_spent, _ = usage_counts(usage_doc, period)
         logger.info(f"User {user_id} is using tier-based quota ('{tier}'). Limit: {effective_user_token_limit}, Used: {current_user_tokens_spent}")
 
 
@@ -81,20 +114,20 @@ async def enforce_quota_and_update(user_id: str, tokens_used: int = 0, send_warn
     # 5. Message Quota Check (Always from db.usage for now, as per problem statement)
     # Fetch/create usage_doc if it wasn't fetched in step 3 (i.e., if is_org_managed_user_quota was true)
     # This means even org users with specific token quotas might still be subject to a general message limit from their tier.
-    usage_doc_for_messages = await db.usage.find_one({"user_id": user_id})
+    usage_doc_for_messages = usage_doc or await db.usage.find_one({"user_id": user_id})
     if not usage_doc_for_messages:
         # This implies a new user, or an org user who never had a usage_doc. Create one.
         tier = user_profile.get("tier", "free") # Re-evaluate tier for safety
         tier_limits_for_msg = DEFAULT_LIMITS.get(tier, DEFAULT_LIMITS["free"])
         logger.info(f"Creating usage document for user {user_id} (for message tracking) with tier '{tier}' limits.")
         usage_doc_for_messages = {
-            "user_id": user_id, "tier": tier, "token_usage_monthly": 0,
-            "message_count_monthly": 0, "limits": tier_limits_for_msg,
+            "user_id": user_id, "tier": tier, "periods": {},
+            "limits": tier_limits_for_msg,
             "last_reset": datetime.utcnow()
         }
         await db.usage.insert_one(usage_doc_for_messages)
 
-    current_messages_sent = usage_doc_for_messages.get("message_count_monthly", 0)
+    usage_tokens_spent, current_messages_sent = usage_counts(usage_doc_for_messages, period)
     message_limit = usage_doc_for_messages.get("limits", {}).get("messages", 0)
 
     if message_limit > 0 and (current_messages_sent + 1 > message_limit): # +1 for the current message
@@ -103,24 +136,42 @@ async def enforce_quota_and_update(user_id: str, tokens_used: int = 0, send_warn
 
     # 6. If all checks passed - Perform Updates
     # User's Token Quota Update
+    usage_inc = {usage_field("messages", period): 1}
     if is_org_managed_user_quota:
-        await db.users.update_one({"_id": ObjectId(user_id)}, {"$inc": {"quota.used": tokens_used}})
+        await _charge_period(
+            db.users, {"_id": ObjectId(user_id)}, "quota.periods",
+            {quota_field("quota", period): tokens_used},
+            seed=None if "periods" in user_quota_field else {quota_field("quota", period): current_user_tokens_spent},
+        )
         logger.info(f"Updated user DB quota for {user_id}. Added tokens: {tokens_used}")
     else: # Tier-based token usage
-        await db.usage.update_one({"user_id": user_id}, {"$inc": {"token_usage_monthly": tokens_used}})
-        logger.info(f"Updated usage DB (tokens) for {user_id}. Added tokens: {tokens_used}")
+        usage_inc[usage_field("tokens", period)] = tokens_used
 
     # Organization's Quota Update (if applicable)
     if is_org_member and org_doc: # org_doc would have been fetched if is_org_member
-        await db.organizations.update_one({"_id": organization_id}, {"$inc": {"usage_quota.used": tokens_used}})
+        await _charge_period(
+            db.organizations, {"_id": organization_id}, "usage_quota.periods",
+            {quota_field("usage_quota", period): tokens_used},
+            seed=None if "periods" in org_usage_quota else {quota_field("usage_quota", period): org_current_used},
+        )
         logger.info(f"Updated organization DB quota for org {organization_id}. Added tokens: {tokens_used}")
         # Update org_current_used for potential org warning notification
         org_current_used += tokens_used
 
+    # Mirrors the charge into the passed/cached docs so later charges see it
+    apply_usage_increment(
+        user_id, organization_id if org_doc else None, tokens_used, is_org_managed_user_quota,
+        user_doc=user_profile, org_doc=org_doc,
+    )
+    await record_charge(user_id, organization_id, tokens_used)
+
 
-    # Message Count Update (always in db.usage for now)
-    await db.usage.update_one({"user_id": user_id}, {"$inc": {"message_count_monthly": 1}})
-    logger.info(f"Updated usage DB (messages) for {user_id}. Incremented message count.")
+    # Message count (and tier-based token) update in db.usage
+    usage_seed = None
+    if "periods" not in usage_doc_for_messages:
+        usage_seed = {usage_field("tokens", period): usage_tokens_spent, usage_field("messages", period): current_messages_sent}
+    await _charge_period(db.usage, {"user_id": user_id}, "periods", usage_inc, seed=usage_seed)
+    logger.info(f"Updated usage DB for {user_id}: {usage_inc}")
     # Update current_messages_sent for potential warning notification
     current_messages_sent +=1
 
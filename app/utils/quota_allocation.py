@@ -0,0 +1,126 @@
+import asyncio
+from typing import Dict, List
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.db import db
+from app.utils.context import invalidate_user_context
+from app.utils.logger import logger
+
+# Sum of the members' quota.monthly_limit, kept on the org document so an
+# allocation is checked against usage_quota.total_limit with one conditional
+# $inc instead of summing every member. Orgs created before it existed get it
+# computed on their first allocation.
+ALLOCATED = "usage_quota.allocated_total"
+
+
+def _member_filter(org_id: ObjectId) -> dict:
+    # Members were stored with either form of the org id over time
+    return {"organization_id": {"$in": [org_id, str(org_id)]}}
+
+
+async def ensure_allocated_total(org_id: ObjectId, database=None):
+    """Compute ``allocated_total`` for an org that doesn't have it yet."""
+    database = db if database is None else database
+    if await database.organizations.count_documents({"_id": org_id, ALLOCATED: {"$exists": True}}, limit=1):
+        return
+    totals = await database.users.aggregate([
+        {"$match": _member_filter(org_id)},
+        {"$group": {"_id": None, "total": {"$sum": {"$ifNull": ["$quota.monthly_limit", 0]}}}},
+    ]).to_list(length=1)
+    total = totals[0]["total"] if totals else 0
+    await database.organizations.update_one(
+        {"_id": org_id, ALLOCATED: {"$exists": False}}, {"$set": {ALLOCATED: total}}
+    )
+
+
+async def adjust_allocated_total(org_id: ObjectId, delta: int, database=None):
+    """Unchecked adjustment for membership changes (a member joining with the
+    default limit, or leaving). Orgs without the field are left to compute it."""
+    database = db if database is None else database
+    if delta:
+        await database.organizations.update_one(
+            {"_id": org_id, ALLOCATED: {"$exists": True}}, {"$inc": {ALLOCATED: delta}}
+        )
+
+
+async def _reserve(org_id: ObjectId, delta: int, database) -> bool:
+    """Add ``delta`` to the org's allocation if it stays within total_limit.
+    Decreases always succeed."""
+    query = {"_id": org_id}
+    if delta > 0:
+        query["$expr"] = {"$lte": [
+            {"$add": [f"${ALLOCATED}", delta]},
+            {"$ifNull": ["$usage_quota.total_limit", 0]},
+        ]}
+    result = await database.organizations.update_one(query, {"$inc": {ALLOCATED: delta}})
+    return bool(result.matched_count)
+
+
+async def allocate_user_quotas(org_id: ObjectId, limits: Dict[ObjectId, int], database=None) -> List[dict]:
+    """Set ``quota.monthly_limit`` for several members of ``org_id`` at once.
+
+    The net change is reserved on the org with a single conditional ``$inc``,
+    so concurrent allocations can't together exceed the org's total_limit.
+    Each user write is guarded on the limit it was computed from; if another
+    edit got there first, the writes that did land are rolled back with a
+    409. Returns the member documents with their new limits.
+    """
+    database = db if database is None else database
+    users = await database.users.find(
+        {"_id": {"$in": list(limits)}, **_member_filter(org_id)}
+    ).to_list(length=len(limits))
+    missing = set(limits) - {user["_id"] for user in users}
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Users not found in organization {org_id}: {', '.join(sorted(map(str, missing)))}",
+        )
+
+    changes = []  # (user id, old limit as stored, new limit)
+    for user in users:
+        old = (user.get("quota") or {}).get("monthly_limit")
+        if old != limits[user["_id"]]:
+            changes.append((user["_id"], old, limits[user["_id"]]))
+        user["quota"] = {**(user.get("quota") or {}), "monthly_limit": limits[user["_id"]]}
+    if not changes:
+        return users
+
+    delta = sum(new - (old or 0) for _, old, new in changes)
+    await ensure_allocated_total(org_id, database=database)
+    if not await _reserve(org_id, delta, database):
+        org = await database.organizations.find_one({"_id": org_id}, {"usage_quota": 1})
+        if not org:
+            raise HTTPException(status_code=404, detail=f"Organization with ID {org_id} not found.")
+        quota = org.get("usage_quota", {})
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                f"Allocating {delta} more tokens would exceed the organization's total quota limit "
+                f"({quota.get('total_limit', 0)}); {quota.get('allocated_total', 0)} is already allocated."
+            ),
+        )
+
+    results = await asyncio.gather(*(
+        database.users.update_one({"_id": user_id, "quota.monthly_limit": old}, {"$set": {"quota.monthly_limit": new}})
+        for user_id, old, new in changes
+    ))
+    applied = [change for change, result in zip(changes, results) if result.matched_count]
+    for user_id, _, _ in applied:
+        invalidate_user_context(user_id)
+    if len(applied) < len(changes):
+        # Undo only the writes that landed; a member someone else has since
+        # edited again keeps that edit, and its share of the reservation
+        reverted = await asyncio.gather(*(
+            database.users.update_one(
+                {"_id": user_id, "quota.monthly_limit": new},
+                {"$set": {"quota.monthly_limit": old}} if old is not None else {"$unset": {"quota.monthly_limit": ""}},
+            )
+            for user_id, old, new in applied
+        ))
+        kept = sum(new - (old or 0) for (_, old, new), result in zip(applied, reverted) if not result.matched_count)
+        await database.organizations.update_one({"_id": org_id}, {"$inc": {ALLOCATED: kept - delta}})
+        logger.warning(f"Quota allocation for org {org_id} conflicted with a concurrent edit; rolled back")
+        raise HTTPException(status_code=409, detail="User quotas changed while saving. Reload and try again.")
+    return users
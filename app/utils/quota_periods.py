@@ -0,0 +1,80 @@
+from datetime import datetime
+from typing import Optional, Tuple
+
+# Monthly counters are kept per period ("2026-10") instead of being reset:
+#   users.quota.periods.<period>                  tokens charged to the user's org quota
+#   organizations.usage_quota.periods.<period>    tokens charged to the org
+#   usage.periods.<period>.{tokens,messages}      tier-based usage
+# A period other than the current one simply reads as zero, so nothing has to
+# run at the month boundary. Documents written before this layout keep their
+# counters in ``used`` / ``token_usage_monthly`` until compacted; those only
+# count while the stamps the old monthly reset wrote next to them
+# (``reset_period``, ``reset_date``, ``last_reset``) are in the current
+# period, since nothing resets them any more.
+FLAT_STAMPS = ("reset_period", "reset_date", "last_reset")
+
+
+def current_period(now: datetime = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m")
+
+
+def flat_counters_current(doc: dict, period: str = None) -> bool:
+    """Whether ``doc``'s flat counters were last reset in ``period``."""
+    period = period or current_period()
+    for name in FLAT_STAMPS:
+        stamp = doc.get(name)
+        if isinstance(stamp, datetime):
+            stamp = current_period(stamp)
+        if isinstance(stamp, str) and stamp[:7] == period:
+            return True
+    return False
+
+
+def flat_counters_current_expr(doc: str, period: str) -> dict:
+    """``flat_counters_current`` as an aggregation expression on the document at ``doc``."""
+    checks = []
+    for name in FLAT_STAMPS:
+        stamp = f"{doc}.{name}"
+        checks.append({"$eq": [{"$switch": {
+            "branches": [
+                {"case": {"$eq": [{"$type": stamp}, "date"]}, "then": {"$dateToString": {"format": "%Y-%m", "date": stamp}}},
+                {"case": {"$eq": [{"$type": stamp}, "string"]}, "then": {"$substrCP": [stamp, 0, 7]}},
+            ],
+            "default": None,
+        }}, period]})
+    return {"$or": checks}
+
+
+def flat_counter_expr(doc: str, counter: str, period: str) -> dict:
+    """A flat counter of the document at ``doc``, or 0 if it is from an earlier period."""
+    return {"$cond": [flat_counters_current_expr(doc, period), {"$ifNull": [f"{doc}.{counter}", 0]}, 0]}
+
+
+def quota_used(quota: Optional[dict], period: str = None) -> int:
+    """Tokens used this period from a user ``quota`` or org ``usage_quota`` subdocument."""
+    quota = quota or {}
+    periods = quota.get("periods")
+    if periods is None:
+        return quota.get("used", 0) if flat_counters_current(quota, period) else 0
+    return periods.get(period or current_period(), 0)
+
+
+def usage_counts(usage: Optional[dict], period: str = None) -> Tuple[int, int]:
+    """(tokens, messages) used this period from a tier ``usage`` document."""
+    usage = usage or {}
+    periods = usage.get("periods")
+    if periods is None:
+        if not flat_counters_current(usage, period):
+            return 0, 0
+        return usage.get("token_usage_monthly", 0), usage.get("message_count_monthly", 0)
+    counts = periods.get(period or current_period(), {})
+    return counts.get("tokens", 0), counts.get("messages", 0)
+
+
+def quota_field(prefix: str, period: str = None) -> str:
+    """Dotted path of the period counter under ``prefix`` ("quota" or "usage_quota")."""
+    return f"{prefix}.periods.{period or current_period()}"
+
+
+def usage_field(counter: str, period: str = None) -> str:
+    return f"periods.{period or current_period()}.{counter}"
@@ -1,8 +1,229 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from app.tasks.quota_reset import reset_quotas
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.config import settings
+from app.db import db
+from app.tasks.quota_compaction import compact_quota_periods
+from app.tasks.usage_rollup import rollup_usage
+from app.services.dashboard_snapshot import refresh_dashboard_snapshot
+from app.services.invoices import sync_invoices
+from app.services.stripe_events import process_pending_events
+from app.utils.locks import INSTANCE_ID, acquire_lock, release_lock
+from app.utils.logger import logger
+
+LEADER_LOCK = "scheduler_leader"
+JOB_STORE = "scheduled_jobs"
+JOB_RUNS = "job_runs"
+
+TRIGGERS = {"cron": CronTrigger, "interval": IntervalTrigger}
+
+
+@dataclass
+class ScheduledJob:
+    func: Callable[[], Awaitable]
+    trigger: str
+    trigger_args: dict = field(default_factory=dict)
+
+    def jitter(self) -> int:
+        # At most a tenth of an interval, so short polls keep their cadence
+        if self.trigger == "interval":
+            interval = timedelta(**self.trigger_args).total_seconds()
+            return min(settings.SCHEDULER_JITTER_SECONDS, int(interval // 10))
+        return settings.SCHEDULER_JITTER_SECONDS
+
+    def build_trigger(self):
+        return TRIGGERS[self.trigger](**self.trigger_args, jitter=self.jitter() or None)
+
+
+# Every periodic job, by name. Only the elected leader runs them; their next
+# run times are saved to JOB_STORE so a new leader picks up where the old one
+# stopped (late runs within the misfire grace are coalesced into one).
+JOBS: Dict[str, ScheduledJob] = {}
+
+
+def register_job(name: str, func: Callable[[], Awaitable], trigger: str, **trigger_args):
+    JOBS[name] = ScheduledJob(func, trigger, trigger_args)
+
+
+register_job(
+    "compact_quota_periods", compact_quota_periods, "interval", minutes=settings.QUOTA_COMPACTION_INTERVAL_MINUTES
+)
+register_job("rollup_usage", rollup_usage, "interval", minutes=settings.USAGE_ROLLUP_INTERVAL_MINUTES)
+register_job("refresh_dashboard_snapshot", refresh_dashboard_snapshot, "interval", seconds=settings.DASHBOARD_REFRESH_SECONDS)
+register_job("sync_invoices", sync_invoices, "interval", minutes=settings.INVOICE_SYNC_INTERVAL_MINUTES)
+register_job("process_pending_events", process_pending_events, "interval", seconds=settings.STRIPE_EVENT_POLL_SECONDS)
+
+
+async def run_job(name: str, database=None) -> Optional[int]:
+    """Run a registered job and record its duration and rows touched in ``job_runs``.
+
+    Jobs that return an int report it as rows touched. Failures are logged
+    and recorded, never raised into the scheduler.
+    """
+    database = db if database is None else database
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    rows, error = None, None
+    try:
+        result = await JOBS[name].func()
+        if isinstance(result, int) and not isinstance(result, bool):
+            rows = result
+    except Exception as e:
+        error = str(e)
+        logger.exception(f"❌ Scheduled job {name} failed")
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        "⏱️ Job %s finished in %.1f ms", name, duration_ms,
+        extra={"job": name, "duration_ms": duration_ms, "rows": rows, "status": "error" if error else "ok"},
+    )
+    try:
+        await database[JOB_RUNS].insert_one({
+            "job": name,
+            "instance": INSTANCE_ID,
+            "started_at": started_at,
+            "duration_ms": duration_ms,
+            "rows": rows,
+            "status": "error" if error else "ok",
+            "error": error,
+        })
+    except PyMongoError as e:
+        logger.error(f"Failed to record run of job {name}: {e}")
+    return rows
+
+
+def sync_jobs(scheduler: AsyncIOScheduler):
+    """Make the job store match JOBS, keeping stored next run times of unchanged jobs."""
+    stored = {job.id: job for job in scheduler.get_jobs()}
+    for job_id in stored.keys() - JOBS.keys():
+        scheduler.remove_job(job_id)
+    for name, job in JOBS.items():
+        trigger = job.build_trigger()
+        existing = stored.get(name)
+        if existing is not None and str(existing.trigger) == str(trigger) and existing.args == (name,):
+            continue
+        scheduler.add_job(run_job, trigger, args=[name], id=name, name=name, replace_existing=True)
+
+
+async def save_next_run_times(scheduler: AsyncIOScheduler, database=None):
+    """Persist each job's next run time (the jobs themselves live in memory)."""
+    database = db if database is None else database
+    jobs = scheduler.get_jobs()
+    if jobs:
+        await database[JOB_STORE].bulk_write([
+            UpdateOne(
+                {"_id": job.id},
+                {"$set": {"trigger": str(job.trigger), "next_run_time": job.next_run_time}},
+                upsert=True,
+            )
+            for job in jobs
+        ], ordered=False)
+
+
+async def restore_next_run_times(scheduler: AsyncIOScheduler, database=None):
+    """Move jobs to the next run times the previous leader saved, where their trigger is unchanged."""
+    database = db if database is None else database
+    saved = await database[JOB_STORE].find({"_id": {"$in": list(JOBS)}}).to_list(length=None)
+    for doc in saved:
+        job = scheduler.get_job(doc["_id"])
+        next_run_time = doc.get("next_run_time")
+        if job is None or next_run_time is None or doc.get("trigger") != str(job.trigger):
+            continue
+        if next_run_time.tzinfo is None:
+            next_run_time = next_run_time.replace(tzinfo=timezone.utc)
+        job.modify(next_run_time=next_run_time)
+
+
+class LeaderElection:
+    """Runs ``scheduler`` only while this process holds the cluster-wide leader lease.
+
+    Every worker starts the scheduler paused and tries to take or renew the
+    lease every SCHEDULER_RENEW_SECONDS; the holder restores the saved next
+    run times and resumes it, then saves them on every renewal; anyone who
+    loses the lease pauses it before the lease can expire.
+    """
+
+    def __init__(self, scheduler: AsyncIOScheduler, database=None):
+        self.scheduler = scheduler
+        self.database = database
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def step(self):
+        try:
+            held = await acquire_lock(
+                LEADER_LOCK, timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS), database=self.database
+            )
+        except PyMongoError as e:
+            logger.error(f"Scheduler lease renewal failed: {e}")
+            held = False
+        if held and not self.is_leader:
+            logger.info(f"👑 {INSTANCE_ID} is now the scheduler leader")
+            sync_jobs(self.scheduler)
+            try:
+                await restore_next_run_times(self.scheduler, database=self.database)
+            except PyMongoError as e:
+                logger.error(f"Failed to restore scheduled job run times: {e}")
+            self.scheduler.resume()
+        elif held:
+            await self._save()
+        elif self.is_leader:
+            logger.warning(f"👑 {INSTANCE_ID} lost scheduler leadership; pausing jobs")
+            self.scheduler.pause()
+        self.is_leader = held
+
+    async def _save(self):
+        try:
+            await save_next_run_times(self.scheduler, database=self.database)
+        except PyMongoError as e:
+            logger.error(f"Failed to save scheduled job run times: {e}")
+
+    async def _run(self):
+        while True:
+            await self.step()
+            await asyncio.sleep(settings.SCHEDULER_RENEW_SECONDS)
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        if self.is_leader:
+            self.scheduler.pause()
+            await self._save()
+            await release_lock(LEADER_LOCK, database=self.database)
+            self.is_leader = False
+
+
+_election: Optional[LeaderElection] = None
 
 
 def start_scheduler():
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(reset_quotas, "cron", day=1, hour=0, minute=0)
-    scheduler.start()
+    global _election
+    # Jobs stay in the in-memory store: a Mongo job store would use a blocking
+    # client on the event loop. Only next run times are persisted, via Motor.
+    scheduler = AsyncIOScheduler(
+        job_defaults={
+            "coalesce": True,
+            "max_instances": 1,
+            "misfire_grace_time": settings.SCHEDULER_MISFIRE_GRACE_SECONDS,
+        },
+    )
+    scheduler.start(paused=True)
+    _election = LeaderElection(scheduler)
+    _election.start()
+
+
+async def stop_scheduler():
+    if _election:
+        await _election.stop()
+        _election.scheduler.shutdown(wait=False)
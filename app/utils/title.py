@@ -1,16 +1,63 @@
-from openai import OpenAI
+import asyncio
+from typing import Optional
+
+from bson import ObjectId
+from openai import AsyncOpenAI
 from app.config import settings
+from app.db import db
+from app.utils.logger import logger
+
+async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+
+# Titles a chat is created with; only these get replaced by a generated title
+PLACEHOLDER_TITLES = ["New Chat", "Untitled", ""]
+
+_TITLE_MESSAGES = [{"role": "system", "content": "Generate a short title summarizing this question."}]
+
+
+def heuristic_title(prompt: str, max_words: int = settings.CHAT_TITLE_HEURISTIC_WORDS) -> str:
+    """First ``max_words`` words of the prompt, used when the model is slow or fails."""
+    words = prompt.split()
+    if not words:
+        return "New Chat"
+    title = " ".join(words[:max_words]).rstrip("?!.,;:")
+    return title + ("…" if len(words) > max_words else "")
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-def generate_chat_title(prompt: str) -> str:
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "Generate a short title summarizing this question."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=12,
+
+async def generate_chat_title_async(prompt: str, timeout: float = settings.CHAT_TITLE_TIMEOUT_SECONDS) -> str:
+    try:
+        response = await asyncio.wait_for(
+            async_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=_TITLE_MESSAGES + [{"role": "user", "content": prompt}],
+                temperature=0.7,
+                max_tokens=12,
+            ),
+            timeout=timeout,
+        )
+        title = response.choices[0].message.content.strip().strip("\"")
+        if title:
+            return title
+    except asyncio.TimeoutError:
+        logger.warning(f"⏱️ Title generation timed out after {timeout}s, using heuristic title")
+    except Exception as e:
+        logger.warning(f"Title generation failed, using heuristic title: {e}")
+    return heuristic_title(prompt)
+
+
+async def _set_chat_title(chat_id: str, prompt: str) -> str:
+    title = await generate_chat_title_async(prompt)
+    # Only replace a placeholder so a concurrent rename by the user wins
+    await db.chats.update_one(
+        {"_id": ObjectId(chat_id), "title": {"$in": PLACEHOLDER_TITLES}},
+        {"$set": {"title": title}},
     )
-    return response.choices[0].message.content.strip().strip("\"")
\ No newline at end of file
+    logger.info(f"✏️ Chat title updated for chat_id {chat_id}: {title}")
+    return title
+
+
+def start_title_task(chat: dict, prompt: str) -> Optional[asyncio.Task]:
+    """Generate the chat title in the background if it still has a placeholder."""
+    if chat.get("title") not in PLACEHOLDER_TITLES:
+        return None
+    return asyncio.create_task(_set_chat_title(str(chat["_id"]), prompt))
@@ -3,6 +3,7 @@ from bson import ObjectId
 from datetime import datetime
 from app.config import settings
 from fastapi import HTTPException
+from app.utils.quota_periods import current_period, usage_counts
 
 DEFAULT_LIMITS = settings.DEFAULT_LIMITS
 
@@ -49,10 +50,13 @@ async def get_user_usage(user_id: str):
             "reset_date": None
         }
 
+    period = current_period()
+    tokens, messages = usage_counts(usage, period)
     return {
         "tier": tier,
-        "token_usage_monthly": usage.get("token_usage_monthly", 0),
-        "message_count_monthly": usage.get("message_count_monthly", 0),
+        "token_usage_monthly": tokens,
+        "message_count_monthly": messages,
         "limits": usage.get("limits", limits),
-        "reset_date": usage.get("last_reset")
+        # Counters roll over with the period, so the period start is the last reset
+        "reset_date": datetime.strptime(period, "%Y-%m")
     }
\ No newline at end of file
@@ -56,22 +56,31 @@ export const ChatWindow: React.FC<ChatWindowProps> = ({
   const [streamingMessage, setStreamingMessage] = useState("");
   const [thinkingText, setThinkingText] = useState("");
   const [showScrollDown, setShowScrollDown] = useState(false);
+  const [olderBefore, setOlderBefore] = useState<number | null>(null);
 
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const textareaRef = useRef<HTMLTextAreaElement | null>(null);
   const scrollRef = useRef<HTMLDivElement | null>(null);
   useEffect(() => {
-    const fetchMessages = async () => {
-      const res = await api.get(`/chat/history`);
-      const chat = res.data.find((c: any) => c.id === chatId);
-      if (chat) {
-        setMessages(chat.messages || []);
-        setChatTitle(chat.title || "Chat");
-      }
-    };
     if (chatId) fetchMessages();
   }, [chatId]);
 
+  const fetchMessages = async () => {
+    const res = await api.get(`/chat/${chatId}/messages`);
+    setMessages(res.data.messages || []);
+    setChatTitle(res.data.title || "Chat");
+    setOlderBefore(res.data.next_before);
+  };
+
+  const loadOlderMessages = async () => {
+    if (olderBefore === null) return;
+    const res = await api.get(`/chat/${chatId}/messages`, {
+      params: { before: olderBefore },
+    });
+    setMessages((prev) => [...(res.data.messages || []), ...prev]);
+    setOlderBefore(res.data.next_before);
+  };
+
   useEffect(() => {
     if (streamingChatId === chatId) {
       const idx = Math.floor(Math.random() * thinkingPhrases.length);
@@ -119,15 +128,7 @@ export const ChatWindow: React.FC<ChatWindowProps> = ({
     setStreamingMessage("");
     setMessages((prev) => [...prev, { role: "user", content: msg }]);
   
-    try {
-      // Save user message
-      await api.post(`/chat/${chatId}/message`, { role: "user", content: msg });
-    } catch (err) {
-      toast.error("Failed to send message. Please check your connection.");
-      setStreamingChatId(null);
-      return;
-    }
-  
+    // The stream stores the question and the reply together
     try {
       const response = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL}/assistant/stream`,
@@ -187,17 +188,18 @@ export const ChatWindow: React.FC<ChatWindowProps> = ({
               debounceTimeout = setTimeout(() => {
                 setStreamingMessage(assistantMessage.trim());
               }, 20);
+            } else if (json.type === "title") {
+              setChatTitle(json.content || "Chat");
             } else if (json.type === "done") {
               setStreamingChatId(null);
               setStreamingMessage("");
               playSound("receive");
   
-              const res = await api.get(`/chat/history`);
-              const chat = res.data.find((c: any) => c.id === chatId);
-              if (chat) {
-                if (chat) setMessages(chat.messages || []);
-                setChatTitle(chat.title || "Chat");
-              };
+              const saved: Message[] = json.messages || [];
+              setMessages((prev) => [
+                ...prev,
+                ...saved.filter((m) => m.role === "assistant"),
+              ]);
             } else if (json.type === "error") {
               toast.error(`Error: ${json.error}`);
               setStreamingChatId(null);
@@ -242,6 +244,16 @@ export const ChatWindow: React.FC<ChatWindowProps> = ({
         className="flex-1 overflow-y-auto px-2 sm:px-4 py-20 space-y-4 scrollbar-hide transition-all duration-300"
         style={{ maxWidth: "1200px", margin: "0 auto" }}
       >
+        {olderBefore !== null && (
+          <div className="flex justify-center">
+            <button
+              onClick={loadOlderMessages}
+              className="text-sm text-blue-600 hover:underline"
+            >
+              Load earlier messages
+            </button>
+          </div>
+        )}
         <MessageList messages={messages} />
         {streamingChatId === chatId && streamingMessage && (
           <StreamedMessage content={streamingMessage} />
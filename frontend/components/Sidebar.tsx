@@ -26,6 +26,7 @@ export const Sidebar: React.FC<SidebarProps> = ({
 }) => {
   const [chats, setChats] = useState<ChatItem[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [selectedChatId, setSelectedChatId] = useState<string | null>(null);
   const router = useRouter();
   const sidebarRef = useRef<HTMLDivElement>(null);
@@ -35,7 +36,8 @@ export const Sidebar: React.FC<SidebarProps> = ({
     const token = getToken();
     try {
       const res = await api.get("/chat/history");
-      setChats(res.data);
+      setChats(res.data.items);
+      setNextCursor(res.data.next_cursor);
     } catch (err) {
       console.error("❌ Failed to fetch chats", err);
     } finally {
@@ -43,6 +45,19 @@ export const Sidebar: React.FC<SidebarProps> = ({
     }
   };
 
+  const loadMoreChats = async () => {
+    if (!nextCursor) return;
+    try {
+      const res = await api.get("/chat/history", {
+        params: { cursor: nextCursor },
+      });
+      setChats((prev) => [...prev, ...res.data.items]);
+      setNextCursor(res.data.next_cursor);
+    } catch (err) {
+      console.error("❌ Failed to fetch more chats", err);
+    }
+  };
+
   const handleCreate = async () => {
     const res = await api.post("/chat/create", {});
     fetchChats();
@@ -164,6 +179,14 @@ export const Sidebar: React.FC<SidebarProps> = ({
                     />
                   ))
                 )}
+                {!loading && nextCursor && (
+                  <button
+                    onClick={loadMoreChats}
+                    className="w-full py-2 text-sm text-blue-600 hover:underline"
+                  >
+                    Load more
+                  </button>
+                )}
               </div>
             </div>
           </motion.div>
@@ -17,6 +17,7 @@ interface OrgQuotaInfo {
   name: string;
   total_quota_limit: number;
   total_quota_used: number;
+  total_quota_allocated: number;
 }
 
 interface OrgQuotaDetailsResponse {
@@ -35,6 +36,7 @@ export default function OrgQuotaManager({ orgId }: OrgQuotaManagerProps) {
   const [error, setError] = useState<string | null>(null);
   const [editingUserQuotas, setEditingUserQuotas] = useState<{ [userId: string]: string }>({});
   const [updatingQuotaForUser, setUpdatingQuotaForUser] = useState<string | null>(null);
+  const [savingAll, setSavingAll] = useState(false);
 
   const fetchQuotaDetails = async () => {
     if (!orgId) return;
@@ -114,6 +116,43 @@ export default function OrgQuotaManager({ orgId }: OrgQuotaManagerProps) {
     }
   };
 
+  const changedAllocations = usersQuotaInfo
+    .filter(user => editingUserQuotas[user.id] !== undefined && editingUserQuotas[user.id] !== String(user.monthly_limit))
+    .map(user => ({ user_id: user.id, monthly_limit: parseInt(editingUserQuotas[user.id], 10) }));
+
+  const handleSaveAllQuotas = async () => {
+    if (changedAllocations.some(a => isNaN(a.monthly_limit) || a.monthly_limit < 0)) {
+      toast.error("Invalid quota limit. Must be a non-negative number.");
+      return;
+    }
+
+    setSavingAll(true);
+    const token = getToken();
+    try {
+      // One request: the backend checks the whole allocation against the org limit atomically
+      const response = await fetch(`${process.env.NEXT_PUBLIC_API_URL}/org/${orgId}/users/quotas`, {
+        method: 'PATCH',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${token}`,
+        },
+        body: JSON.stringify({ allocations: changedAllocations }),
+      });
+
+      if (!response.ok) {
+        const errorData = await response.json().catch(() => ({}));
+        throw new Error(errorData.detail || "Failed to update user quotas.");
+      }
+      toast.success(`Updated ${changedAllocations.length} user quota${changedAllocations.length === 1 ? '' : 's'}.`);
+      await fetchQuotaDetails();
+    } catch (err: any) {
+      toast.error(err.message || "Could not update user quotas.");
+      console.error("Bulk update user quotas error:", err);
+    } finally {
+      setSavingAll(false);
+    }
+  };
+
   const getProgressBarColor = (percentage: number) => {
     if (percentage < 50) return 'bg-green-500';
     if (percentage < 80) return 'bg-yellow-500';
@@ -165,6 +204,9 @@ export default function OrgQuotaManager({ orgId }: OrgQuotaManagerProps) {
             <p className="dark:text-zinc-300">
                 Total Used: <span className="font-semibold text-gray-700 dark:text-white">{orgQuotaDetails.total_quota_used.toLocaleString()}</span> tokens
             </p>
+            <p className="dark:text-zinc-300">
+                Allocated to Users: <span className="font-semibold text-gray-700 dark:text-white">{orgQuotaDetails.total_quota_allocated.toLocaleString()}</span> tokens
+            </p>
         </div>
         <div className="w-full bg-gray-200 dark:bg-zinc-700 rounded-full h-4">
             <div
@@ -180,6 +222,14 @@ export default function OrgQuotaManager({ orgId }: OrgQuotaManagerProps) {
         <div className="flex items-center gap-3 mb-4">
             <Users className="text-indigo-500" size={24}/>
             <h3 className="text-lg font-semibold text-gray-700 dark:text-white">User Quotas</h3>
+            <button
+              onClick={handleSaveAllQuotas}
+              disabled={savingAll || changedAllocations.length === 0}
+              className="ml-auto inline-flex items-center justify-center gap-1.5 px-3 py-1.5 text-xs font-medium text-white bg-blue-600 hover:bg-blue-700 rounded-md focus:outline-none focus:ring-2 focus:ring-offset-2 focus:ring-blue-500 disabled:opacity-60 disabled:cursor-not-allowed dark:focus:ring-offset-zinc-900"
+            >
+              {savingAll ? <ActionLoader className="animate-spin h-4 w-4" /> : <Save size={14} />}
+              {savingAll ? 'Saving...' : `Save All Changes${changedAllocations.length ? ` (${changedAllocations.length})` : ''}`}
+            </button>
         </div>
         <div className="overflow-x-auto">
           <table className="min-w-full text-sm">
@@ -0,0 +1,100 @@
+"""Benchmark the admin stats aggregations against a synthetic dataset.
+
+    MONGODB_TEST_URI=mongodb://localhost:27017 python tests/benchmarks/bench_admin_stats.py --users 100000
+
+Seeds a scratch database, times each endpoint's aggregation and reports the
+Python-side peak allocation (tracemalloc), which should stay flat as --users
+grows because only final numbers leave the server. The scratch database is
+dropped afterwards.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import tracemalloc
+import uuid
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.services import admin_stats  # noqa: E402
+from app.utils.indexes import ensure_indexes  # noqa: E402
+
+ROLES = ["user", "organization_user", "organization_head", "admin"]
+BATCH = 10_000
+
+
+async def seed(database, users: int, orgs: int):
+    org_ids = [ObjectId() for _ in range(orgs)]
+    await database.organizations.insert_many([{"_id": oid, "name": f"Org {i}"} for i, oid in enumerate(org_ids)])
+    for start in range(0, users, BATCH):
+        user_docs, usage_docs = [], []
+        for _ in range(min(BATCH, users - start)):
+            uid = ObjectId()
+            user_docs.append({
+                "_id": uid,
+                "email": f"{uid}@example.com",
+                "role": random.choice(ROLES),
+                "organization_id": str(random.choice(org_ids)),
+            })
+            usage_docs.append({"user_id": str(uid), "token_usage_monthly": random.randint(0, 50_000)})
+        await database.users.insert_many(user_docs, ordered=False)
+        await database.usage.insert_many(usage_docs, ordered=False)
+    heads = await database.users.find(
+        {"role": "organization_head"}, {"_id": 1, "organization_id": 1}
+    ).limit(orgs * 3).to_list(length=None)
+    await database.assistants.insert_many([
+        {
+            "org_id": ObjectId(u["organization_id"]),
+            "created_by": u["_id"],
+            "file_ids": [f"file-{i}" for i in range(random.randint(0, 5))],
+        }
+        for u in heads
+    ])
+
+
+async def measure(name: str, call):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = await call()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rows = len(result) if isinstance(result, list) else 1
+    print(f"{name:<28} {elapsed * 1000:8.1f} ms   peak {peak / 1024:8.1f} KiB   rows {rows}")
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--orgs", type=int, default=200)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.getenv("MONGODB_TEST_URI", "mongodb://localhost:27017"))
+    name = f"bench_admin_stats_{uuid.uuid4().hex[:8]}"
+    database = client[name]
+    try:
+        await ensure_indexes(database)
+        started = time.perf_counter()
+        await seed(database, args.users, args.orgs)
+        print(f"Seeded {args.users} users / {args.orgs} orgs in {time.perf_counter() - started:.1f}s")
+
+        timings = [
+            await measure("summary", lambda: admin_stats.get_summary(database)),
+            await measure("usage per organization", lambda: admin_stats.get_tokens_per_organization(database)),
+            await measure("assistants", lambda: admin_stats.get_assistant_stats(database)),
+        ]
+        slowest = max(timings)
+        print(f"Slowest endpoint: {slowest * 1000:.1f} ms ({'OK' if slowest < 1 else 'over 1s budget'})")
+    finally:
+        await client.drop_database(name)
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""Benchmark batched search over an organization's local vector index.
+
+    python tests/benchmarks/bench_local_index.py --rows 5000 --queries 100
+
+Builds a throwaway index of random vectors and reports the per-query search
+time for exact and int8-quantized scans. The exact scan should stay well
+under a millisecond per query at a few thousand chunks.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.services.local_index import LocalVectorIndex  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(args.rows, args.dim)).astype(np.float32)
+    queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for quantize in (False, True):
+            index = LocalVectorIndex(os.path.join(tmp, f"q{int(quantize)}"), quantize=quantize)
+            index.add(vectors, [{"i": i} for i in range(args.rows)])
+            index.search(queries[:1], k=args.k)  # map the file (and build the int8 copy)
+
+            start = time.perf_counter()
+            index.search(queries, k=args.k)
+            per_query = (time.perf_counter() - start) / args.queries
+            label = "int8" if quantize else "exact"
+            print(f"{label:>5}: {per_query * 1e6:8.1f} µs/query over {args.rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark request throughput with logging off, synchronous and queued.
+
+    python tests/benchmarks/bench_logging.py --requests 5000 --concurrency 100
+
+Each simulated request awaits a few times and logs what a chat stream logs:
+a handful of info lines, one debug line per run-status poll and the saved
+turn. "sync" is the previous setup (rotating file handlers called on the
+event loop, f-string messages); "queued" is app.utils.logger's pipeline.
+Log files go to a temporary directory.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from app.utils.logger import (  # noqa: E402
+    ExactLevelFilter, JsonFormatter, LazyQueueHandler, SamplingFilter, levels,
+)
+
+POLLS = 20
+
+
+async def request(log: logging.Logger, lazy: bool, i: int):
+    question = "What does the report say about revenue? " * 20
+    if lazy:
+        log.info("📥 Received stream request from user: %s, chat_id: %s", f"user{i}", i)
+        log.debug("🔍 User question (%d chars)", len(question))
+    else:
+        log.info(f"📥 Received stream request from user: user{i}, chat_id: {i}")
+        log.info(f"🔍 User question: {question}")
+    for poll in range(POLLS):
+        await asyncio.sleep(0)
+        if lazy:
+            log.debug("⏳ Run status for run %s: %s", i, "in_progress", extra={"sample_every": 10})
+        else:
+            log.info(f"⏳ Run status for run {i}: in_progress")
+    if lazy:
+        log.info("✅ Turn saved. Tokens: %s, Footnotes: %d", 1234, 3)
+    else:
+        log.info(f"✅ Turn saved. Tokens: {1234}, Footnotes: {3}")
+
+
+def file_handlers(directory: str, formatter: logging.Formatter) -> list:
+    handlers = []
+    for name, level in levels.items():
+        handler = RotatingFileHandler(os.path.join(directory, f"{name}.log"), maxBytes=2_000_000, backupCount=5)
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        handler.addFilter(ExactLevelFilter(level))
+        handlers.append(handler)
+    return handlers
+
+
+async def run(name: str, log: logging.Logger, lazy: bool, total: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            await request(log, lazy, i)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<8} {total / elapsed:9.1f} requests/s   {elapsed:6.2f}s")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        off = logging.getLogger("bench.off")
+        off.setLevel(logging.CRITICAL)
+        off.propagate = False
+        await run("off", off, True, args.requests, args.concurrency)
+
+        sync = logging.getLogger("bench.sync")
+        sync.setLevel(logging.DEBUG)
+        sync.propagate = False
+        sync_dir = os.path.join(directory, "sync")
+        os.makedirs(sync_dir)
+        for handler in file_handlers(sync_dir, logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s")):
+            sync.addHandler(handler)
+        await run("sync", sync, False, args.requests, args.concurrency)
+
+        queued = logging.getLogger("bench.queued")
+        queued.setLevel(logging.DEBUG)
+        queued.propagate = False
+        queued.addFilter(SamplingFilter())
+        queued_dir = os.path.join(directory, "queued")
+        os.makedirs(queued_dir)
+        log_queue = queue.SimpleQueue()
+        queued.addHandler(LazyQueueHandler(log_queue))
+        listener = QueueListener(log_queue, *file_handlers(queued_dir, JsonFormatter()), respect_handler_level=True)
+        listener.start()
+        await run("queued", queued, True, args.requests, args.concurrency)
+        started = time.perf_counter()
+        listener.stop()
+        print(f"queued listener drained in {time.perf_counter() - started:.2f}s after the last request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,272 @@
+import asyncio
+import copy
+from unittest.mock import MagicMock
+
+import pytest
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+_MISSING = object()
+
+
+def _values(doc, path):
+    """Every value ``path`` reaches in ``doc``, descending into arrays like Mongo does."""
+    current = [doc]
+    for part in path.split("."):
+        found = []
+        for value in current:
+            if isinstance(value, list):
+                if part.isdigit():
+                    if int(part) < len(value):
+                        found.append(value[int(part)])
+                else:
+                    found.extend(v[part] for v in value if isinstance(v, dict) and part in v)
+            elif isinstance(value, dict) and part in value:
+                found.append(value[part])
+        current = found
+    return current
+
+
+def _compare(op, value, arg):
+    if op == "$ne":
+        return value != arg
+    if value is None:
+        return False
+    return {"$lt": value < arg, "$lte": value <= arg, "$gt": value > arg, "$gte": value >= arg}[op]
+
+
+def _matches(doc, query) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, c) for c in cond):
+                return False
+            continue
+        if key == "$and":
+            if not all(_matches(doc, c) for c in cond):
+                return False
+            continue
+        values = _values(doc, key)
+        flat = values + [v for value in values if isinstance(value, list) for v in value]
+        if isinstance(cond, dict) and cond and all(op.startswith("$") for op in cond):
+            for op, arg in cond.items():
+                if op == "$exists":
+                    ok = bool(values) == bool(arg)
+                elif op == "$in":
+                    ok = any(v in arg for v in flat)
+                elif op == "$ne":
+                    ok = all(v != arg for v in flat)
+                elif op in ("$lt", "$lte", "$gt", "$gte"):
+                    ok = any(_compare(op, v, arg) for v in values)
+                else:
+                    raise NotImplementedError(op)
+                if not ok:
+                    return False
+        elif cond not in flat:
+            return False
+    return True
+
+
+def _positional(doc, query, path):
+    """Resolve ``array.$.field`` to the first array element the query matched."""
+    if ".$" not in path:
+        return path
+    prefix, rest = path.split(".$", 1)
+    subquery = {k[len(prefix) + 1:]: v for k, v in query.items() if k.startswith(prefix + ".")}
+    for i, element in enumerate(_values(doc, prefix)[0]):
+        if _matches(element, subquery):
+            return f"{prefix}.{i}{rest}"
+    raise ValueError(f"positional operator did not find a match for {path}")
+
+
+def _parent(doc, path, create=True):
+    *parents, last = path.split(".")
+    for part in parents:
+        if isinstance(doc, list):
+            doc = doc[int(part)]
+        else:
+            if part not in doc:
+                if not create:
+                    return None, last
+                doc[part] = {}
+            doc = doc[part]
+    return doc, last
+
+
+def _get(doc, path):
+    parent, last = _parent(doc, path, create=False)
+    if parent is None:
+        return _MISSING
+    if isinstance(parent, list):
+        return parent[int(last)] if int(last) < len(parent) else _MISSING
+    return parent.get(last, _MISSING)
+
+
+def _put(doc, path, value):
+    parent, last = _parent(doc, path)
+    if isinstance(parent, list):
+        parent[int(last)] = value
+    else:
+        parent[last] = value
+
+
+def _apply(doc, query, update, inserting=False):
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, arg in fields.items():
+            path = _positional(doc, query, path)
+            current = _get(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                _put(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                parent, last = _parent(doc, path, create=False)
+                if parent is not None:
+                    parent.pop(last, None)
+            elif op == "$inc":
+                _put(doc, path, (0 if current is _MISSING else current) + arg)
+            elif op == "$max":
+                if current is _MISSING or arg > current:
+                    _put(doc, path, arg)
+            elif op == "$push":
+                items = list(current) if current is not _MISSING else []
+                each = arg if isinstance(arg, dict) and "$each" in arg else {"$each": [arg]}
+                items.extend(copy.deepcopy(each["$each"]))
+                for field, direction in (each.get("$sort") or {}).items():
+                    items.sort(key=lambda item: item[field], reverse=direction < 0)
+                if "$slice" in each:
+                    items = items[:each["$slice"]]
+                _put(doc, path, items)
+            else:
+                raise NotImplementedError(op)
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=1):
+        keys = [(key, direction)] if isinstance(key, str) else key
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda doc: (doc.get(field) is not None, doc.get(field)), reverse=order < 0)
+        return self
+
+    def limit(self, n):
+        self._docs = self._docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(0)
+        return self._docs[:length]
+
+
+class MemoryCollection:
+    """Just enough of a Motor collection to run the services' real queries.
+
+    Every operation yields to the event loop first, so coroutines gathered in
+    a test interleave between database calls the way concurrent requests do,
+    while each single-document operation stays atomic as in MongoDB.
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    async def insert_one(self, doc):
+        await asyncio.sleep(0)
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']}")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+        return MagicMock(inserted_id=doc["_id"])
+
+    def _matching(self, query):
+        return [doc for doc in self.docs.values() if _matches(doc, query)]
+
+    async def find_one(self, query=None, projection=None):
+        await asyncio.sleep(0)
+        found = self._matching(query or {})
+        return copy.deepcopy(found[0]) if found else None
+
+    def find(self, query=None, projection=None):
+        return _Cursor([copy.deepcopy(doc) for doc in self._matching(query or {})])
+
+    async def distinct(self, key, query=None):
+        await asyncio.sleep(0)
+        values = []
+        for doc in self._matching(query or {}):
+            for value in _values(doc, key):
+                if value not in values:
+                    values.append(value)
+        return values
+
+    def _update(self, query, update, upsert, many=False):
+        found = self._matching(query)
+        if not many:
+            found = found[:1]
+        if found:
+            for doc in found:
+                before = copy.deepcopy(doc)
+                _apply(doc, query, update)
+            return found, before, None
+        if not upsert:
+            return [], None, None
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        if doc.get("_id") in self.docs:
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']}")
+        _apply(doc, query, update, inserting=True)
+        self.docs[doc["_id"]] = doc
+        return [], None, doc["_id"]
+
+    async def update_one(self, query, update, upsert=False):
+        await asyncio.sleep(0)
+        found, before, upserted_id = self._update(query, update, upsert)
+        modified = int(bool(found) and before != found[0])
+        return MagicMock(matched_count=len(found), modified_count=modified, upserted_id=upserted_id)
+
+    async def update_many(self, query, update, upsert=False):
+        await asyncio.sleep(0)
+        found, _, upserted_id = self._update(query, update, upsert, many=True)
+        return MagicMock(matched_count=len(found), modified_count=len(found), upserted_id=upserted_id)
+
+    async def find_one_and_update(
+        self, query, update, projection=None, upsert=False, return_document=ReturnDocument.BEFORE
+    ):
+        await asyncio.sleep(0)
+        found, before, upserted_id = self._update(query, update, upsert)
+        if return_document == ReturnDocument.AFTER:
+            doc = found[0] if found else self.docs.get(upserted_id)
+            return copy.deepcopy(doc)
+        return before
+
+    async def bulk_write(self, requests, ordered=True):
+        await asyncio.sleep(0)
+        matched = 0
+        for request in requests:
+            found, _, _ = self._update(request._filter, request._doc, request._upsert)
+            matched += len(found)
+        return MagicMock(matched_count=matched)
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name) -> MemoryCollection:
+        return self._collections.setdefault(name, MemoryCollection())
+
+    def __getattr__(self, name) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+@pytest.fixture
+def mock_db():
+    """A MagicMock database where ``db[name]`` and ``db.<name>`` are the same collection."""
+    database = MagicMock()
+    database.__getitem__.side_effect = lambda name: getattr(database, name)
+    return database
+
+
+@pytest.fixture
+def memory_db():
+    """An in-memory database for behavioural tests of concurrent writers."""
+    return MemoryDatabase()
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.routes import chat as chat_routes
+
+USER = ("65f000000000000000000001", "user", "a@b.c")
+
+
+def _chat(i, updated):
+    return {"_id": ObjectId(f"65f0000000000000000001{i:02d}"), "title": f"Chat {i}",
+            "updatedAt": updated, "message_count": i}
+
+
+def _history_db(docs):
+    db = MagicMock()
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(side_effect=lambda length: docs[:length])
+    db.chats.find.return_value = cursor
+    return db
+
+
+@pytest.mark.asyncio
+async def test_history_pages_without_loading_messages(monkeypatch):
+    now = datetime(2026, 1, 1)
+    docs = [_chat(i, now - timedelta(minutes=i)) for i in range(3)]
+    db = _history_db(docs)
+    monkeypatch.setattr(chat_routes, "db", db)
+
+    page = await chat_routes.get_user_chats(cursor=None, limit=2, user=USER)
+
+    assert [c.title for c in page.items] == ["Chat 0", "Chat 1"]
+    assert page.items[1].message_count == 1
+    projection = db.chats.find.call_args.args[1]
+    assert "messages" not in projection
+    assert page.next_cursor
+
+    await chat_routes.get_user_chats(cursor=page.next_cursor, limit=2, user=USER)
+    query = db.chats.find.call_args.args[0]
+    assert {"updatedAt": {"$lt": docs[1]["updatedAt"]}} in query["$or"]
+    assert {"updatedAt": docs[1]["updatedAt"], "_id": {"$lt": docs[1]["_id"]}} in query["$or"]
+
+
+@pytest.mark.asyncio
+async def test_last_history_page_has_no_cursor(monkeypatch):
+    monkeypatch.setattr(chat_routes, "db", _history_db([_chat(1, None)]))
+    page = await chat_routes.get_user_chats(cursor=None, limit=2, user=USER)
+    assert page.next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_is_rejected(monkeypatch):
+    monkeypatch.setattr(chat_routes, "db", _history_db([]))
+    with pytest.raises(HTTPException) as exc:
+        await chat_routes.get_user_chats(cursor="not-a-cursor", limit=2, user=USER)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_messages_come_from_the_message_store(monkeypatch):
+    chat_id = "65f000000000000000000099"
+    db = MagicMock()
+    db.chats.find_one = AsyncMock(return_value={"_id": ObjectId(chat_id), "title": "Chat", "message_count": 120})
+    monkeypatch.setattr(chat_routes, "db", db)
+    page_of = AsyncMock(return_value=([{"role": "user", "content": "70", "seq": 70}], 70))
+    monkeypatch.setattr(chat_routes, "get_messages_page", page_of)
+
+    page = await chat_routes.get_chat_messages(chat_id, before=None, limit=50, user=USER)
+
+    assert page.message_count == 120
+    assert page.next_before == 70
+    assert page.messages[0].content == "70"
+    assert db.chats.find_one.call_args.args[1] == chat_routes.CHAT_PROJECTION
@@ -0,0 +1,71 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.services import admin_stats
+
+
+def _stages(pipeline):
+    return [next(iter(stage)) for stage in pipeline]
+
+
+def _database():
+    return {name: MagicMock() for name in ("users", "usage", "organizations", "quota_requests")}
+
+
+def _aggregate(rows):
+    cursor = MagicMock()
+    cursor.to_list = AsyncMock(return_value=rows)
+    return MagicMock(return_value=cursor)
+
+
+@pytest.mark.asyncio
+async def test_summary_only_fetches_aggregated_numbers():
+    database = _database()
+    database["users"].aggregate = _aggregate([{"_id": "user", "count": 90_000}, {"_id": "admin", "count": 3}])
+    database["usage"].aggregate = _aggregate([{"_id": None, "tokens": 1234}])
+    database["organizations"].count_documents = AsyncMock(return_value=7)
+    database["quota_requests"].count_documents = AsyncMock(return_value=2)
+    database["users"].find = MagicMock(side_effect=AssertionError("summary must not load users"))
+
+    summary = await admin_stats.get_summary(database)
+
+    assert summary == {
+        "users_total": 90_003,
+        "users_breakdown": {"user": 90_000, "admin": 3},
+        "orgs_total": 7,
+        "tokens_used": 1234,
+        "quota_requests_pending": 2,
+    }
+
+
+@pytest.mark.asyncio
+async def test_summary_with_no_usage_reports_zero_tokens():
+    database = _database()
+    database["users"].aggregate = _aggregate([])
+    database["usage"].aggregate = _aggregate([])
+    database["organizations"].count_documents = AsyncMock(return_value=0)
+    database["quota_requests"].count_documents = AsyncMock(return_value=0)
+
+    summary = await admin_stats.get_summary(database)
+
+    assert summary["tokens_used"] == 0 and summary["users_total"] == 0
+
+
+def test_pipelines_group_on_the_server():
+    assert _stages(admin_stats.tokens_per_organization_pipeline()) == [
+        "$project", "$lookup", "$match", "$group", "$lookup", "$project",
+    ]
+    # Assistants are joined on the indexed org_id, in both stored forms, never through users
+    lookups = [stage["$lookup"] for stage in admin_stats.assistant_stats_pipeline() if "$lookup" in stage]
+    assert [(l["from"], l["localField"], l["foreignField"]) for l in lookups] == [
+        ("assistants", "_id", "org_id"), ("assistants", "id_str", "org_id"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_results_are_not_truncated():
+    database = _database()
+    database["organizations"].aggregate = _aggregate([])
+    await admin_stats.get_assistant_stats(database)
+    database["organizations"].aggregate.return_value.to_list.assert_awaited_with(length=None)
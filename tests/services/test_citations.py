@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services import citations
+from app.services.citations import CitationResolver, parse_citation_name
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._it = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def test_parse_citation_name():
+    assert parse_citation_name("report.pdf_chunk_3.txt") == ("report.pdf", 4)
+    assert parse_citation_name("notes.docx") == ("notes.docx", 1)
+
+
+@pytest.mark.asyncio
+async def test_resolve_batches_misses_into_one_query(monkeypatch):
+    db = MagicMock()
+    db.documents.find.return_value = FakeCursor([
+        {"openai_file_id": "file_a", "filename": "guide.pdf_chunk_0.txt"},
+        {"openai_file_id": "file_b", "filename": "faq.docx"},
+    ])
+    monkeypatch.setattr(citations, "db", db)
+    resolver = CitationResolver(max_entries=10)
+    resolver.remember("file_c", "known.pdf_chunk_9.txt")
+
+    resolved = await resolver.resolve(["file_a", "file_b", "file_a", "file_c", "file_x"])
+
+    db.documents.find.assert_called_once()
+    assert db.documents.find.call_args.args[0] == {"openai_file_id": {"$in": ["file_a", "file_b", "file_x"]}}
+    assert resolved == {
+        "file_a": ("guide.pdf", 1),
+        "file_b": ("faq.docx", 1),
+        "file_c": ("known.pdf", 10),
+        "file_x": ("file_x", 1),
+    }
+
+    db.documents.find.reset_mock()
+    await resolver.resolve(["file_a", "file_b", "file_c"])
+    db.documents.find.assert_not_called()
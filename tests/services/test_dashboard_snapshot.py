@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from starlette.requests import Request
+
+from app.routes import admin_stats as admin_stats_routes
+from app.services import dashboard_snapshot
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    events = MagicMock()
+    events.find_one = AsyncMock(return_value={"ts": datetime(2026, 1, 1, 12)})
+    database = MagicMock()
+    database.__getitem__.side_effect = lambda name: events
+    for collection in ("users", "organizations", "assistants"):
+        getattr(database, collection).estimated_document_count = AsyncMock(return_value=10)
+    database.quota_requests.count_documents = AsyncMock(return_value=1)
+    database.dashboard_snapshots.find_one = AsyncMock(return_value=None)
+    database.dashboard_snapshots.replace_one = AsyncMock()
+    database.rollup_state.find_one = AsyncMock(return_value={"watermark": datetime(2026, 1, 1, 12)})
+    monkeypatch.setattr(dashboard_snapshot, "db", database)
+    monkeypatch.setattr(dashboard_snapshot, "_cached", (0.0, None))
+
+    calls = []
+    for name in dashboard_snapshot.SECTIONS:
+        async def compute(name=name):
+            calls.append(name)
+            await asyncio.sleep(0)
+            return {"section": name}
+        monkeypatch.setitem(dashboard_snapshot.SECTIONS, name, compute)
+    database.section_calls = calls
+    database.events = events
+    return database
+
+
+@pytest.mark.asyncio
+async def test_unchanged_inputs_skip_recomputation(fake_db):
+    snapshot = await dashboard_snapshot.refresh_dashboard_snapshot()
+    assert sorted(fake_db.section_calls) == sorted(dashboard_snapshot.SECTIONS)
+    assert snapshot["sections"]["summary"]["etag"].startswith('"')
+
+    fake_db.section_calls.clear()
+    fake_db.dashboard_snapshots.find_one = AsyncMock(return_value=snapshot)
+    await dashboard_snapshot.refresh_dashboard_snapshot()
+    assert fake_db.section_calls == []
+
+
+@pytest.mark.asyncio
+async def test_new_usage_events_refresh_only_usage_sections(fake_db):
+    snapshot = await dashboard_snapshot.refresh_dashboard_snapshot()
+    fake_db.section_calls.clear()
+    fake_db.dashboard_snapshots.find_one = AsyncMock(return_value=snapshot)
+    fake_db.events.find_one = AsyncMock(return_value={"ts": datetime(2026, 1, 1, 12, 5)})
+
+    await dashboard_snapshot.refresh_dashboard_snapshot()
+
+    assert set(fake_db.section_calls) == dashboard_snapshot.EVENT_SECTIONS
+
+
+@pytest.mark.asyncio
+async def test_a_new_rollup_refreshes_the_usage_charts(fake_db):
+    snapshot = await dashboard_snapshot.refresh_dashboard_snapshot()
+    fake_db.section_calls.clear()
+    fake_db.dashboard_snapshots.find_one = AsyncMock(return_value=snapshot)
+    fake_db.rollup_state.find_one = AsyncMock(return_value={"watermark": datetime(2026, 1, 1, 12, 10)})
+
+    await dashboard_snapshot.refresh_dashboard_snapshot()
+
+    assert fake_db.section_calls == ["usage"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_without_a_snapshot_build_it_once(fake_db):
+    stored = {}
+
+    async def replace_one(query, doc, upsert):
+        stored["doc"] = doc
+
+    async def find_one(query):
+        return stored.get("doc")
+
+    fake_db.dashboard_snapshots.replace_one = replace_one
+    fake_db.dashboard_snapshots.find_one = find_one
+
+    results = await asyncio.gather(*(dashboard_snapshot.get_dashboard_section("summary") for _ in range(10)))
+
+    assert sorted(fake_db.section_calls) == sorted(dashboard_snapshot.SECTIONS)
+    assert len({etag for _, etag in results}) == 1
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.asyncio
+async def test_stats_endpoints_honour_if_none_match(monkeypatch):
+    monkeypatch.setattr(
+        admin_stats_routes, "get_dashboard_section", AsyncMock(return_value=({"users_total": 3}, '"abc"'))
+    )
+
+    fresh = await admin_stats_routes._snapshot_response(_request(), "summary")
+    assert fresh.status_code == 200 and fresh.headers["etag"] == '"abc"'
+
+    cached = await admin_stats_routes._snapshot_response(_request('"old", "abc"'), "summary")
+    assert cached.status_code == 304 and not cached.body
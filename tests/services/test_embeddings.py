@@ -0,0 +1,119 @@
+import json
+import pytest
+import httpx
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.embeddings import EmbeddingCache, EmbeddingService, cache_key
+
+
+class FakeEmbeddingEndpoint:
+    """Local stand-in for POST /embeddings that records every request."""
+
+    def __init__(self, dim: int = 8):
+        self.dim = dim
+        self.requests = []
+
+    def vector(self, text: str):
+        rng = np.random.default_rng(sum(text.encode()))
+        return rng.normal(size=self.dim).round(6).tolist()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        self.requests.append(body["input"])
+        data = [
+            {"object": "embedding", "index": i, "embedding": self.vector(text)}
+            for i, text in enumerate(body["input"])
+        ]
+        return httpx.Response(200, json={"object": "list", "data": data, "model": body["model"]})
+
+
+def make_service(tmp_path, endpoint, **kwargs):
+    return EmbeddingService(
+        model="fake-embedding",
+        cache_dir=str(tmp_path),
+        api_base="http://embeddings.local/v1",
+        api_key="test",
+        requests_per_minute=0,
+        transport=httpx.MockTransport(endpoint),
+        **kwargs,
+    )
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_skip_the_network(tmp_path):
+    endpoint = FakeEmbeddingEndpoint()
+    service = make_service(tmp_path, endpoint)
+    texts = ["alpha", "beta", "gamma"]
+
+    first = await service.embed(texts)
+    assert len(endpoint.requests) == 1
+    assert first.shape == (3, 8)
+    np.testing.assert_allclose(first[1], endpoint.vector("beta"), rtol=1e-6)
+
+    second = await service.embed(texts)
+    assert len(endpoint.requests) == 1
+    np.testing.assert_array_equal(first, second)
+
+    # A fresh service (e.g. another worker) reads the same on-disk cache
+    other = make_service(tmp_path, endpoint)
+    third = await other.embed(["gamma", "alpha"])
+    assert len(endpoint.requests) == 1
+    np.testing.assert_array_equal(third, first[[2, 0]])
+
+
+@pytest.mark.asyncio
+async def test_only_misses_are_requested_and_duplicates_collapse(tmp_path):
+    endpoint = FakeEmbeddingEndpoint()
+    service = make_service(tmp_path, endpoint)
+    await service.embed(["alpha"])
+
+    result = await service.embed(["alpha", "delta", "delta", "epsilon"])
+
+    assert endpoint.requests[-1] == ["delta", "epsilon"]
+    np.testing.assert_array_equal(result[1], result[2])
+
+
+@pytest.mark.asyncio
+async def test_inputs_are_split_into_token_bounded_batches(tmp_path):
+    endpoint = FakeEmbeddingEndpoint()
+    service = make_service(tmp_path, endpoint, max_batch_tokens=50, max_batch_inputs=3)
+    texts = [f"sentence number {i} " * 3 for i in range(10)]
+
+    result = await service.embed(texts)
+
+    assert result.shape == (10, 8)
+    assert len(endpoint.requests) > 1
+    assert all(len(batch) <= 3 for batch in endpoint.requests)
+    assert [t for batch in endpoint.requests for t in batch] == texts
+
+
+def test_cache_round_trips_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    keys = [cache_key("m", "a"), cache_key("m", "b")]
+    vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+    cache.put_many(keys, vectors)
+
+    reopened = EmbeddingCache(str(tmp_path))
+    found = reopened.get_many(keys + [cache_key("m", "c")])
+    assert set(found) == set(keys)
+    np.testing.assert_array_equal(found[keys[1]], vectors[1])
+
+
+def test_concurrent_lookups_and_appends_see_every_row(tmp_path):
+    writer = EmbeddingCache(str(tmp_path))
+    reader = EmbeddingCache(str(tmp_path))
+    keys = [cache_key("m", str(i)) for i in range(200)]
+    vectors = np.arange(200 * 4, dtype=np.float32).reshape(200, 4)
+
+    def work(i):
+        writer.put_many(keys[i:i + 1], vectors[i:i + 1])
+        return reader.get_many(keys[: i + 1])
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(work, range(200)))
+
+    found = reader.get_many(keys)
+    assert len(found) == 200 and len(reader._rows) == 200
+    for i in (0, 57, 199):
+        np.testing.assert_array_equal(found[keys[i]], vectors[i])
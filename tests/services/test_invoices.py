@@ -0,0 +1,117 @@
+import json
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import AsyncMock, MagicMock
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import stripe
+
+from app.services import invoices
+
+
+def _invoice(n, status="paid"):
+    return {
+        "id": f"in_{n}", "object": "invoice", "customer": "cus_1", "amount_paid": 1000 * n,
+        "currency": "usd", "status": status, "created": 1767225600 + n,
+        "hosted_invoice_url": f"https://pay.example/in_{n}",
+        "lines": {"object": "list", "data": [{"plan": {"nickname": "Pro"}}]},
+    }
+
+
+class StubStripe(BaseHTTPRequestHandler):
+    """Serves /v1/invoices in pages of two, like Stripe's list API."""
+
+    invoices = [_invoice(3), _invoice(2), _invoice(1)]
+    queries = []
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        StubStripe.queries.append(query)
+        ids = [inv["id"] for inv in self.invoices]
+        start = ids.index(query["starting_after"][0]) + 1 if "starting_after" in query else 0
+        page = self.invoices[start:start + 2]
+        body = json.dumps({
+            "object": "list", "url": "/v1/invoices", "data": page,
+            "has_more": start + 2 < len(self.invoices),
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_stripe(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubStripe)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubStripe.queries = []
+    monkeypatch.setattr(stripe, "api_base", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(stripe, "api_key", "sk_test_stub")
+    yield StubStripe
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def db(mock_db, monkeypatch):
+    mock_db.invoices = mock_db[invoices.INVOICES]
+    mock_db.invoices.bulk_write = AsyncMock()
+    mock_db.sync_state.find_one = AsyncMock(return_value=None)
+    mock_db.sync_state.update_one = AsyncMock()
+    monkeypatch.setattr(invoices, "db", mock_db)
+    return mock_db
+
+
+@pytest.mark.asyncio
+async def test_first_sync_mirrors_every_page(stub_stripe, db):
+    assert await invoices.sync_invoices() == 3
+
+    assert len(stub_stripe.queries) == 2
+    assert "created[gte]" not in stub_stripe.queries[0]
+    ops = db.invoices.bulk_write.call_args.args[0]
+    docs = [op._doc["$set"] for op in ops]
+    assert [d["_id"] for d in docs] == ["in_3", "in_2", "in_1"]
+    assert docs[0]["plan"] == "Pro" and docs[0]["amount_paid"] == 3000
+    assert docs[0]["created"].startswith("2026-01-01")
+    assert db.sync_state.update_one.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_later_syncs_only_walk_the_lookback_window(stub_stripe, db):
+    now = datetime(2026, 3, 1)
+    db.sync_state.find_one = AsyncMock(return_value={"synced_at": datetime(2026, 2, 28, 23, 30)})
+
+    await invoices.sync_invoices(now=now)
+
+    window_start = int((datetime(2026, 1, 25) - datetime(1970, 1, 1)).total_seconds())
+    assert stub_stripe.queries[0]["created[gte]"] == [str(window_start)]
+
+
+@pytest.mark.asyncio
+async def test_stripe_errors_leave_the_mirror_untouched(db, monkeypatch):
+    monkeypatch.setattr(invoices, "_list_invoices", MagicMock(side_effect=stripe.APIConnectionError("down")))
+    assert await invoices.sync_invoices() == 0
+    db.invoices.bulk_write.assert_not_called()
+    db.sync_state.update_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_resyncing_refreshes_invoices_without_duplicating_them(stub_stripe, memory_db, monkeypatch):
+    monkeypatch.setattr(invoices, "db", memory_db)
+    await invoices.sync_invoices(now=datetime(2026, 3, 1))
+    stub_stripe.invoices = [_invoice(3, status="void"), _invoice(2), _invoice(1)]
+
+    await invoices.sync_invoices(now=datetime(2026, 3, 2))
+
+    mirror = memory_db[invoices.INVOICES].docs
+    assert sorted(mirror) == ["in_1", "in_2", "in_3"]
+    assert mirror["in_3"]["status"] == "void"
+    assert [inv["_id"] for inv in await invoices.get_customer_invoices("cus_1", limit=2)] == ["in_3", "in_2"]
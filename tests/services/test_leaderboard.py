@@ -0,0 +1,116 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.services import leaderboard
+
+USER_ID = "65f000000000000000000001"
+ORG_ID = "65f0000000000000000000aa"
+
+
+@pytest.fixture
+def db(mock_db, monkeypatch):
+    mock_db.leaderboard_totals.find_one_and_update = AsyncMock(return_value={"tokens": 500})
+    mock_db.leaderboards.update_one = AsyncMock(return_value=MagicMock(matched_count=0))
+    monkeypatch.setattr(leaderboard, "db", mock_db)
+    return mock_db
+
+
+@pytest.mark.asyncio
+async def test_charge_updates_global_and_org_boards(db):
+    await leaderboard.record_charge(USER_ID, ORG_ID, 120, size=3)
+
+    period = leaderboard.current_period()
+    assert db.leaderboard_totals.find_one_and_update.call_args.args[1]["$inc"] == {"tokens": 120}
+    pushes = [c for c in db.leaderboards.update_one.call_args_list if "$push" in c.args[1]]
+    assert [c.args[0]["_id"] for c in pushes] == [f"global:*:{period}", f"org:{ORG_ID}:{period}"]
+    push = pushes[0].args[1]["$push"]["entries"]
+    assert push["$each"] == [{"user_id": USER_ID, "tokens": 500}]
+    assert push["$slice"] == 3
+    assert pushes[0].args[0]["$or"][1] == {"entries.2.tokens": {"$lt": 500}}
+    assert pushes[0].args[0]["entries.user_id"] == {"$ne": USER_ID}
+
+
+@pytest.mark.asyncio
+async def test_user_already_on_board_is_raised_in_place(db):
+    db.leaderboards.update_one = AsyncMock(return_value=MagicMock(matched_count=1))
+
+    await leaderboard.record_charge(USER_ID, None, 10)
+
+    first, resort = db.leaderboards.update_one.call_args_list
+    assert first.args[1] == {"$max": {"entries.$.tokens": 500}}
+    assert resort.args[1]["$push"]["entries"]["$each"] == []
+
+
+@pytest.mark.asyncio
+async def test_full_board_that_user_does_not_beat_is_left_alone(db):
+    db.leaderboards.update_one = AsyncMock(side_effect=[
+        MagicMock(matched_count=0), DuplicateKeyError("dup"), MagicMock(matched_count=0), MagicMock(matched_count=0),
+    ])
+    await leaderboard.record_charge(USER_ID, None, 10)
+    push, raise_ = db.leaderboards.update_one.call_args_list[2:]
+    assert "upsert" not in push.kwargs
+    assert raise_.args[0] == {"_id": push.args[0]["_id"], "entries.user_id": USER_ID}
+
+
+@pytest.mark.asyncio
+async def test_user_pushed_by_a_concurrent_charge_is_raised_not_duplicated(db):
+    db.leaderboards.update_one = AsyncMock(side_effect=[
+        MagicMock(matched_count=0), DuplicateKeyError("dup"), MagicMock(matched_count=0),
+        MagicMock(matched_count=1), MagicMock(matched_count=1),
+    ])
+
+    await leaderboard.record_charge(USER_ID, None, 10)
+
+    updates = [c.args[1] for c in db.leaderboards.update_one.call_args_list]
+    assert updates[3] == {"$max": {"entries.$.tokens": 500}}
+    assert updates[4]["$push"]["entries"]["$each"] == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_charges_leave_one_entry_with_the_full_total(memory_db, monkeypatch):
+    monkeypatch.setattr(leaderboard, "db", memory_db)
+    other = "65f000000000000000000002"
+
+    await asyncio.gather(
+        leaderboard.record_charge(USER_ID, ORG_ID, 100, size=3),
+        leaderboard.record_charge(USER_ID, ORG_ID, 50, size=3),
+        leaderboard.record_charge(other, ORG_ID, 70, size=3),
+    )
+
+    period = leaderboard.current_period()
+    for scope, key in [(leaderboard.SCOPE_GLOBAL, leaderboard.GLOBAL_KEY), (leaderboard.SCOPE_ORG, ORG_ID)]:
+        board = memory_db.leaderboards.docs[leaderboard.board_id(scope, key, period)]
+        assert board["entries"] == [{"user_id": USER_ID, "tokens": 150}, {"user_id": other, "tokens": 70}]
+
+
+@pytest.mark.asyncio
+async def test_zero_charges_are_ignored(db):
+    await leaderboard.record_charge(USER_ID, ORG_ID, 0)
+    db.leaderboard_totals.find_one_and_update.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_read_is_bounded_and_tolerates_mixed_id_types(db):
+    db.leaderboards.find_one = AsyncMock(return_value={"entries": [
+        {"user_id": USER_ID, "tokens": 900}, {"user_id": "deleted-user", "tokens": 800},
+    ]})
+    users = MagicMock()
+    users.to_list = AsyncMock(return_value=[
+        {"_id": ObjectId(USER_ID), "email": "a@b.c", "role": "organization_user", "organization_id": ObjectId(ORG_ID)},
+    ])
+    db.users.find.return_value = users
+    orgs = MagicMock()
+    orgs.to_list = AsyncMock(return_value=[{"_id": ObjectId(ORG_ID), "name": "Acme"}])
+    db.organizations.find.return_value = orgs
+
+    board = await leaderboard.get_leaderboard(limit=5)
+
+    assert db.leaderboards.find_one.call_args.args[1] == {"entries": {"$slice": 5}}
+    assert board == [{
+        "user_id": USER_ID, "email": "a@b.c", "role": "organization_user",
+        "organization": "Acme", "tokens_used": 900,
+    }]
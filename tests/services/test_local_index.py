@@ -0,0 +1,159 @@
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services import local_index
+from app.services.local_index import LocalVectorIndex, RETRIEVAL_BACKEND_LOCAL
+from app.tasks import local_index_backfill
+
+DIM = 512
+
+
+async def fake_embedder(texts):
+    """Deterministic bag-of-words embedder: each word hashes to one dimension."""
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+    return vectors
+
+
+CHUNKS = [
+    "Zakat is an obligatory charity paid once a year on savings.",
+    "Fasting during Ramadan begins at dawn and ends at sunset.",
+    "Prayer is performed five times a day facing the qibla.",
+]
+
+
+@pytest.fixture
+def org_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_index.settings, "LOCAL_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(local_index, "_indexes", {})
+    return "org_test"
+
+
+@pytest.mark.asyncio
+async def test_index_and_search_returns_matching_chunk(org_index):
+    for i, chunk in enumerate(CHUNKS):
+        await local_index.index_document_text(
+            org_index, f"doc{i}.txt", chunk, file_id=f"file_{i}",
+            embedder=fake_embedder, chunker=lambda text: [text],
+        )
+
+    hits = await local_index.search_org(
+        org_index, ["When does fasting in Ramadan end?", "How often is prayer performed?"],
+        k=2, embedder=fake_embedder,
+    )
+
+    assert hits[0][0][1]["file_id"] == "file_1"
+    assert hits[1][0][1]["file_id"] == "file_2"
+    assert hits[0][0][0] >= hits[0][1][0]
+
+
+@pytest.mark.asyncio
+async def test_index_persists_and_reopens_memory_mapped(tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "org"))
+    vectors = await fake_embedder(CHUNKS)
+    index.add(vectors, [{"file_id": f"file_{i}", "text": c} for i, c in enumerate(CHUNKS)])
+
+    reopened = LocalVectorIndex(str(tmp_path / "org"))
+    assert len(reopened) == 3
+    hit = reopened.search(vectors[1], k=1)[0][0]
+    assert hit[1]["file_id"] == "file_1"
+    assert hit[0] == pytest.approx(1.0, abs=1e-5)
+
+    assert reopened.remove_file("file_1") == 1
+    assert len(LocalVectorIndex(str(tmp_path / "org"))) == 2
+
+
+def test_quantized_search_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, DIM)).astype(np.float32)
+    meta = [{"file_id": str(i)} for i in range(500)]
+    exact = LocalVectorIndex(str(tmp_path / "exact"))
+    exact.add(vectors, meta)
+    quantized = LocalVectorIndex(str(tmp_path / "q8"), quantize=True)
+    quantized.add(vectors, meta)
+
+    queries = vectors[:20] + rng.normal(scale=0.05, size=(20, DIM)).astype(np.float32)
+    exact_top = [hits[0][1]["file_id"] for hits in exact.search(queries, k=5)]
+    quantized_top = [hits[0][1]["file_id"] for hits in quantized.search(queries, k=5)]
+    assert exact_top == quantized_top == [str(i) for i in range(20)]
+
+
+def test_workers_sharing_a_directory_keep_each_others_rows(tmp_path):
+    path = str(tmp_path / "org")
+    first, second = LocalVectorIndex(path), LocalVectorIndex(path)
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(40, DIM)).astype(np.float32)
+
+    # Interleaved appends from two "workers", each with its own cached header
+    first.add(vectors[:10], [{"file_id": "a", "i": i} for i in range(10)])
+    second.add(vectors[10:20], [{"file_id": "b", "i": i} for i in range(10, 20)])
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(
+            lambda i: (first if i % 2 else second).add(vectors[i:i + 1], [{"file_id": "c", "i": i}]),
+            range(20, 40),
+        ))
+
+    assert len(first) == len(second) == len(LocalVectorIndex(path)) == 40
+    hits = first.search(vectors, k=1)
+    assert [h[0][1]["i"] for h in hits] == list(range(40))
+
+    assert second.remove_file("a") == 10
+    assert len(first) == 30
+    assert {h[0][1]["file_id"] for h in first.search(vectors[10:], k=1)} == {"b", "c"}
+
+
+@pytest.mark.asyncio
+async def test_questionnaire_uses_local_backend(org_index):
+    from app.services.questionnaire import process_questionnaire_rag
+
+    for i, chunk in enumerate(CHUNKS):
+        await local_index.index_document_text(
+            org_index, f"doc{i}.txt", chunk, file_id=f"file_{i}",
+            embedder=fake_embedder, chunker=lambda text: [text],
+        )
+
+    with patch("app.services.questionnaire._query_vector_store", new_callable=AsyncMock) as mock_query, \
+         patch("app.services.questionnaire._generate_answer", new_callable=AsyncMock, return_value="Sunset."), \
+         patch.object(local_index.OpenAIOrganizationService, "get_embeddings", side_effect=fake_embedder):
+        results = await process_questionnaire_rag(
+            b"When does fasting in Ramadan end?", "q.txt", None, {}, None,
+            org_id=org_index, backend=RETRIEVAL_BACKEND_LOCAL,
+        )
+
+    mock_query.assert_not_called()
+    assert results[0]["answer"] == "Sunset."
+    assert results[0]["source_file"] == "doc1.txt"
+
+
+@pytest.mark.asyncio
+async def test_backfill_indexes_existing_documents_and_reports_the_rest(org_index, monkeypatch):
+    org_id = "65f0000000000000000000aa"
+    await local_index.index_document_text(
+        org_id, "doc0.txt", CHUNKS[0], file_id="file_0", embedder=fake_embedder, chunker=lambda text: [text],
+    )
+    database = MagicMock()
+    database.documents.find.return_value = MagicMock(to_list=AsyncMock(return_value=[
+        {"filename": f"doc{i}.txt", "openai_file_id": f"file_{i}"} for i in range(3)
+    ]))
+    downloads = []
+
+    def download(file_id):
+        downloads.append(file_id)
+        if file_id == "file_2":
+            raise RuntimeError("Not allowed to download files of purpose: assistants")
+        return CHUNKS[1].encode()
+
+    monkeypatch.setattr(local_index_backfill, "_download", download)
+    monkeypatch.setattr(local_index_backfill, "_extract_text", lambda content, filename: content.decode())
+
+    failed = await local_index_backfill.backfill_local_index(org_id, embedder=fake_embedder, database=database)
+
+    assert failed == ["doc2.txt"]
+    assert downloads == ["file_1", "file_2"]
+    assert local_index.get_org_index(org_id).file_ids() == {"file_0", "file_1"}
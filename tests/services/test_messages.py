@@ -0,0 +1,109 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+
+from app.services import messages as message_store
+
+CHAT_ID = ObjectId("65f000000000000000000099")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = MagicMock()
+    monkeypatch.setattr(message_store, "db", db)
+    return db
+
+
+@pytest.mark.asyncio
+async def test_append_message_writes_one_message_and_a_summary(db):
+    db.chats.find_one_and_update = AsyncMock(return_value={"_id": CHAT_ID, "message_count": 121})
+    db.messages.insert_many = AsyncMock()
+
+    seq = await message_store.append_message(str(CHAT_ID), {"role": "user", "content": "x" * 500})
+
+    assert seq == 120
+    update = db.chats.find_one_and_update.call_args.args[1]
+    assert update["$inc"] == {"message_count": 1}
+    assert len(update["$set"]["last_message"]["preview"]) == message_store.PREVIEW_CHARS
+    assert "$push" not in update
+    stored = db.messages.insert_many.call_args.args[0][0]
+    assert stored["chat_id"] == CHAT_ID and stored["seq"] == 120
+
+
+@pytest.mark.asyncio
+async def test_append_message_to_missing_chat_raises(db):
+    db.chats.find_one_and_update = AsyncMock(return_value=None)
+    with pytest.raises(ValueError):
+        await message_store.append_message(str(CHAT_ID), {"role": "user", "content": "hi"})
+
+
+@pytest.mark.asyncio
+async def test_migrate_chat_moves_embedded_messages(db):
+    legacy = [{"role": "user", "content": "q"}, {"role": "assistant", "content": "a"}]
+    db.chats.find_one = AsyncMock(return_value={"_id": CHAT_ID, "messages": legacy})
+    db.messages.bulk_write = AsyncMock()
+    db.chats.update_one = AsyncMock()
+
+    assert await message_store.migrate_chat(CHAT_ID) == 2
+
+    ops = db.messages.bulk_write.call_args.args[0]
+    assert [op._filter for op in ops] == [{"chat_id": CHAT_ID, "seq": 0}, {"chat_id": CHAT_ID, "seq": 1}]
+    update = db.chats.update_one.call_args.args[1]
+    assert update["$unset"] == {"messages": ""}
+    assert update["$set"]["message_count"] == 2
+    assert update["$set"]["last_message"]["preview"] == "a"
+
+
+@pytest.mark.asyncio
+async def test_migrated_chats_are_left_alone(db):
+    db.chats.find_one = AsyncMock(return_value=None)
+    db.messages.bulk_write = AsyncMock()
+    assert await message_store.migrate_chat(CHAT_ID) == 0
+    db.messages.bulk_write.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_messages_page_is_oldest_first_with_cursor(db):
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=[{"seq": s, "role": "user", "content": str(s)} for s in (119, 118, 117)])
+    db.messages.find.return_value = cursor
+
+    page, next_before = await message_store.get_messages_page(str(CHAT_ID), before=120, limit=3)
+
+    assert [m["seq"] for m in page] == [117, 118, 119]
+    assert next_before == 117
+    assert db.messages.find.call_args.args[0] == {"chat_id": CHAT_ID, "seq": {"$lt": 120}}
+
+
+@pytest.mark.asyncio
+async def test_persist_turn_is_one_counter_update_and_one_insert(db):
+    db.chats.find_one_and_update = AsyncMock(return_value={"_id": CHAT_ID, "message_count": 12})
+    db.messages.insert_many = AsyncMock()
+
+    saved = await message_store.persist_turn(
+        str(CHAT_ID), "question?", "answer.", footnotes=[{"reference": "1:1"}],
+        references=["(doc.pdf, 1, ...)"], input_tokens=3, output_tokens=5,
+    )
+
+    assert db.chats.find_one_and_update.await_count == 1
+    assert db.chats.find_one_and_update.call_args.args[1]["$inc"] == {"message_count": 2}
+    docs = db.messages.insert_many.call_args.args[0]
+    assert db.messages.insert_many.call_args.kwargs["ordered"] is True
+    assert [(d["role"], d["seq"], d["tokens"]) for d in docs] == [("user", 10, 3), ("assistant", 11, 5)]
+    assert docs[1]["references"] == ["(doc.pdf, 1, ...)"]
+    assert [m["seq"] for m in saved] == [10, 11]
+    assert all("chat_id" not in m for m in saved)
+
+
+@pytest.mark.asyncio
+async def test_persist_turn_without_reply_stores_the_question(db):
+    db.chats.find_one_and_update = AsyncMock(return_value={"_id": CHAT_ID, "message_count": 1})
+    db.messages.insert_many = AsyncMock()
+
+    saved = await message_store.persist_turn(str(CHAT_ID), "question?")
+
+    assert [m["role"] for m in saved] == ["user"]
+    assert db.chats.find_one_and_update.call_args.args[1]["$set"]["last_message"]["role"] == "user"
@@ -0,0 +1,61 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+
+from app.services import org_dashboard
+
+ORG = ObjectId()
+
+
+def _stages(pipeline):
+    return [next(iter(stage)) for stage in pipeline]
+
+
+def _lookups(pipeline):
+    return {stage["$lookup"]["from"]: stage["$lookup"] for stage in pipeline if "$lookup" in stage}
+
+
+def test_one_pipeline_pages_members_and_joins_counts_and_billing():
+    pipeline = org_dashboard.org_dashboard_pipeline(ORG, skip=100, limit=50, period="2026-10")
+
+    assert pipeline[0] == {"$match": {"_id": ORG}}
+    assert _stages(pipeline)[-1] == "$project"
+    lookups = _lookups(pipeline)
+    assert set(lookups) == {"users", "assistants", org_dashboard.INVOICES}
+
+    members = lookups["users"]["pipeline"]
+    assert members[0] == {"$match": {"organization_id": {"$in": [ORG, str(ORG)]}}}
+    page = members[-1]["$facet"]["page"]
+    assert page[:2] == [{"$skip": 100}, {"$limit": 50}]
+    fields = page[-1]["$project"]
+    assert "password" not in fields and fields["_id"] == 0
+    assert fields["monthly_usage"]["$cond"][2] == {"$ifNull": ["$quota.periods.2026-10", 0]}
+    flat = fields["monthly_usage"]["$cond"][1]["$cond"]
+    assert flat[1:] == [{"$ifNull": ["$quota.used", 0]}, 0]
+
+    assert fields["quota"]["$mergeObjects"][1] == {"used": fields["monthly_usage"]}
+
+    org_quota = pipeline[-1]["$project"]["org"]["quota"]["$mergeObjects"]
+    assert org_quota[1]["used"]["$cond"][2] == {"$ifNull": ["$usage_quota.periods.2026-10", 0]}
+    assert org_quota[0]["$arrayToObject"]["$filter"]["cond"] == {"$ne": ["$$this.k", "periods"]}
+
+    assert lookups["assistants"]["pipeline"][0] == {"$match": {"org_id": {"$in": [ORG, str(ORG)]}}}
+    assert {"$limit": org_dashboard.BILLING_HISTORY_LIMIT} in lookups[org_dashboard.INVOICES]["pipeline"]
+
+
+@pytest.mark.asyncio
+async def test_dashboard_adds_paging_and_reports_missing_org():
+    database = MagicMock()
+    database.organizations.aggregate.return_value = MagicMock(to_list=AsyncMock(return_value=[
+        {"org": {"_id": str(ORG)}, "users": [], "users_total": 0},
+    ]))
+
+    dashboard = await org_dashboard.get_org_dashboard(ORG, page=3, page_size=20, database=database)
+
+    assert dashboard["page"] == 3 and dashboard["page_size"] == 20
+    members = _lookups(database.organizations.aggregate.call_args.args[0])["users"]["pipeline"]
+    assert members[-1]["$facet"]["page"][:2] == [{"$skip": 40}, {"$limit": 20}]
+
+    database.organizations.aggregate.return_value = MagicMock(to_list=AsyncMock(return_value=[]))
+    assert await org_dashboard.get_org_dashboard(ORG, database=database) is None
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.services.password_hashing import PasswordHasher, hash_cost
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_round_trip():
+    hasher = PasswordHasher(rounds=4, workers=2, max_pending=4)
+    hashed = await hasher.hash("s3cret")
+
+    assert hash_cost(hashed) == 4
+    assert await hasher.verify("s3cret", hashed)
+    assert not await hasher.verify("wrong", hashed)
+    assert not await hasher.verify("s3cret", "not-a-bcrypt-hash")
+    assert hasher.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_long_passwords_truncate_like_passlib():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=4)
+    hashed = await hasher.hash("x" * 100)
+
+    assert await hasher.verify("x" * 72, hashed)
+
+
+@pytest.mark.asyncio
+async def test_verify_and_update_rehashes_on_cost_change():
+    old = PasswordHasher(rounds=4, workers=1, max_pending=4)
+    hashed = await old.hash("s3cret")
+
+    assert await old.verify_and_update("s3cret", hashed) == (True, None)
+
+    current = PasswordHasher(rounds=5, workers=1, max_pending=4)
+    valid, new_hash = await current.verify_and_update("s3cret", hashed)
+    assert valid and hash_cost(new_hash) == 5
+    assert await current.verify("s3cret", new_hash)
+    assert await current.verify_and_update("wrong", hashed) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_rejects_with_429_when_saturated():
+    hasher = PasswordHasher(rounds=4, workers=1, max_pending=2)
+    release = threading.Event()
+    hasher._hash = lambda password: release.wait(5) and "done"
+
+    running = [asyncio.create_task(hasher.hash("a")), asyncio.create_task(hasher.hash("b"))]
+    await asyncio.sleep(0)
+    assert hasher.pending == 2
+
+    with pytest.raises(HTTPException) as exc:
+        await hasher.hash("c")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "1"
+
+    release.set()
+    assert await asyncio.gather(*running) == ["done", "done"]
+    assert hasher.pending == 0
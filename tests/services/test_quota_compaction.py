@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.tasks import quota_compaction
+from app.utils import locks
+
+NOW = datetime(2026, 10, 19, 3, 0)
+IDS = [ObjectId() for _ in range(3)]
+
+
+def _collection(ids=()):
+    collection = MagicMock()
+    batches = [[{"_id": i} for i in ids[n:n + 2]] for n in range(0, len(ids), 2)] + [[]]
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(side_effect=batches)
+    collection.find.return_value = cursor
+    collection.update_many = AsyncMock(return_value=MagicMock(modified_count=1))
+    return collection
+
+
+def _database(state=None, lock_held_elsewhere=False, **collections):
+    named = {name: collections.get(name) or _collection() for name in ("users", "organizations", "usage")}
+    named["quota_compaction_state"] = MagicMock(find_one=AsyncMock(return_value=state), update_one=AsyncMock())
+    job_locks = MagicMock(delete_one=AsyncMock())
+    job_locks.find_one_and_update = AsyncMock(return_value={"owner": locks.INSTANCE_ID})
+    if lock_held_elsewhere:
+        job_locks.find_one_and_update.side_effect = DuplicateKeyError("held")
+    named["job_locks"] = job_locks
+    database = MagicMock()
+    database.__getitem__.side_effect = named.__getitem__
+    return database, named
+
+
+@pytest.fixture(autouse=True)
+def fast_batches(monkeypatch):
+    monkeypatch.setattr(quota_compaction.settings, "QUOTA_COMPACTION_BATCH_SIZE", 2)
+    monkeypatch.setattr(quota_compaction.settings, "QUOTA_COMPACTION_MAX_DOCS_PER_SECOND", 10**9)
+    monkeypatch.setattr(quota_compaction.settings, "QUOTA_PERIOD_RETENTION_MONTHS", 12)
+
+
+def test_oldest_kept_period():
+    assert quota_compaction.oldest_kept_period(NOW, 12) == "2025-11"
+    assert quota_compaction.oldest_kept_period(datetime(2026, 1, 5), 1) == "2026-01"
+    assert quota_compaction.oldest_kept_period(datetime(2026, 1, 5), 2) == "2025-12"
+
+
+@pytest.mark.asyncio
+async def test_compacts_in_id_batches_touching_only_docs_that_need_it():
+    users = _collection(IDS)
+    database, named = _database(users=users)
+
+    assert await quota_compaction.compact_quota_periods(now=NOW, database=database) == 2
+
+    first, second = users.update_many.call_args_list
+    query, pipeline = first.args
+    assert query["_id"] == {"$gte": IDS[0], "$lte": IDS[1]}
+    assert {"quota.used": {"$exists": True}} in query["$or"]
+    assert pipeline[0]["$set"]["quota.periods"]["$arrayToObject"]["$filter"]["cond"] == {"$gte": ["$$this.k", "2025-11"]}
+    assert pipeline[1] == {"$unset": ["quota.used", "quota.reset_period"]}
+    assert second.args[0]["_id"] == {"$gte": IDS[2], "$lte": IDS[2]}
+    assert users.find.call_args_list[1].args[0] == {"_id": {"$gt": IDS[1]}}
+
+    checkpoints = [c.args[1]["$set"] for c in named["quota_compaction_state"].update_one.call_args_list]
+    assert checkpoints[0]["last_id"] == IDS[1] and checkpoints[-1]["done"] is True
+    named["job_locks"].delete_one.assert_awaited_once()
+
+
+def test_flat_counters_seed_the_period_only_when_reset_in_it():
+    users, _, usage = quota_compaction.phases("2026-10")
+
+    condition, counter, stale = users.seed["$cond"]
+    assert counter == {"$ifNull": ["$quota.used", 0]} and stale == 0
+    assert {check["$eq"][1] for check in condition["$or"]} == {"2026-10"}
+    assert usage.seed["messages"]["$cond"][1] == {"$ifNull": ["$$ROOT.message_count_monthly", 0]}
+
+
+@pytest.mark.asyncio
+async def test_resumes_from_checkpoint():
+    users, orgs = _collection(IDS), _collection(IDS[2:])
+    state = {"_id": "2026-10", "phase": "organizations", "last_id": IDS[1]}
+    database, _ = _database(state=state, users=users, organizations=orgs)
+
+    await quota_compaction.compact_quota_periods(now=NOW, database=database)
+
+    users.find.assert_not_called()
+    assert orgs.find.call_args_list[0].args[0] == {"_id": {"$gt": IDS[1]}}
+
+
+@pytest.mark.asyncio
+async def test_skips_when_done_or_locked():
+    database, named = _database(state={"_id": "2026-10", "done": True})
+    assert await quota_compaction.compact_quota_periods(now=NOW, database=database) == 0
+    named["users"].find.assert_not_called()
+
+    database, named = _database(lock_held_elsewhere=True)
+    assert await quota_compaction.compact_quota_periods(now=NOW, database=database) == 0
+    named["quota_compaction_state"].find_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reset_current_period_zeroes_only_this_period():
+    database, named = _database()
+
+    await quota_compaction.reset_current_period(now=NOW, database=database)
+
+    query, update = named["usage"].update_many.await_args.args
+    assert {"periods.2026-10": {"$exists": True}} in query["$or"]
+    assert update["$set"] == {"periods.2026-10": {"tokens": 0, "messages": 0}}
+    assert named["users"].update_many.await_args.args[1]["$set"] == {"quota.periods.2026-10": 0}
+
+
+@pytest.mark.asyncio
+async def test_lock_is_taken_over_only_when_expired():
+    job_locks = MagicMock()
+    job_locks.find_one_and_update = AsyncMock(return_value={"owner": "me"})
+    database = MagicMock()
+    database.__getitem__.return_value = job_locks
+
+    assert await locks.acquire_lock("job", timedelta(seconds=30), owner="me", database=database)
+    query = job_locks.find_one_and_update.call_args.args[0]
+    assert query["_id"] == "job"
+    assert {"owner": "me"} in query["$or"]
+    assert "$lte" in query["$or"][1]["expires_at"]
+
+    job_locks.find_one_and_update.side_effect = DuplicateKeyError("held")
+    assert not await locks.acquire_lock("job", timedelta(seconds=30), owner="me", database=database)
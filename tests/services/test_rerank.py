@@ -0,0 +1,57 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from app.services import questionnaire
+from app.services.rerank import bm25_scores, pack_chunks, rerank
+
+QUESTION = "What is the data retention period for customer backups?"
+
+HITS = [
+    {"text": "Our company values customer trust and data privacy.", "score": 0.82, "filename": "values.pdf", "page": 1},
+    {"text": "Customer backups are kept for a retention period of 35 days.", "score": 0.78, "filename": "ops.pdf", "page": 4},
+    {"text": "The office is closed on public holidays.", "score": 0.40, "filename": "hr.pdf", "page": 2},
+]
+
+
+def test_bm25_prefers_chunks_with_query_terms():
+    scores = bm25_scores(QUESTION, [h["text"] for h in HITS])
+    assert scores[1] > scores[0] > scores[2]
+
+
+def test_rerank_promotes_lexical_evidence_from_second_hit():
+    ranked = rerank(QUESTION, [dict(h) for h in HITS])
+    assert ranked[0]["filename"] == "ops.pdf"
+    assert ranked[-1]["filename"] == "hr.pdf"
+
+
+def test_pack_chunks_respects_token_budget():
+    hits = [{"text": "a " * 10}, {"text": "b " * 30}, {"text": "c " * 5}]
+    packed = pack_chunks(hits, 16, lambda t: len(t.split()))
+    assert [h["text"][0] for h in packed] == ["a", "c"]
+
+
+@pytest.mark.asyncio
+async def test_query_vector_store_requests_top_k_and_packs_reranked_chunks():
+    response = MagicMock(status_code=200)
+    response.json.return_value = {
+        "data": [
+            {"file_id": f"file_{i}", "score": h["score"], "content": [{"type": "text", "text": h["text"]}]}
+            for i, h in enumerate(HITS)
+        ]
+    }
+    file_map = {"file_0": "values.pdf", "file_1": "ops.pdf", "file_2": "hr.pdf"}
+
+    async def uncached(store, query, fetch):
+        return await fetch()
+
+    with patch.object(questionnaire.requests, "post", return_value=response) as post, \
+         patch.object(questionnaire.retrieval_cache, "get_or_fetch", side_effect=uncached):
+        context, filename, snippet, _ = await questionnaire._query_vector_store(QUESTION, "vs_1", file_map, "key")
+
+    assert json.loads(post.call_args.kwargs["data"])["max_num_results"] == questionnaire.RETRIEVAL_TOP_K
+    assert filename == "ops.pdf"
+    assert snippet == HITS[1]["text"][:20]
+    assert context.startswith(HITS[1]["text"])
+    assert HITS[0]["text"] in context
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.services import retrieval_cache as rc
+from app.services.retrieval_cache import RetrievalCache, normalize_query
+
+
+@pytest.fixture
+def mock_db(monkeypatch):
+    db = MagicMock()
+    db.vector_store_manifests.find_one = AsyncMock(return_value=None)
+    db.vector_store_manifests.find_one_and_update = AsyncMock(return_value={"_id": "vs_1", "version": 1})
+    db.retrieval_cache.find_one = AsyncMock(return_value=None)
+    db.retrieval_cache.replace_one = AsyncMock()
+    db.retrieval_cache.create_index = AsyncMock()
+    monkeypatch.setattr(rc, "db", db)
+    return db
+
+
+def test_normalize_query():
+    assert normalize_query("  What is   Zakat?? ") == "what is zakat"
+
+
+@pytest.mark.asyncio
+async def test_repeated_query_is_served_from_memory(mock_db):
+    cache = RetrievalCache(max_entries=10, ttl_seconds=60, manifest_ttl_seconds=60)
+    fetch = AsyncMock(return_value=[{"text": "chunk"}])
+
+    first = await cache.get_or_fetch("vs_1", "What is Zakat?", fetch)
+    second = await cache.get_or_fetch("vs_1", "what is zakat", fetch)
+
+    assert first == second == [{"text": "chunk"}]
+    fetch.assert_awaited_once()
+    mock_db.retrieval_cache.replace_one.assert_awaited_once()
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_bump_invalidates_cached_results(mock_db):
+    cache = RetrievalCache(max_entries=10, ttl_seconds=60, manifest_ttl_seconds=60)
+    fetch = AsyncMock(side_effect=[["old"], ["new"]])
+
+    assert await cache.get_or_fetch("vs_1", "q", fetch) == ["old"]
+    await cache.bump("vs_1")
+    assert await cache.get_or_fetch("vs_1", "q", fetch) == ["new"]
+    assert fetch.await_count == 2
+    assert cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_mongo_tier_is_shared_and_failures_are_not_cached(mock_db):
+    cache = RetrievalCache(max_entries=10, ttl_seconds=60, manifest_ttl_seconds=60)
+    mock_db.retrieval_cache.find_one.return_value = {
+        "value": ["shared"], "expires_at": datetime.utcnow() + timedelta(minutes=5)
+    }
+    fetch = AsyncMock(return_value=None)
+
+    assert await cache.get_or_fetch("vs_1", "q", fetch) == ["shared"]
+    fetch.assert_not_awaited()
+    assert cache.stats()["mongo_hits"] == 1
+
+    mock_db.retrieval_cache.find_one.return_value = None
+    assert await cache.get_or_fetch("vs_1", "other", fetch) is None
+    mock_db.retrieval_cache.replace_one.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_results_cached_while_indexing_expire_quickly(mock_db, monkeypatch):
+    monkeypatch.setattr(rc.settings, "RETRIEVAL_CACHE_INDEXING_TTL_SECONDS", 30)
+    monkeypatch.setattr(rc.settings, "RETRIEVAL_CACHE_INDEXING_POLL_SECONDS", 0)
+    statuses = iter([["in_progress"], ["completed"]])
+    monkeypatch.setattr(rc, "_file_statuses", lambda vs, ids: next(statuses))
+    indexing_until = datetime.utcnow() + timedelta(minutes=10)
+    mock_db.vector_store_manifests.find_one_and_update.side_effect = [
+        {"_id": "vs_1", "version": 1, "indexing": 1, "indexing_until": indexing_until},
+        {"_id": "vs_1", "version": 2, "indexing": 0, "indexing_until": indexing_until},
+    ]
+    cache = RetrievalCache(max_entries=10, ttl_seconds=3600, manifest_ttl_seconds=60)
+
+    task = await cache.bump_when_indexed("vs_1", ["file_1"])
+    await cache.set("vs_1", "q", ["pre-index"])
+    expires = mock_db.retrieval_cache.replace_one.await_args.args[1]["expires_at"]
+    assert expires < datetime.utcnow() + timedelta(seconds=31)
+
+    await task
+    finish = mock_db.vector_store_manifests.find_one_and_update.await_args_list[1].args[1]
+    assert finish["$inc"] == {"version": 1, "indexing": -1}
+    fetch = AsyncMock(return_value=["indexed"])
+    assert await cache.get_or_fetch("vs_1", "q", fetch) == ["indexed"]
+    expires = mock_db.retrieval_cache.replace_one.await_args.args[1]["expires_at"]
+    assert expires > datetime.utcnow() + timedelta(minutes=59)
+
+
+@pytest.mark.asyncio
+async def test_deleted_files_bump_every_store_that_held_them(mock_db, monkeypatch):
+    org_id = "65f0000000000000000000aa"
+    mock_db.assistants.distinct = AsyncMock(return_value=["vs_1", None, "vs_2"])
+    bump = AsyncMock()
+    monkeypatch.setattr(rc.retrieval_cache, "bump", bump)
+
+    await rc.invalidate_file_vector_stores(["file_1"], [org_id, None, org_id])
+
+    field, query = mock_db.assistants.distinct.await_args.args
+    assert field == "vector_store_id"
+    assert query["$or"] == [{"file_ids": {"$in": ["file_1"]}}, {"org_id": {"$in": [rc.ObjectId(org_id)]}}]
+    assert [c.args[0] for c in bump.await_args_list] == ["vs_1", "vs_2"]
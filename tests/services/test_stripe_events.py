@@ -0,0 +1,158 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.services import invoices, stripe_events
+
+ORG_ID = "65f0000000000000000000aa"
+
+
+def _event(event_id, event_type, created, org_id=ORG_ID):
+    return {
+        "id": event_id, "type": event_type, "created": created,
+        "data": {"object": {"id": "sub_1", "customer": "cus_1", "metadata": {"organization_id": org_id}}},
+    }
+
+
+@pytest.fixture
+def db(mock_db, monkeypatch):
+    mock_db.inbox = mock_db[stripe_events.INBOX]
+    monkeypatch.setattr(stripe_events, "db", mock_db)
+    monkeypatch.setattr(stripe_events, "invalidate_org_context", MagicMock())
+    return mock_db
+
+
+@pytest.mark.asyncio
+async def test_redelivered_events_are_recorded_once(db):
+    db.inbox.insert_one = AsyncMock(side_effect=[None, DuplicateKeyError("dup")])
+    event = _event("evt_1", "customer.subscription.created", 100)
+
+    assert await stripe_events.enqueue_event(event) is True
+    assert await stripe_events.enqueue_event(event) is False
+    stored = db.inbox.insert_one.call_args_list[0].args[0]
+    assert stored["_id"] == "evt_1" and stored["ordering_key"] == ORG_ID and stored["status"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_failure_holds_back_later_events_of_the_same_org(db, monkeypatch):
+    events = {
+        "evt_1": _event("evt_1", "customer.subscription.created", 100),
+        "evt_2": _event("evt_2", "customer.subscription.deleted", 200),
+        "evt_3": _event("evt_3", "customer.subscription.created", 150, org_id="other"),
+    }
+    db.inbox.update_many = AsyncMock()
+    db.inbox.update_one = AsyncMock()
+    db.inbox.distinct = AsyncMock(return_value=[])
+    cursor = MagicMock()
+    cursor.sort.return_value = cursor
+    cursor.limit.return_value = cursor
+    cursor.to_list = AsyncMock(return_value=[
+        {"_id": "evt_1", "ordering_key": ORG_ID},
+        {"_id": "evt_3", "ordering_key": "other"},
+        {"_id": "evt_2", "ordering_key": ORG_ID},
+    ])
+    db.inbox.find.return_value = cursor
+    db.inbox.find_one_and_update = AsyncMock(
+        side_effect=lambda query, *a, **k: {"_id": query["_id"], "type": "t", "attempts": 1, "event": events[query["_id"]]}
+    )
+    applied = []
+
+    async def apply(event):
+        if event["id"] == "evt_1":
+            raise RuntimeError("smtp down")
+        applied.append(event["id"])
+
+    monkeypatch.setattr(stripe_events, "apply_event", apply)
+
+    assert await stripe_events.process_pending_events() == 1
+    assert applied == ["evt_3"]
+    statuses = {c.args[0]["_id"]: c.args[1]["$set"]["status"] for c in db.inbox.update_one.call_args_list}
+    assert statuses == {"evt_1": "pending", "evt_3": "done"}
+
+
+@pytest.mark.asyncio
+async def test_stale_subscription_events_are_skipped(db, monkeypatch):
+    db.organizations.find_one_and_update = AsyncMock(return_value=None)
+    notify = AsyncMock()
+    monkeypatch.setattr(stripe_events, "_notify_once", notify)
+
+    await stripe_events.apply_event(_event("evt_old", "customer.subscription.created", 50))
+
+    query = db.organizations.find_one_and_update.call_args.args[0]
+    assert query["_id"] == ObjectId(ORG_ID)
+    assert {"stripe_event_created": {"$lte": 50}} in query["$or"]
+    notify.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_emails_are_sent_at_most_once(db, monkeypatch):
+    db.inbox.update_one = AsyncMock(return_value=MagicMock(modified_count=0))
+    db.users.find_one = AsyncMock()
+    send = MagicMock()
+    monkeypatch.setattr(stripe_events, "send_email", send)
+
+    await stripe_events._notify_once("evt_1", ORG_ID, "subscription_activated.html", "subject", {})
+
+    db.users.find_one.assert_not_called()
+    send.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_consumers_apply_each_event_once(memory_db, monkeypatch):
+    monkeypatch.setattr(stripe_events, "db", memory_db)
+    for n in range(1, 7):
+        await stripe_events.enqueue_event(_event(f"evt_{n}", "customer.subscription.created", n, org_id=f"org_{n}"))
+    applied = []
+
+    async def apply(event):
+        await asyncio.sleep(0)
+        applied.append(event["id"])
+
+    monkeypatch.setattr(stripe_events, "apply_event", apply)
+
+    counts = await asyncio.gather(stripe_events.process_pending_events(), stripe_events.process_pending_events())
+
+    assert sum(counts) == 6
+    assert sorted(applied) == [f"evt_{n}" for n in range(1, 7)]
+    inbox = memory_db[stripe_events.INBOX].docs.values()
+    assert {doc["status"] for doc in inbox} == {stripe_events.DONE}
+    assert {doc["attempts"] for doc in inbox} == {1}
+
+
+@pytest.mark.asyncio
+async def test_events_of_a_key_claimed_elsewhere_wait(memory_db, monkeypatch):
+    monkeypatch.setattr(stripe_events, "db", memory_db)
+    await stripe_events.enqueue_event(_event("evt_1", "customer.subscription.created", 100))
+    await stripe_events.enqueue_event(_event("evt_2", "customer.subscription.deleted", 200))
+    await stripe_events.enqueue_event(_event("evt_3", "customer.subscription.created", 150, org_id="other"))
+    await memory_db[stripe_events.INBOX].update_one(
+        {"_id": "evt_1"}, {"$set": {"status": stripe_events.PROCESSING, "claimed_at": datetime.utcnow()}}
+    )
+    applied = []
+
+    async def apply(event):
+        applied.append(event["id"])
+
+    monkeypatch.setattr(stripe_events, "apply_event", apply)
+
+    assert await stripe_events.process_pending_events() == 1
+    assert applied == ["evt_3"]
+
+
+@pytest.mark.asyncio
+async def test_an_older_invoice_event_does_not_overwrite_a_newer_one(memory_db, monkeypatch):
+    monkeypatch.setattr(invoices, "db", memory_db)
+
+    def invoice_event(event_id, created, status):
+        invoice = {"id": "in_1", "customer": "cus_1", "amount_paid": 1000, "status": status, "created": 100}
+        return {"id": event_id, "type": f"invoice.{status}", "created": created, "data": {"object": invoice}}
+
+    await stripe_events.apply_event(invoice_event("evt_paid", 300, "paid"))
+    await stripe_events.apply_event(invoice_event("evt_open", 200, "open"))
+
+    mirrored = memory_db[invoices.INVOICES].docs["in_1"]
+    assert mirrored["status"] == "paid" and mirrored["stripe_event_created"] == 300
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from app.services import usage_events
+from app.tasks import usage_rollup
+
+
+def _collections(**named):
+    database = MagicMock()
+    database.__getitem__.side_effect = named.__getitem__
+    return database
+
+
+@pytest.mark.asyncio
+async def test_record_usage_event_is_compact_and_never_raises(monkeypatch):
+    events = MagicMock()
+    events.insert_one = AsyncMock(side_effect=PyMongoError("down"))
+    monkeypatch.setattr(usage_events, "db", _collections(usage_events=events))
+
+    await usage_events.record_usage_event("u1", None, "asst_1", 12, 30, model="gpt-4o")
+
+    event = events.insert_one.call_args.args[0]
+    assert event["meta"] == {"user_id": "u1", "org_id": None, "assistant_id": "asst_1", "model": "gpt-4o"}
+    assert (event["tokens_in"], event["tokens_out"]) == (12, 30)
+    assert isinstance(event["ts"], datetime)
+
+
+@pytest.mark.asyncio
+async def test_daily_series_reads_buckets_and_fills_gaps():
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    rollups = MagicMock()
+    rollups.find.return_value.to_list = AsyncMock(return_value=[{"start": today, "tokens": 42}])
+    database = _collections(usage_rollups_daily=rollups)
+
+    series = await usage_events.get_daily_series("org", "o1", days=3, database=database)
+
+    assert [point["tokens"] for point in series] == [0, 0, 42]
+    assert series[-1]["date"] == today.strftime("%Y-%m-%d")
+    query = rollups.find.call_args.args[0]
+    assert query["scope"] == "org" and query["key"] == "o1"
+    assert query["start"]["$gte"] == today - timedelta(days=2)
+
+
+@pytest.mark.asyncio
+async def test_rollup_recomputes_only_touched_hours_and_days(monkeypatch):
+    watermark = datetime(2026, 3, 4, 10, 2)
+    now = datetime(2026, 3, 4, 10, 7)
+    events, hourly = MagicMock(), MagicMock()
+    for collection in (events, hourly):
+        collection.aggregate.return_value.to_list = AsyncMock(return_value=[])
+    database = _collections(usage_events=events, usage_rollups_hourly=hourly)
+    database.rollup_state.find_one = AsyncMock(return_value={"watermark": watermark})
+    database.rollup_state.update_one = AsyncMock()
+    monkeypatch.setattr(usage_rollup, "db", database)
+
+    await usage_rollup.rollup_usage(now=now)
+
+    hourly_pipeline = events.aggregate.call_args.args[0]
+    assert hourly_pipeline[0]["$match"]["ts"] == {"$gte": datetime(2026, 3, 4, 9), "$lt": now}
+    assert hourly_pipeline[-1]["$merge"]["whenMatched"] == "replace"
+    daily_pipeline = hourly.aggregate.call_args.args[0]
+    assert daily_pipeline[0]["$match"]["start"]["$gte"] == datetime(2026, 3, 4)
+    assert database.rollup_state.update_one.call_args.args[1] == {"$set": {"watermark": now}}
@@ -0,0 +1,125 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import jwt
+import pytest
+from bson import ObjectId
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.utils import auth, context
+from app.utils.auth import VerifiedTokenCache, create_access_token, decode_token, require_role, verify_token
+
+USER_ID = str(ObjectId())
+ORG_ID = ObjectId()
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(auth, "verified_tokens", VerifiedTokenCache(max_entries=2))
+    context._users.clear()
+    context._token_versions.clear()
+    users = MagicMock()
+    users.find_one = AsyncMock(return_value={"_id": ObjectId(USER_ID), "token_version": 3})
+    users.update_one = AsyncMock()
+    database = MagicMock()
+    database.users = users
+    monkeypatch.setattr(context, "db", database)
+    yield database
+    context._users.clear()
+    context._token_versions.clear()
+
+
+def _token(role="admin", version=3, **kwargs):
+    return create_access_token(USER_ID, role, "a@b.c", organization_id=ORG_ID, token_version=version, **kwargs)
+
+
+def test_decode_serves_repeat_tokens_from_cache(monkeypatch):
+    token = _token()
+    calls = []
+    real_decode = jwt.decode
+    monkeypatch.setattr(jwt, "decode", lambda *a, **kw: calls.append(1) or real_decode(*a, **kw))
+
+    first = decode_token(token)
+    second = decode_token(token)
+
+    assert len(calls) == 1
+    assert first == second
+    assert second["organization_id"] == str(ORG_ID) and second["agent_id"] is None
+
+
+def test_cache_ignores_payload_swapped_under_a_known_signature():
+    token = _token(role="member")
+    decode_token(token)
+    _, _, signature = token.rpartition(".")
+    forged = ".".join(_token(role="admin").split(".")[:2] + [signature])
+
+    with pytest.raises(HTTPException) as exc:
+        decode_token(forged)
+    assert exc.value.status_code == 401
+
+
+def test_cache_drops_expired_entries():
+    cache = VerifiedTokenCache(max_entries=2)
+    cache.put("h.p.sig", {"sub": USER_ID, "exp": 0})
+
+    assert cache.get("h.p.sig") is None
+
+
+@pytest.mark.asyncio
+async def test_token_version_lookup_is_cached(fresh_caches):
+    assert await verify_token(MagicMock(credentials=_token()))
+    assert await verify_token(MagicMock(credentials=_token(expires_minutes=5)))
+
+    assert fresh_caches.users.find_one.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_revoked_tokens_are_rejected(fresh_caches):
+    token = _token(version=2)
+
+    with pytest.raises(HTTPException) as exc:
+        await verify_token(MagicMock(credentials=token))
+    assert exc.value.detail == "Token revoked"
+
+    fresh_caches.users.find_one.return_value = None
+    context._token_versions.clear()
+    with pytest.raises(HTTPException):
+        await verify_token(MagicMock(credentials=_token()))
+
+
+@pytest.mark.asyncio
+async def test_revoke_user_tokens_bumps_version_and_evicts(fresh_caches):
+    await verify_token(MagicMock(credentials=_token()))
+
+    await context.revoke_user_tokens(USER_ID)
+
+    update = fresh_caches.users.update_one.await_args.args
+    assert update == ({"_id": ObjectId(USER_ID)}, {"$inc": {"token_version": 1}})
+    assert context._token_versions.get(USER_ID) == (False, None)
+
+
+def test_require_role_is_answered_from_claims(fresh_caches, monkeypatch):
+    get_cached_user = AsyncMock()
+    monkeypatch.setattr(auth, "get_cached_user", get_cached_user)
+    app = FastAPI()
+
+    @app.get("/admin-only")
+    async def admin_only(user_id: str = Depends(verify_token)):
+        await require_role(user_id, ["admin"])
+        return {"ok": True}
+
+    client = TestClient(app)
+    assert client.get("/admin-only", headers={"Authorization": f"Bearer {_token()}"}).status_code == 200
+    assert client.get("/admin-only", headers={"Authorization": f"Bearer {_token('member')}"}).status_code == 403
+    get_cached_user.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_require_role_falls_back_to_user_doc_for_legacy_tokens(monkeypatch):
+    legacy = jwt.encode({"sub": USER_ID, "role": "admin", "exp": 2**31}, auth.SECRET_KEY, algorithm="HS256")
+    monkeypatch.setattr(auth, "get_cached_user", AsyncMock(return_value={"role": "member"}))
+
+    user_id = await verify_token(MagicMock(credentials=legacy))
+    with pytest.raises(HTTPException) as exc:
+        await require_role(user_id, ["admin"])
+    assert exc.value.status_code == 403
@@ -0,0 +1,116 @@
+import copy
+from collections import Counter
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+
+from app.utils import context, quota
+from app.utils.context import load_user_context
+from app.utils.quota_periods import quota_used
+
+USER_ID = ObjectId()
+ORG_ID = ObjectId()
+AGENT_ID = ObjectId()
+
+
+class CountingDB:
+    """Fake Motor database that counts every collection operation."""
+
+    def __init__(self):
+        self.ops = Counter()
+        self.user = {
+            "_id": USER_ID, "email": "a@b.c", "role": "member", "tier": "free",
+            "organization_id": ORG_ID, "agent_id": str(AGENT_ID),
+            "quota": {"monthly_limit": 10000, "used": 0},
+        }
+        self.org = {"_id": ORG_ID, "name": "Org", "usage_quota": {"total_limit": 100000, "used": 0}}
+        self.assistant = {"_id": AGENT_ID, "openai_assistant_id": "asst_1"}
+        self.usage = {"user_id": str(USER_ID), "message_count_monthly": 0, "limits": {"tokens": 10000, "messages": 100}}
+        docs = {"users": self.user, "organizations": self.org, "assistants": self.assistant, "usage": self.usage}
+        for name, doc in docs.items():
+            setattr(self, name, self._collection(name, doc))
+
+    def _collection(self, name, doc):
+        collection = MagicMock()
+
+        def counted(op, result):
+            async def call(*args, **kwargs):
+                self.ops[f"{name}.{op}"] += 1
+                return copy.deepcopy(result)
+            return call
+
+        collection.find_one = counted("find_one", doc)
+        collection.update_one = counted("update_one", MagicMock())
+        collection.insert_one = counted("insert_one", MagicMock())
+
+        def aggregate(pipeline):
+            self.ops[f"{name}.aggregate"] += 1
+            joined = copy.deepcopy(dict(self.user, _organization=[self.org], _assistant=[self.assistant]))
+            return MagicMock(to_list=AsyncMock(return_value=[joined]))
+
+        collection.aggregate = aggregate
+        return collection
+
+    @property
+    def total(self):
+        return sum(self.ops.values())
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = CountingDB()
+    monkeypatch.setattr(context, "db", db)
+    monkeypatch.setattr(quota, "db", db)
+    monkeypatch.setattr(quota, "record_charge", AsyncMock())
+    for cache in (context._users, context._organizations, context._assistants):
+        cache.clear()
+    return db
+
+
+async def legacy_turn(db):
+    user = await db.users.find_one({"_id": USER_ID})
+    await db.assistants.find_one({"_id": AGENT_ID})
+    await db.organizations.find_one({"_id": user["organization_id"]})
+    await quota.enforce_quota_and_update(str(USER_ID), 10, send_warning=False)
+    await quota.enforce_quota_and_update(str(USER_ID), 50, send_warning=False)
+
+
+async def context_turn():
+    user, org, assistant = await load_user_context(str(USER_ID))
+    assert assistant["openai_assistant_id"] == "asst_1"
+    await quota.enforce_quota_and_update(str(USER_ID), 10, send_warning=False, user_profile=user, org_doc=org)
+    await quota.enforce_quota_and_update(str(USER_ID), 50, send_warning=False, user_profile=user, org_doc=org)
+    return user, org
+
+
+@pytest.mark.asyncio
+async def test_context_turn_needs_fewer_mongo_ops(fake_db):
+    await legacy_turn(fake_db)
+    legacy_ops = fake_db.total
+
+    fake_db.ops.clear()
+    user, org = await context_turn()
+
+    assert fake_db.ops["users.aggregate"] == 1
+    assert fake_db.ops["users.find_one"] == 0
+    assert fake_db.ops["organizations.find_one"] == 0
+    assert fake_db.ops["assistants.find_one"] == 0
+    assert fake_db.total <= legacy_ops - 6
+    # The second charge saw the first one's increment
+    assert quota_used(user["quota"]) == 60
+    assert quota_used(org["usage_quota"]) == 60
+
+
+@pytest.mark.asyncio
+async def test_cached_context_is_write_through_and_invalidated(fake_db):
+    await context_turn()
+    fake_db.ops.clear()
+
+    user, org, _ = await load_user_context(str(USER_ID))
+    assert fake_db.ops["users.aggregate"] == 0
+    assert quota_used(org["usage_quota"]) == 60
+
+    context.invalidate_user_context(USER_ID)
+    await load_user_context(str(USER_ID))
+    assert fake_db.ops["users.aggregate"] == 1
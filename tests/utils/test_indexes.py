@@ -0,0 +1,42 @@
+import os
+import uuid
+
+import pytest
+import pytest_asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import PyMongoError
+
+from app.utils.indexes import HOT_QUERIES, REQUIRED_INDEXES, ensure_indexes, find_collscans
+
+MONGODB_TEST_URI = os.getenv("MONGODB_TEST_URI", "mongodb://localhost:27017")
+
+
+def test_every_hot_query_has_a_declared_index():
+    for collection, query, _ in HOT_QUERIES:
+        leading_keys = {
+            next(iter(model.document["key"])) for model in REQUIRED_INDEXES.get(collection, [])
+        }
+        assert leading_keys & set(query), f"no index leads with a field of {collection}.find({query})"
+
+
+@pytest_asyncio.fixture
+async def scratch_db():
+    client = AsyncIOMotorClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=500)
+    try:
+        await client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip(f"no mongod reachable at {MONGODB_TEST_URI}")
+    name = f"test_indexes_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    await client.drop_database(name)
+    client.close()
+
+
+@pytest.mark.asyncio
+async def test_hot_queries_do_not_collscan(scratch_db):
+    await ensure_indexes(scratch_db)
+    for collection in {c for c, _, _ in HOT_QUERIES}:
+        await scratch_db[collection].insert_many([{"seed": i} for i in range(20)])
+
+    assert await find_collscans(scratch_db) == []
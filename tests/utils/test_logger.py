@@ -0,0 +1,51 @@
+import json
+import logging
+import queue
+
+from app.utils.logger import JsonFormatter, LazyQueueHandler, ModuleLevelFilter, SamplingFilter
+
+
+def _record(msg="hello %s", args=("world",), level=logging.INFO, module="assistant", lineno=1, **extra):
+    record = logging.LogRecord("quran_logger", level, f"/app/{module}.py", lineno, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_emits_message_and_extras():
+    line = JsonFormatter().format(_record(chat_id="c1", sample_every=10))
+    entry = json.loads(line)
+
+    assert entry["message"] == "hello world"
+    assert entry["level"] == "INFO" and entry["module"] == "assistant"
+    assert entry["chat_id"] == "c1"
+    assert "sample_every" not in entry and "args" not in entry
+
+
+def test_queue_handler_defers_formatting():
+    class Unformattable:
+        def __str__(self):
+            raise AssertionError("formatted on the calling thread")
+
+    q = queue.SimpleQueue()
+    LazyQueueHandler(q).emit(_record(args=(Unformattable(),)))
+
+    record = q.get_nowait()
+    assert record.msg == "hello %s" and isinstance(record.args[0], Unformattable)
+
+
+def test_sampling_keeps_one_in_n_per_call_site():
+    sampler = SamplingFilter()
+    kept = [sampler.filter(_record(sample_every=5)) for _ in range(10)]
+    other_site = sampler.filter(_record(sample_every=5, lineno=2))
+
+    assert kept.count(True) == 2 and kept[0]
+    assert other_site
+    assert all(sampler.filter(_record()) for _ in range(3))
+
+
+def test_module_levels():
+    levels = ModuleLevelFilter({"assistant": "warning"})
+
+    assert not levels.filter(_record(level=logging.INFO))
+    assert levels.filter(_record(level=logging.ERROR))
+    assert levels.filter(_record(level=logging.DEBUG, module="billing"))
@@ -0,0 +1,103 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.utils import quota_allocation
+
+ORG = ObjectId()
+ALICE, BOB = ObjectId(), ObjectId()
+
+
+def _database(users, reserved=True, user_writes_matched=None, allocated=None):
+    database = MagicMock()
+    cursor = MagicMock(to_list=AsyncMock(return_value=users))
+    database.users.find.return_value = cursor
+    matched = user_writes_matched or [1] * len(users)
+    database.users.update_one = AsyncMock(side_effect=[MagicMock(matched_count=m) for m in matched])
+    database.users.aggregate.return_value = MagicMock(to_list=AsyncMock(return_value=[{"total": 700}]))
+    database.organizations.count_documents = AsyncMock(return_value=int(allocated is not None))
+    seed = [MagicMock(matched_count=1)] if allocated is None else []
+    database.organizations.update_one = AsyncMock(
+        side_effect=seed + [MagicMock(matched_count=int(reserved)), MagicMock(matched_count=1)]
+    )
+    database.organizations.find_one = AsyncMock(
+        return_value={"usage_quota": {"total_limit": 1000, "allocated_total": allocated or 700}}
+    )
+    return database
+
+
+def _members():
+    return [
+        {"_id": ALICE, "email": "a@x", "quota": {"monthly_limit": 500}},
+        {"_id": BOB, "email": "b@x", "quota": {"monthly_limit": 200}},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_reserves_net_change_against_total_limit():
+    database = _database(_members())
+
+    users = await quota_allocation.allocate_user_quotas(ORG, {ALICE: 300, BOB: 600}, database=database)
+
+    seed, reserve = database.organizations.update_one.await_args_list
+    assert seed.args == ({"_id": ORG, quota_allocation.ALLOCATED: {"$exists": False}},
+                         {"$set": {quota_allocation.ALLOCATED: 700}})
+    query, update = reserve.args
+    assert query["$expr"]["$lte"][0] == {"$add": ["$usage_quota.allocated_total", 200]}
+    assert update == {"$inc": {quota_allocation.ALLOCATED: 200}}
+    writes = [c.args[0] for c in database.users.update_one.await_args_list]
+    assert writes == [{"_id": ALICE, "quota.monthly_limit": 500}, {"_id": BOB, "quota.monthly_limit": 200}]
+    assert [u["quota"]["monthly_limit"] for u in users] == [300, 600]
+
+
+@pytest.mark.asyncio
+async def test_over_allocation_is_rejected_without_touching_users():
+    database = _database(_members()[1:], reserved=False, allocated=700)
+
+    with pytest.raises(HTTPException) as exc:
+        await quota_allocation.allocate_user_quotas(ORG, {BOB: 600}, database=database)
+
+    assert exc.value.status_code == 400
+    database.users.aggregate.assert_not_called()
+    database.users.update_one.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_edit_rolls_back_only_the_writes_that_landed():
+    # Bob was concurrently set to 100 by someone else: only Alice is reverted
+    database = _database(_members(), user_writes_matched=[1, 0, 1], allocated=700)
+
+    with pytest.raises(HTTPException) as exc:
+        await quota_allocation.allocate_user_quotas(ORG, {ALICE: 100, BOB: 100}, database=database)
+
+    assert exc.value.status_code == 409
+    reverts = database.users.update_one.await_args_list[2:]
+    assert [c.args for c in reverts] == [
+        ({"_id": ALICE, "quota.monthly_limit": 100}, {"$set": {"quota.monthly_limit": 500}}),
+    ]
+    release = database.organizations.update_one.await_args_list[-1].args
+    assert release == ({"_id": ORG}, {"$inc": {quota_allocation.ALLOCATED: 500}})
+
+
+@pytest.mark.asyncio
+async def test_a_landed_write_edited_again_keeps_its_reservation():
+    database = _database(_members(), user_writes_matched=[1, 0, 0], allocated=700)
+
+    with pytest.raises(HTTPException):
+        await quota_allocation.allocate_user_quotas(ORG, {ALICE: 100, BOB: 100}, database=database)
+
+    # Alice's -400 stays applied; only Bob's -100 is released
+    release = database.organizations.update_one.await_args_list[-1].args
+    assert release == ({"_id": ORG}, {"$inc": {quota_allocation.ALLOCATED: 100}})
+
+
+@pytest.mark.asyncio
+async def test_users_outside_the_org_are_rejected():
+    database = _database(_members()[:1])
+
+    with pytest.raises(HTTPException) as exc:
+        await quota_allocation.allocate_user_quotas(ORG, {ALICE: 1, BOB: 1}, database=database)
+
+    assert exc.value.status_code == 400 and str(BOB) in exc.value.detail
@@ -0,0 +1,55 @@
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.utils import quota
+from app.utils.quota_periods import current_period, quota_field, quota_used, usage_counts, usage_field
+
+
+def test_previous_periods_read_as_zero():
+    quota_doc = {"monthly_limit": 100, "periods": {"2026-09": 80, "2026-10": 5}}
+
+    assert quota_used(quota_doc, "2026-10") == 5
+    assert quota_used(quota_doc, "2026-11") == 0
+    assert usage_counts({"periods": {"2026-09": {"tokens": 9, "messages": 2}}}, "2026-10") == (0, 0)
+    assert usage_counts({"periods": {"2026-10": {"tokens": 9}}}, "2026-10") == (9, 0)
+
+
+def test_flat_counters_are_read_until_compacted_while_reset_this_period():
+    assert quota_used({"used": 40, "reset_period": "2026-10"}, "2026-10") == 40
+    assert quota_used({"used": 40, "reset_date": datetime(2026, 10, 1)}, "2026-10") == 40
+    assert quota_used(None) == 0
+    usage = {"token_usage_monthly": 7, "message_count_monthly": 3, "last_reset": datetime(2026, 10, 1, 0, 5)}
+    assert usage_counts(usage, "2026-10") == (7, 3)
+
+
+def test_flat_counters_from_an_earlier_period_read_as_zero():
+    assert quota_used({"used": 40, "reset_period": "2026-09"}, "2026-10") == 0
+    assert quota_used({"used": 40, "reset_date": None}, "2026-10") == 0
+    assert usage_counts({"token_usage_monthly": 7, "last_reset": datetime(2026, 9, 30)}, "2026-10") == (0, 0)
+
+
+def test_field_paths():
+    assert quota_field("usage_quota", "2026-10") == "usage_quota.periods.2026-10"
+    assert usage_field("tokens", "2026-10") == "periods.2026-10.tokens"
+    assert len(current_period()) == 7
+
+
+@pytest.mark.asyncio
+async def test_first_charge_of_a_flat_doc_carries_its_usage_over():
+    collection = MagicMock()
+    collection.update_one = AsyncMock(return_value=MagicMock(matched_count=1))
+    field = quota_field("quota", "2026-10")
+
+    await quota._charge_period(collection, {"_id": 1}, "quota.periods", {field: 10}, seed={field: 40})
+
+    query, update = collection.update_one.await_args.args
+    assert query == {"_id": 1, "quota.periods": {"$exists": False}}
+    assert update == {"$set": {field: 50}}
+    assert collection.update_one.await_count == 1
+
+    # Another worker migrated it first: fall back to a plain increment
+    collection.update_one = AsyncMock(return_value=MagicMock(matched_count=0))
+    await quota._charge_period(collection, {"_id": 1}, "quota.periods", {field: 10}, seed={field: 40})
+    assert collection.update_one.await_args.args == ({"_id": 1}, {"$inc": {field: 10}})
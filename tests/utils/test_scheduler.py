@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from pymongo.errors import PyMongoError
+
+from app.utils import start_scheduler as scheduling
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    registry = {}
+    monkeypatch.setattr(scheduling, "JOBS", registry)
+    return registry
+
+
+def _database():
+    job_runs = MagicMock(insert_one=AsyncMock())
+    database = MagicMock()
+    database.__getitem__.side_effect = {"job_runs": job_runs}.__getitem__
+    return database, job_runs
+
+
+@pytest.mark.asyncio
+async def test_run_job_records_rows_and_duration(jobs):
+    jobs["rollup"] = scheduling.ScheduledJob(AsyncMock(return_value=12), "interval", {"minutes": 5})
+    database, job_runs = _database()
+
+    assert await scheduling.run_job("rollup", database=database) == 12
+
+    run = job_runs.insert_one.await_args.args[0]
+    assert run["job"] == "rollup" and run["rows"] == 12 and run["status"] == "ok"
+    assert run["duration_ms"] >= 0 and run["instance"] == scheduling.INSTANCE_ID
+
+
+@pytest.mark.asyncio
+async def test_run_job_records_failures_without_raising(jobs):
+    jobs["broken"] = scheduling.ScheduledJob(AsyncMock(side_effect=RuntimeError("boom")), "interval", {"minutes": 5})
+    database, job_runs = _database()
+
+    assert await scheduling.run_job("broken", database=database) is None
+
+    run = job_runs.insert_one.await_args.args[0]
+    assert run["status"] == "error" and run["error"] == "boom"
+
+
+@pytest.mark.asyncio
+async def test_sync_jobs_keeps_unchanged_jobs(jobs, monkeypatch):
+    monkeypatch.setattr(scheduling.settings, "SCHEDULER_JITTER_SECONDS", 0)
+    scheduler = AsyncIOScheduler()
+    scheduler.start(paused=True)
+    try:
+        jobs["kept"] = scheduling.ScheduledJob(AsyncMock(), "interval", {"minutes": 5})
+        jobs["changed"] = scheduling.ScheduledJob(AsyncMock(), "interval", {"minutes": 5})
+        scheduling.sync_jobs(scheduler)
+        scheduler.add_job(scheduling.run_job, "interval", minutes=1, args=["gone"], id="gone")
+        kept = scheduler.get_job("kept")
+
+        jobs["changed"] = scheduling.ScheduledJob(AsyncMock(), "cron", {"hour": 3})
+        scheduling.sync_jobs(scheduler)
+
+        assert {job.id for job in scheduler.get_jobs()} == {"kept", "changed"}
+        assert scheduler.get_job("kept").next_run_time == kept.next_run_time
+        assert str(scheduler.get_job("changed").trigger).startswith("cron")
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+@pytest.mark.asyncio
+async def test_saved_next_run_times_carry_over_to_a_new_leader(jobs, memory_db, monkeypatch):
+    monkeypatch.setattr(scheduling.settings, "SCHEDULER_JITTER_SECONDS", 0)
+    jobs["rollup"] = scheduling.ScheduledJob(AsyncMock(), "interval", {"minutes": 5})
+    jobs["nightly"] = scheduling.ScheduledJob(AsyncMock(), "cron", {"hour": 3})
+    old, new = AsyncIOScheduler(), AsyncIOScheduler()
+    old.start(paused=True)
+    new.start(paused=True)
+    try:
+        scheduling.sync_jobs(old)
+        due = datetime.now(timezone.utc) + timedelta(seconds=42)
+        old.get_job("rollup").modify(next_run_time=due)
+        await scheduling.save_next_run_times(old, database=memory_db)
+        memory_db[scheduling.JOB_STORE].docs["nightly"]["trigger"] = "cron[hour='4']"
+
+        scheduling.sync_jobs(new)
+        nightly = new.get_job("nightly").next_run_time
+        await scheduling.restore_next_run_times(new, database=memory_db)
+
+        assert new.get_job("rollup").next_run_time == due
+        assert new.get_job("nightly").next_run_time == nightly
+    finally:
+        old.shutdown(wait=False)
+        new.shutdown(wait=False)
+
+
+def test_jitter_is_scaled_to_the_interval(monkeypatch):
+    monkeypatch.setattr(scheduling.settings, "SCHEDULER_JITTER_SECONDS", 15)
+
+    assert scheduling.ScheduledJob(AsyncMock(), "interval", {"seconds": 10}).build_trigger().jitter == 1
+    assert scheduling.ScheduledJob(AsyncMock(), "interval", {"seconds": 5}).build_trigger().jitter is None
+    assert scheduling.ScheduledJob(AsyncMock(), "interval", {"minutes": 5}).build_trigger().jitter == 15
+    assert scheduling.ScheduledJob(AsyncMock(), "cron", {"hour": 3}).build_trigger().jitter == 15
+
+
+@pytest.mark.asyncio
+async def test_leader_resumes_on_acquire_and_pauses_on_loss(jobs, monkeypatch):
+    acquire = AsyncMock(return_value=True)
+    monkeypatch.setattr(scheduling, "acquire_lock", acquire)
+    restore, save = AsyncMock(), AsyncMock()
+    monkeypatch.setattr(scheduling, "restore_next_run_times", restore)
+    monkeypatch.setattr(scheduling, "save_next_run_times", save)
+    scheduler = MagicMock()
+    scheduler.get_jobs.return_value = []
+    election = scheduling.LeaderElection(scheduler, database=MagicMock())
+
+    await election.step()
+    await election.step()
+    assert election.is_leader
+    scheduler.resume.assert_called_once()
+    restore.assert_awaited_once()
+    save.assert_awaited_once()
+
+    acquire.side_effect = PyMongoError("down")
+    await election.step()
+    assert not election.is_leader
+    scheduler.pause.assert_called_once()
+
+    acquire.side_effect = None
+    acquire.return_value = False
+    await election.step()
+    scheduler.pause.assert_called_once()
+    assert scheduler.resume.call_count == 1
@@ -0,0 +1,41 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.utils import title as title_utils
+from app.utils.title import generate_chat_title_async, heuristic_title, start_title_task
+
+
+def test_heuristic_title_uses_first_words():
+    assert heuristic_title("What is the nisab threshold for zakat on gold?", max_words=4) == "What is the nisab…"
+    assert heuristic_title("Hello there!", max_words=4) == "Hello there"
+    assert heuristic_title("   ") == "New Chat"
+
+
+@pytest.mark.asyncio
+async def test_slow_model_falls_back_to_heuristic():
+    async def slow(**kwargs):
+        await asyncio.sleep(1)
+
+    with patch.object(title_utils.async_client.chat.completions, "create", side_effect=slow):
+        title = await generate_chat_title_async("How do I reset my password today please", timeout=0.01)
+
+    assert title == heuristic_title("How do I reset my password today please")
+
+
+@pytest.mark.asyncio
+async def test_title_task_only_runs_for_placeholder_titles(monkeypatch):
+    db = MagicMock()
+    db.chats.update_one = AsyncMock()
+    monkeypatch.setattr(title_utils, "db", db)
+    response = MagicMock()
+    response.choices = [MagicMock(message=MagicMock(content='"Password Reset"'))]
+
+    with patch.object(title_utils.async_client.chat.completions, "create", new=AsyncMock(return_value=response)):
+        assert start_title_task({"_id": "65f000000000000000000001", "title": "My chat"}, "q") is None
+        task = start_title_task({"_id": "65f000000000000000000001", "title": "New Chat"}, "q")
+        assert await task == "Password Reset"
+
+    update_filter = db.chats.update_one.call_args.args[0]
+    assert update_filter["title"] == {"$in": title_utils.PLACEHOLDER_TITLES}